@@ -15,19 +15,23 @@ admin = Admin(name='Churn Analytics', template_mode='bootstrap3')
 csrf = CSRFProtect()
 celery = None  # Initialize celery as None
 
+def make_local_queue(app):
+    """Run tasks on a local thread pool with a SQLite-backed queue instead of Celery."""
+    from .utils.local_tasks import LocalTaskQueue
+    queue = LocalTaskQueue(
+        app,
+        db_path=app.config['LOCAL_TASK_DB'],
+        workers=app.config['LOCAL_TASK_WORKERS'],
+        result_ttl=app.config['LOCAL_TASK_RESULT_TTL']
+    )
+    # Resume queued tasks once the app serves requests (not in CLI commands)
+    app.before_request(queue.start)
+    return queue
+
 def make_celery(app):
     if not app.config.get('USE_CELERY', False):
-        print("Celery is disabled in configuration")
-        class DummyCelery:
-            def task(self, *args, **kwargs):
-                def decorator(f):
-                    def wrapper(*args, **kwargs):
-                        print("Warning: Celery is disabled. Running task synchronously.")
-                        return f(*args, **kwargs)
-                    wrapper.delay = lambda *args, **kwargs: f(*args, **kwargs)  # Fix the delay method
-                    return wrapper
-                return decorator
-        return DummyCelery()
+        print("Celery is disabled in configuration, using the local task queue")
+        return make_local_queue(app)
 
     try:
         # Test Redis connection
@@ -61,23 +65,17 @@ def make_celery(app):
         return celery
     except Exception as e:
         print(f"Warning: Celery initialization failed: {str(e)}")
-        print("Falling back to synchronous processing")
-        # Return a dummy Celery instance that will fail gracefully
-        class DummyCelery:
-            def task(self, *args, **kwargs):
-                def decorator(f):
-                    def wrapper(*args, **kwargs):
-                        print("Warning: Celery is not available. Running task synchronously.")
-                        return f(*args, **kwargs)
-                    wrapper.delay = lambda *args, **kwargs: f(*args, **kwargs)  # Fix the delay method
-                    return wrapper
-                return decorator
-        return DummyCelery()
+        print("Falling back to the local task queue")
+        return make_local_queue(app)
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # orjson-backed JSON when available; both providers handle NumPy values
+    from .utils.json_provider import make_json_provider
+    app.json = make_json_provider(app, app.config['JSON_BACKEND'])
+
     # Initialize extensions
     db.init_app(app)
     login.init_app(app)
@@ -90,11 +88,69 @@ def create_app(config_class=Config):
     celery = make_celery(app)
     app.celery = celery
 
+    # Point the model registry at the configured artifacts
+    from .utils.ml_models import model_registry
+    model_registry.configure(
+        model_path=app.config['MODEL_PATH'],
+        scaler_path=app.config['SCALER_PATH'],
+        check_interval=app.config['MODEL_RELOAD_INTERVAL']
+    )
+
+    # Risk factor and segment rules, reloaded when the rule file changes
+    from .utils.risk_rules import risk_rules
+    risk_rules.configure(app.config['RISK_RULES_PATH'], check_interval=app.config['MODEL_RELOAD_INTERVAL'])
+
+    # Shared caches, invalidated when a user's customers change
+    from .utils.cache import init_caches
+    from .utils.events import register_customer_events
+    from .utils.aggregates import register_aggregate_events
+    init_caches(app)
+    register_customer_events()
+    register_aggregate_events()
+
+    # Columnar customer snapshots for analytics, refreshed incrementally
+    from .utils.customer_snapshot import snapshot_store
+    snapshot_store.configure(maxsize=app.config['ANALYTICS_SNAPSHOT_MAX_USERS'])
+
+    # Buffered activity log writes
+    from .utils.activity_log import activity_buffer
+    activity_buffer.configure(
+        app,
+        flush_size=app.config['ACTIVITY_FLUSH_SIZE'],
+        flush_interval=app.config['ACTIVITY_FLUSH_INTERVAL']
+    )
+
     # Ensure upload directory exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
     # Register blueprints
-    from .routes import main as main_blueprint
+    from .routes import (main as main_blueprint, refresh_trend_snapshots, rescore_stale_customers,
+                         compact_activity_log, prune_trend_data)
     app.register_blueprint(main_blueprint)
 
+    # Periodic jobs, run by `celery beat` when Celery is available
+    if hasattr(celery, 'conf'):
+        celery.conf.beat_schedule = {
+            'refresh-trend-snapshots': {
+                'task': refresh_trend_snapshots.name,
+                'schedule': app.config['TRENDS_REFRESH_INTERVAL']
+            },
+            'rescore-stale-customers': {
+                'task': rescore_stale_customers.name,
+                'schedule': app.config['RESCORE_INTERVAL']
+            },
+            'compact-activity-log': {
+                'task': compact_activity_log.name,
+                'schedule': app.config['ACTIVITY_COMPACT_INTERVAL']
+            },
+            'prune-trend-data': {
+                'task': prune_trend_data.name,
+                'schedule': app.config['TREND_PRUNE_INTERVAL']
+            }
+        }
+
+    # Register CLI commands
+    from .commands import register_commands
+    register_commands(app)
+
     return app
\ No newline at end of file
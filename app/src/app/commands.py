@@ -0,0 +1,115 @@
+import click
+from flask import current_app
+
+def register_commands(app):
+    """Attach the application's maintenance commands to `flask`."""
+
+    @app.cli.command('refresh-trends')
+    @click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s snapshot.')
+    @click.option('--force', is_flag=True, help='Rebuild even if the snapshot is still fresh.')
+    def refresh_trends(user_id, force):
+        """Rebuild stale trend snapshots."""
+        from .utils.trends import build_trend_snapshot, refresh_stale_snapshots
+
+        if user_id is not None:
+            snapshot = build_trend_snapshot(user_id)
+            click.echo(f'Snapshot for user {user_id}: {snapshot.date if snapshot else "no scored customers"}')
+            return
+
+        max_age = 0 if force else current_app.config['TRENDS_SNAPSHOT_MAX_AGE']
+        refreshed = refresh_stale_snapshots(max_age)
+        click.echo(f'Rebuilt {refreshed} trend snapshot(s)')
+
+    @app.cli.command('prune-trends')
+    def prune_trends():
+        """Apply the trend metric and snapshot retention policy."""
+        from .utils.trend_metrics import prune_trend_metrics, prune_trend_snapshots, retention_from_config
+
+        deleted = prune_trend_metrics(retention_from_config(current_app.config))
+        snapshots = prune_trend_snapshots(current_app.config['TREND_SNAPSHOT_RETENTION_DAYS'])
+        click.echo('Deleted ' + ', '.join(f'{count} {resolution}' for resolution, count in deleted.items())
+                   + f' metric bucket(s) and {snapshots} trend snapshot(s)')
+
+    @app.cli.command('backfill-trend-metrics')
+    @click.option('--user-id', type=int, default=None, help='Only backfill this user\'s metrics.')
+    def backfill_trend_metrics_command(user_id):
+        """Record the headline metrics of existing trend snapshots as TrendMetric samples."""
+        from .utils.trend_metrics import backfill_trend_metrics
+
+        click.echo(f'Backfilled {backfill_trend_metrics(user_id)} trend snapshot(s)')
+
+    @app.cli.command('rescore')
+    @click.option('--user-id', type=int, default=None, help='Only rescore this user\'s customers.')
+    @click.option('--batch-size', type=int, default=None, help='Customers scored per batch.')
+    @click.option('--only-missing', is_flag=True, help='Skip customers scored by an older model.')
+    def rescore(user_id, batch_size, only_missing):
+        """Score unscored and stale-model customers."""
+        from .utils.rescoring import rescore_customers
+
+        stats = rescore_customers(
+            user_id=user_id,
+            batch_size=batch_size or current_app.config['RESCORE_BATCH_SIZE'],
+            only_missing=only_missing
+        )
+        click.echo(f'Rescored {stats["rescored"]} customer(s) with model {stats["model_version"]} '
+                   f'({stats["failed"]} failed, {stats["rows_per_sec"]:.0f} rows/s)')
+
+    @app.cli.command('predict')
+    @click.option('--user-id', type=int, default=None, help='Only predict this user\'s customers.')
+    @click.option('--batch-size', type=int, default=None, help='Customers predicted per batch.')
+    @click.option('--typed-features/--json-features', default=None,
+                  help='Store history features in typed columns or as JSON (default: HISTORY_TYPED_FEATURES).')
+    def predict(user_id, batch_size, typed_features):
+        """Predict churn, risk factors and segments for every customer and record history."""
+        from .utils.bulk_prediction import predict_customers
+
+        if typed_features is None:
+            typed_features = current_app.config['HISTORY_TYPED_FEATURES']
+        stats = predict_customers(
+            user_id=user_id,
+            batch_size=batch_size or current_app.config['RESCORE_BATCH_SIZE'],
+            typed_features=typed_features
+        )
+        click.echo(f'Predicted {stats["predicted"]} customer(s) with model {stats["model_version"]} '
+                   f'({stats["failed"]} failed, {stats["rows_per_sec"]:.0f} rows/s)')
+
+    @app.cli.command('rebuild-aggregates')
+    @click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s aggregates.')
+    def rebuild_aggregates(user_id):
+        """Recompute the per-user churn aggregates from the customer table."""
+        from .utils.aggregates import rebuild_customer_aggregates
+
+        written = rebuild_customer_aggregates(user_id)
+        click.echo(f'Wrote {written} aggregate row(s)')
+
+    @app.cli.command('check-query-plans')
+    @click.option('--user-id', type=int, default=1, help='User id the checked queries filter on.')
+    @click.option('--verbose', is_flag=True, help='Print every plan, not just failing ones.')
+    def check_query_plans_command(user_id, verbose):
+        """Check that the hot customer queries are served by indexes."""
+        from .utils.query_plans import check_query_plans
+
+        results = check_query_plans(user_id)
+        for result in results:
+            status = 'ok' if result['ok'] else 'NO INDEX'
+            click.echo(f'{status:>8}  {result["name"]} ({result["index"] or "-"})')
+            if verbose or not result['ok']:
+                for line in result['plan']:
+                    click.echo(f'          {line}')
+        failed = sum(1 for result in results if not result['ok'])
+        if failed:
+            raise click.ClickException(f'{failed} of {len(results)} queries are not index-backed')
+
+    @app.cli.command('compact-activity')
+    @click.option('--compact-after-days', type=int, default=None, help='Collapse events older than this per day.')
+    @click.option('--retention-days', type=int, default=None, help='Delete events older than this.')
+    def compact_activity_command(compact_after_days, retention_days):
+        """Apply the activity log retention and compaction policy."""
+        from .utils.activity_log import compact_activity
+
+        stats = compact_activity(
+            compact_after_days=compact_after_days or current_app.config['ACTIVITY_COMPACT_AFTER_DAYS'],
+            retention_days=retention_days or current_app.config['ACTIVITY_RETENTION_DAYS']
+        )
+        click.echo(f'Purged {stats["purged"]} event(s); compacted {stats["compacted"]} event(s) '
+                   f'into {stats["summaries"]} row(s)')
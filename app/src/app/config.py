@@ -15,6 +15,31 @@ class Config:
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     USE_REDIS = os.environ.get('USE_REDIS', 'true').lower() == 'true'
     
+    # Cache configuration (Redis-backed when USE_REDIS is on, in-process otherwise)
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', '30'))  # seconds
+    ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', '3600'))  # seconds
+    ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', '512'))
+    # Without Redis, versions are per process and also check the customer table, so
+    # writes from other workers still invalidate cached analyses and snapshots
+    DATA_VERSION_TTL = int(os.environ.get('DATA_VERSION_TTL', '86400'))  # seconds
+    SERIES_CACHE_TTL = int(os.environ.get('SERIES_CACHE_TTL', '600'))  # seconds a serialized series body is kept
+    SERIES_CACHE_MAX_ENTRIES = int(os.environ.get('SERIES_CACHE_MAX_ENTRIES', '512'))
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')  # 'orjson', 'json' or 'auto' (orjson when installed)
+    ANALYTICS_SNAPSHOT_MAX_USERS = int(os.environ.get('ANALYTICS_SNAPSHOT_MAX_USERS', '32'))  # columnar snapshots kept per process
+    
+    # Trend snapshots: served while younger than the max age, rebuilt in the background
+    TRENDS_SNAPSHOT_MAX_AGE = int(os.environ.get('TRENDS_SNAPSHOT_MAX_AGE', '900'))  # seconds
+    TRENDS_REFRESH_INTERVAL = int(os.environ.get('TRENDS_REFRESH_INTERVAL', '300'))  # seconds between scheduled refreshes
+    TREND_HOURLY_RETENTION_DAYS = int(os.environ.get('TREND_HOURLY_RETENTION_DAYS', '14'))  # hourly metric buckets kept
+    TREND_DAILY_RETENTION_DAYS = int(os.environ.get('TREND_DAILY_RETENTION_DAYS', '400'))  # daily metric buckets kept
+    TREND_WEEKLY_RETENTION_DAYS = int(os.environ.get('TREND_WEEKLY_RETENTION_DAYS', '0'))  # weekly buckets kept, 0 = forever
+    TREND_SNAPSHOT_RETENTION_DAYS = int(os.environ.get('TREND_SNAPSHOT_RETENTION_DAYS', '30'))  # older ChurnTrend rows are deleted
+    TREND_PRUNE_INTERVAL = int(os.environ.get('TREND_PRUNE_INTERVAL', '86400'))  # seconds between retention runs
+    # Upper bounds of the low/medium usage (GB) and new/medium subscription (months) segments
+    SEGMENT_USAGE_THRESHOLDS = tuple(float(v) for v in os.environ.get('SEGMENT_USAGE_THRESHOLDS', '50,200').split(','))
+    SEGMENT_SUBSCRIPTION_THRESHOLDS = tuple(float(v) for v in os.environ.get('SEGMENT_SUBSCRIPTION_THRESHOLDS', '6,24').split(','))
+    
     # Celery configuration
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or 'redis://localhost:6379/0'
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or 'redis://localhost:6379/0'
@@ -24,10 +49,36 @@ class Config:
     CELERY_TIMEZONE = 'UTC'
     USE_CELERY = os.environ.get('USE_CELERY', 'true').lower() == 'true'
     
+    # Local task queue, used when Celery is disabled or its broker is unreachable
+    LOCAL_TASK_DB = os.environ.get('LOCAL_TASK_DB') or os.path.join(basedir, '../../local_tasks.db')
+    LOCAL_TASK_WORKERS = int(os.environ.get('LOCAL_TASK_WORKERS', '2'))  # 0 runs tasks inline in the caller
+    LOCAL_TASK_RESULT_TTL = int(os.environ.get('LOCAL_TASK_RESULT_TTL', '86400'))  # seconds finished tasks are kept
+    
     # File upload settings
     UPLOAD_FOLDER = os.path.join(basedir, '../../uploads')
     ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))  # rows per bulk write/commit
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '10000'))  # rows read per streamed chunk
+    IMPORT_PARALLEL_MIN_ROWS = int(os.environ.get('IMPORT_PARALLEL_MIN_ROWS', '100000'))  # larger files fan out across workers
+    IMPORT_PARALLEL_CHUNK_ROWS = int(os.environ.get('IMPORT_PARALLEL_CHUNK_ROWS', '50000'))  # rows per parallel chunk task
+    PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL', '2.0'))  # min seconds between job progress writes
+    RESCORE_BATCH_SIZE = int(os.environ.get('RESCORE_BATCH_SIZE', '5000'))  # customers scored per batch/commit
+    RESCORE_INTERVAL = int(os.environ.get('RESCORE_INTERVAL', '3600'))  # seconds between scheduled rescoring runs
+    HISTORY_TYPED_FEATURES = os.environ.get('HISTORY_TYPED_FEATURES', 'false').lower() == 'true'  # typed history columns instead of features JSON
+    
+    # Activity log: buffered writes plus retention/compaction
+    ACTIVITY_FLUSH_SIZE = int(os.environ.get('ACTIVITY_FLUSH_SIZE', '100'))  # buffered events per INSERT
+    ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '0.5'))  # max seconds an event stays buffered
+    ACTIVITY_COMPACT_AFTER_DAYS = int(os.environ.get('ACTIVITY_COMPACT_AFTER_DAYS', '30'))  # older events collapse per day
+    ACTIVITY_RETENTION_DAYS = int(os.environ.get('ACTIVITY_RETENTION_DAYS', '365'))  # older events are deleted
+    ACTIVITY_COMPACT_INTERVAL = int(os.environ.get('ACTIVITY_COMPACT_INTERVAL', '86400'))  # seconds between compaction runs
+    
+    # Churn model artifacts (reloaded automatically when they change on disk)
+    MODEL_PATH = os.environ.get('MODEL_PATH') or os.path.join(basedir, '../models/churn_model.pkl')
+    SCALER_PATH = os.environ.get('SCALER_PATH') or os.path.join(basedir, '../models/scaler.pkl')
+    MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', '1.0'))  # seconds between mtime checks
+    RISK_RULES_PATH = os.environ.get('RISK_RULES_PATH')  # JSON risk/segment rules; built-in defaults if unset
     
     # Flask-Admin settings
     FLASK_ADMIN_SWATCH = 'cerulean'
@@ -25,7 +25,7 @@ class User(UserMixin, db.Model):
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    customer_id = db.Column(db.String(50), unique=True, nullable=False)
+    customer_id = db.Column(db.String(50), nullable=False)  # Unique per user, see __table_args__
     name = db.Column(db.String(100), nullable=False)
     age = db.Column(db.Integer)
     gender = db.Column(db.String(10))
@@ -37,29 +37,85 @@ class Customer(db.Model):
     # Churn analysis fields
     churn_score = db.Column(db.Float)
     churn_prediction = db.Column(db.Boolean)
+    model_version = db.Column(db.String(64))  # Version of the model that produced churn_score
     last_prediction_date = db.Column(db.DateTime)
-    risk_factors = db.Column(db.JSON)  # Store identified risk factors
+    risk_factors = db.Column(db.JSON)  # Store identified risk factors (legacy, see risk_flags)
+    risk_flags = db.Column(db.Integer)  # Bitmask of risk rules, see utils.risk_rules
     customer_segment = db.Column(db.String(50))  # High-value, Medium-value, Low-value
     activities = db.relationship('CustomerActivity', backref='customer', lazy=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'customer_id', name='uq_customer_user_customer_id'),
+        # Plain user_id filters and the (user_id, id) keyset listing
+        db.Index('ix_customer_user_id', 'user_id', 'id'),
+        db.Index('ix_customer_user_churn_score', 'user_id', 'churn_score'),
+        db.Index('ix_customer_user_location', 'user_id', 'location'),
+        db.Index('ix_customer_user_updated_at', 'user_id', 'updated_at'),
+    )
+
+    def risk_factor_details(self):
+        """Risk factors (factor, description, severity), from risk_flags or the legacy JSON."""
+        if self.risk_flags is None:
+            return self.risk_factors or []
+        from .utils.risk_rules import risk_rules
+        return risk_rules.get().describe(self.risk_flags)
+
 class CustomerActivity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'))  # NULL once the customer is deleted
     activity_type = db.Column(db.String(50), nullable=False)  # e.g., 'update', 'prediction', 'interaction'
     description = db.Column(db.String(255), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     activity_metadata = db.Column(db.JSON)  # Store additional data as JSON
+    event_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # >1 for compacted rows
+
+    __table_args__ = (
+        db.Index('ix_customer_activity_timestamp', 'timestamp'),
+        db.Index('ix_customer_activity_customer_timestamp', 'customer_id', 'timestamp'),
+        db.Index('ix_customer_activity_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+# Customer attributes recorded with every prediction
+HISTORY_FEATURES = ('age', 'gender', 'location', 'subscription_length_months', 'monthly_bill', 'total_usage_gb')
 
 class CustomerHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'))  # NULL once the customer is deleted
     churn_score = db.Column(db.Float)
     prediction = db.Column(db.Boolean)
     features = db.Column(db.JSON)  # Store the features used for prediction
-    risk_factors = db.Column(db.JSON)  # Store identified risk factors at this point
+    risk_factors = db.Column(db.JSON)  # Store identified risk factors at this point (legacy, see risk_flags)
+    risk_flags = db.Column(db.Integer)  # Bitmask of risk rules at this point
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Typed copies of the features, written instead of `features` when
+    # HISTORY_TYPED_FEATURES is set
+    age = db.Column(db.Integer)
+    gender = db.Column(db.String(10))
+    location = db.Column(db.String(100))
+    subscription_length_months = db.Column(db.Integer)
+    monthly_bill = db.Column(db.Float)
+    total_usage_gb = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index('ix_customer_history_customer_created_at', 'customer_id', 'created_at'),
+    )
+
+    def feature_values(self):
+        """The features used for the prediction, from whichever layout the row was written in."""
+        if self.features is not None:
+            return self.features
+        return {name: getattr(self, name) for name in HISTORY_FEATURES}
+
+    def risk_factor_details(self):
+        """Risk factors (factor, description, severity), from risk_flags or the legacy JSON."""
+        if self.risk_flags is None:
+            return self.risk_factors or []
+        from .utils.risk_rules import risk_rules
+        return risk_rules.get().describe(self.risk_flags)
 
 class ChurnAnalysis(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -90,9 +146,33 @@ class ChurnTrend(db.Model):
     factor_importance = db.Column(db.JSON, nullable=True)
     factor_changes = db.Column(db.JSON, nullable=True)
     
+    __table_args__ = (
+        db.Index('ix_churn_trend_user_date', 'user_id', 'date'),
+    )
+
     def __repr__(self):
         return f'<ChurnTrend {self.date}>'
 
+class TrendMetric(db.Model):
+    """
+    One bucket of a scalar trend metric. Samples are folded into the hour,
+    day and week buckets they fall in, so any range is read pre-aggregated.
+    """
+    # Resolution leads the key so retention deletes are a prefix range scan too
+    resolution = db.Column(db.String(10), primary_key=True)  # 'hour', 'day', 'week'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    metric = db.Column(db.String(150), primary_key=True)  # e.g. 'churn_rate', 'segment_churn_rate:High-value'
+    bucket = db.Column(db.DateTime, primary_key=True)  # Start of the hour/day/week
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.Float, nullable=False, default=0.0)
+    value_min = db.Column(db.Float)
+    value_max = db.Column(db.Float)
+    value_last = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TrendMetric {self.metric} {self.resolution} {self.bucket}>'
+
 class ChurnPrediction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -105,6 +185,10 @@ class ChurnPrediction(db.Model):
     age_group_predictions = db.Column(db.JSON)  # Predictions for each age group
     key_factors = db.Column(db.JSON)  # Key factors influencing the prediction
 
+    __table_args__ = (
+        db.Index('ix_churn_prediction_user_date', 'user_id', 'prediction_date'),
+    )
+
 class Subscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -125,6 +209,36 @@ class BatchJob(db.Model):
     completed_at = db.Column(db.DateTime)
     error_message = db.Column(db.Text)
     result_data = db.Column(db.JSON)  # Store any results or metadata
+    checkpoint_offset = db.Column(db.Integer, default=0)  # Data rows committed so far; imports resume from here
+
+    __table_args__ = (
+        db.Index('ix_batch_job_user_created_at', 'user_id', 'created_at'),
+    )
+    
+    # Progress reporting
+    started_at = db.Column(db.DateTime)
+    rows_total = db.Column(db.Integer)
+    rows_processed = db.Column(db.Integer, default=0)
+    rows_failed = db.Column(db.Integer, default=0)
+    rows_per_sec = db.Column(db.Float)
+    progress_updated_at = db.Column(db.DateTime)
+
+class CustomerAggregate(db.Model):
+    """
+    Running churn totals for one user's customers, overall ('total') or per
+    'segment'/'location' value (NULL values use an empty group_key).
+    Maintained incrementally by utils/aggregates.py.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)  # 'total', 'segment', 'location'
+    group_key = db.Column(db.String(100), primary_key=True, default='')
+    customers = db.Column(db.Integer, nullable=False, default=0)
+    scored = db.Column(db.Integer, nullable=False, default=0)  # Customers with a churn score
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    high_risk = db.Column(db.Integer, nullable=False, default=0)  # churn_score > 0.7
+    medium_risk = db.Column(db.Integer, nullable=False, default=0)  # 0.4 < churn_score <= 0.7
+    churned = db.Column(db.Integer, nullable=False, default=0)  # churn_prediction is true
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 @login.user_loader
 def load_user(user_id):
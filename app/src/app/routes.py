@@ -1,10 +1,34 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, abort, session
 from flask_login import login_required, current_user, login_user, logout_user
 from . import db, celery
-from .models import User, Customer, ChurnPrediction, ChurnTrend, BatchJob, CustomerActivity
+from celery import chord
+from .models import User, Customer, ChurnAnalysis, BatchJob, CustomerActivity, CustomerHistory
 from .utils.data_processing import analyze_data, generate_insights
-from .utils.ml_models import predict_churn, analyze_segments, analyze_locations, predict_future_churn, analyze_key_factors, predict_factor_changes
+from .utils.ml_models import score_batch, customer_features
+from .utils.churn_analysis import analyze_customer_base
+from .utils.customer_snapshot import get_customer_snapshot
 from .utils.visualization import generate_chart_data
+from .utils.customer_import import (COLUMN_MAPPINGS, normalize_columns, missing_required_columns,
+                                   clean_customer_frame, file_age_median, bulk_upsert_customers,
+                                   fetch_customer_ids, iter_file_chunks, count_file_rows, plan_row_ranges,
+                                   iter_row_range)
+from .utils.progress import JobProgress, SharedJobProgress, job_progress
+from .utils.dashboard import get_dashboard_stats
+from .utils.aggregates import get_churn_stats
+from .utils.cache import caches, cache_stats
+from .utils.series import (TREND_SERIES, PREDICTION_SERIES, parse_series_args, query_series, series_version,
+                           parse_metric_args)
+from .utils.http_cache import make_etag, cached_json_response
+from .utils.trend_metrics import (query_metric_series, metrics_version, list_metrics, retention_from_config,
+                                  prune_trend_metrics, prune_trend_snapshots)
+from .utils.customer_listing import (parse_listing_args, list_customers, listing_filter_choices, customer_to_dict,
+                                     iter_customers)
+from .utils.json_provider import stream_json_array
+from .utils.dynamic_analysis import get_dynamic_analysis, empty_analysis
+from .utils.rescoring import rescore_customers, count_customers_to_rescore
+from .utils.activity_log import (log_activity, activity_buffer, recent_activity, customer_activity,
+                                 compact_activity, CUSTOMER_ACTIVITY_LIMIT)
+from .utils.trends import latest_trend_snapshot, is_snapshot_stale, build_trend_snapshot, refresh_stale_snapshots
 from datetime import datetime, timedelta
 import pandas as pd
 import os
@@ -26,61 +50,35 @@ def index():
 @main.route('/dashboard')
 @login_required
 def dashboard():
-    # Get customer statistics
-    total_customers = Customer.query.count()
-    high_risk_customers = Customer.query.filter(Customer.churn_score > 0.7).count()
-    medium_risk_customers = Customer.query.filter(Customer.churn_score > 0.4, Customer.churn_score <= 0.7).count()
-    low_risk_customers = Customer.query.filter(Customer.churn_score <= 0.4).count()
+    # Get customer statistics for the current user (cached, one query on a miss)
+    stats = get_dashboard_stats(current_user.id)
     
-    stats = {
-        'total_customers': total_customers,
-        'high_risk_customers': high_risk_customers,
-        'medium_risk_customers': medium_risk_customers,
-        'low_risk_customers': low_risk_customers
-    }
-    
-    # Get recent activity (last 5 customer updates)
-    recent_activity = CustomerActivity.query.order_by(CustomerActivity.timestamp.desc()).limit(5).all()
+    # Get recent activity (the user's last 5 customer events)
+    activity = recent_activity(current_user.id, limit=5)
     
     return render_template('dashboard.html',
                          stats=stats,
-                         recent_activity=recent_activity)
+                         recent_activity=activity)
 
 @main.route('/customers')
 @login_required
 def customers():
-    # Get all customers for the current user from database
-    customers = Customer.query.filter_by(user_id=current_user.id).all()
-    
-    # Calculate churn scores for customers that don't have one
-    for customer in customers:
-        if customer.churn_score is None:
-            # Calculate churn score based on customer data, using 0 as default for null age
-            churn_score = predict_churn({
-                'Monthly_Bill': customer.monthly_bill,
-                'Total_Usage_GB': customer.total_usage_gb,
-                'Subscription_Length_Months': customer.subscription_length_months,
-                'Age': customer.age if customer.age is not None else 0  # Handle null age
-            })
-            customer.churn_score = churn_score
-            
-            # Create activity record
-            activity = CustomerActivity(
-                customer_id=customer.id,
-                activity_type='prediction',
-                description='Churn score calculated',
-                activity_metadata={'score': churn_score}
-            )
-            db.session.add(activity)
+    try:
+        params = parse_listing_args(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.customers'))
     
-    db.session.commit()
+    # Get one page of the current user's customers; this path never writes,
+    # unscored customers are shown as pending until rescore_customers_task runs
+    customers, next_cursor = list_customers(current_user.id, **params)
     
-    # Check if there's an uploaded file in the session
-    if 'uploaded_customers' in session:
+    # Check if there's an uploaded file in the session (shown on the first page)
+    if 'uploaded_customers' in session and not params['after']:
         uploaded_customers = session['uploaded_customers']
         # Convert uploaded data to Customer objects for display
-        for customer_data in uploaded_customers:
-            customer = Customer(
+        uploaded = [
+            Customer(
                 user_id=current_user.id,
                 customer_id=customer_data.get('customer_id', ''),
                 name=customer_data.get('name', ''),
@@ -91,23 +89,51 @@ def customers():
                 monthly_bill=customer_data.get('monthly_bill', 0),
                 total_usage_gb=customer_data.get('total_usage_gb', 0)
             )
-            # Calculate churn score for uploaded customer
-            if customer.churn_score is None:
-                customer.churn_score = predict_churn({
-                    'Monthly_Bill': customer.monthly_bill,
-                    'Total_Usage_GB': customer.total_usage_gb,
-                    'Subscription_Length_Months': customer.subscription_length_months,
-                    'Age': customer.age if customer.age is not None else 0  # Handle null age
-                })
-            customers.append(customer)
-    
-    return render_template('customers.html', customers=customers)
+            for customer_data in uploaded_customers
+        ]
+        # Calculate churn scores for uploaded customers
+        if uploaded:
+            scores = score_batch(customer_features(uploaded))
+            for customer, churn_score in zip(uploaded, scores.tolist()):
+                customer.churn_score = churn_score
+        customers.extend(uploaded)
+    
+    locations, segments = listing_filter_choices(current_user.id)
+    return render_template('customers.html',
+                         customers=customers,
+                         next_cursor=next_cursor,
+                         filters=params,
+                         locations=locations,
+                         segments=segments)
+
+@main.route('/api/customers')
+@login_required
+def api_customers():
+    try:
+        params = parse_listing_args(request.args)
+        customers, next_cursor = list_customers(current_user.id, **params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'customers': [customer_to_dict(c) for c in customers],
+        'next_cursor': next_cursor
+    })
+
+@main.route('/api/customers/export')
+@login_required
+def api_customers_export():
+    """All of the user's customers as one JSON array, streamed as it is read."""
+    return stream_json_array(customer_to_dict(c) for c in iter_customers(current_user.id))
 
 @main.route('/customer/<int:id>')
 @login_required
 def customer_detail(id):
     customer = Customer.query.get_or_404(id)
-    return render_template('customer_detail.html', customer=customer)
+    if customer.user_id != current_user.id:
+        abort(403)
+    activities = customer_activity(customer.id, limit=CUSTOMER_ACTIVITY_LIMIT)
+    return render_template('customer_detail.html', customer=customer, activities=activities)
 
 @main.route('/upload', methods=['GET', 'POST'])
 @login_required
@@ -139,20 +165,9 @@ def upload():
             db.session.commit()
             
             # Process the file based on Celery availability
-            if current_app.config.get('USE_CELERY', False):
-                try:
-                    # Start the import task
-                    task = import_customers.delay(job.id)
-                    job.task_id = task.id
-                    db.session.commit()
-                    flash('File uploaded successfully. Processing started.')
-                except Exception as e:
-                    print(f"Warning: Celery task failed: {str(e)}")
-                    import_customers(job.id)  # Run synchronously if Celery fails
-                    flash('File uploaded successfully. Processing completed.')
+            if dispatch_import(job):
+                flash('File uploaded successfully. Processing started.')
             else:
-                # Process synchronously if Celery is disabled
-                import_customers(job.id)
                 flash('File uploaded successfully. Processing completed.')
             
             return redirect(url_for('main.batch_jobs'))
@@ -170,92 +185,109 @@ def batch_jobs():
 @main.route('/trends')
 @login_required
 def trends():
-    # Get all customers for the current user
-    customers = Customer.query.filter_by(user_id=current_user.id).all()
-    
-    # Calculate churn scores for customers that don't have one
-    for customer in customers:
-        if customer.churn_score is None:
-            churn_score = predict_churn({
-                'Monthly_Bill': customer.monthly_bill,
-                'Total_Usage_GB': customer.total_usage_gb,
-                'Subscription_Length_Months': customer.subscription_length_months,
-                'Age': customer.age if customer.age is not None else 0
-            })
-            customer.churn_score = churn_score
-    
-    db.session.commit()
-    
-    # Filter out customers without churn scores
-    customers_with_scores = [c for c in customers if c.churn_score is not None]
-    
-    # Initialize empty analysis results
-    segment_analysis = {}
-    location_analysis = {}
-    future_predictions = {}
-    factor_importance = {}
-    factor_changes = {}
-    
-    if customers_with_scores:
-        # Perform various analyses only if we have customers with scores
-        segment_analysis = analyze_segments(customers_with_scores)
-        location_analysis = analyze_locations(customers_with_scores)
-        future_predictions = predict_future_churn(customers_with_scores)
-        factor_importance = analyze_key_factors(customers_with_scores)
-        factor_changes = predict_factor_changes(customers_with_scores)
-        
-        # Store the analysis in the database
-        churn_trend = ChurnTrend(
-            user_id=current_user.id,
-            date=datetime.utcnow(),
-            churn_rate=sum(1 for c in customers_with_scores if c.churn_score > 0.7) / len(customers_with_scores),
-            high_risk_customers=sum(1 for c in customers_with_scores if c.churn_score > 0.7),
-            avg_churn_score=sum(c.churn_score for c in customers_with_scores) / len(customers_with_scores),
-            segment_analysis=segment_analysis,
-            location_analysis=location_analysis,
-            future_predictions=future_predictions,
-            factor_importance=factor_importance,
-            factor_changes=factor_changes
-        )
-        db.session.add(churn_trend)
-        db.session.commit()
+    # Serve the latest snapshot; regenerate it in the background when stale
+    snapshot = latest_trend_snapshot(current_user.id)
+    if is_snapshot_stale(snapshot, current_app.config['TRENDS_SNAPSHOT_MAX_AGE']):
+        schedule_trend_refresh(current_user.id)
+        if snapshot is None:
+            # Without a worker the refresh ran inline and may have built one
+            snapshot = latest_trend_snapshot(current_user.id)
     
     return render_template('trends.html',
-                         segment_analysis=segment_analysis,
-                         location_analysis=location_analysis,
-                         future_predictions=future_predictions,
-                         factor_importance=factor_importance,
-                         factor_changes=factor_changes,
-                         has_data=bool(customers_with_scores))
+                         segment_analysis=snapshot.segment_analysis if snapshot else {},
+                         location_analysis=snapshot.location_analysis if snapshot else {},
+                         future_predictions=snapshot.future_predictions if snapshot else {},
+                         factor_importance=snapshot.factor_importance if snapshot else {},
+                         factor_changes=snapshot.factor_changes if snapshot else {},
+                         snapshot_date=snapshot.date if snapshot else None,
+                         has_data=snapshot is not None)
+
+def schedule_trend_refresh(user_id):
+    """Queue a snapshot rebuild for a user unless one was queued recently."""
+    pending = caches.get('trend_refresh')
+    if pending is not None:
+        if pending.get(user_id):
+            return
+        pending.set(user_id, True)
+    
+    try:
+        refresh_trend_snapshot.delay(user_id)
+    except Exception as e:
+        current_app.logger.error(f"Trend refresh for user {user_id} failed: {str(e)}")
+
+@celery.task
+def refresh_trend_snapshot(user_id):
+    try:
+        build_trend_snapshot(user_id)
+    finally:
+        pending = caches.get('trend_refresh')
+        if pending is not None:
+            pending.delete(user_id)
+
+@celery.task
+def refresh_trend_snapshots():
+    """Periodic task: rebuild every stale trend snapshot."""
+    return refresh_stale_snapshots(current_app.config['TRENDS_SNAPSHOT_MAX_AGE'])
+
+@celery.task
+def prune_trend_data():
+    """Periodic task: apply the trend metric and snapshot retention policy."""
+    return {
+        'metrics': prune_trend_metrics(retention_from_config(current_app.config)),
+        'snapshots': prune_trend_snapshots(current_app.config['TREND_SNAPSHOT_RETENTION_DAYS'])
+    }
+
+def series_user_id():
+    """User whose series an API call reads; only admins may ask for another user."""
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None or user_id == current_user.id:
+        return current_user.id
+    if current_user.role != 'admin':
+        abort(403)
+    return user_id
+
+def series_response(spec):
+    """
+    A series page, answered with 304 when the client's copy is current and
+    from the compressed body cache when another poll already built it.
+    """
+    try:
+        params = parse_series_args(spec, request.args)
+        user_id = series_user_id()
+        version, last_modified = series_version(spec, user_id, **params)
+        etag = make_etag(spec['name'], user_id, sorted(params.items()), version)
+        return cached_json_response('series', etag, last_modified,
+                                    lambda: query_series(spec, user_id, **params))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @main.route('/api/trends')
 @login_required
 def api_trends():
-    trends = ChurnTrend.query.order_by(ChurnTrend.date).all()
-    
-    return jsonify({
-        'dates': [t.date.strftime('%Y-%m-%d') for t in trends],
-        'churn_rates': [t.churn_rate for t in trends],
-        'high_risk_customers': [t.high_risk_customers for t in trends],
-        'avg_churn_scores': [t.avg_churn_score for t in trends],
-        'segment_trends': [t.segment_analysis for t in trends],
-        'location_trends': [t.location_analysis for t in trends]
-    })
+    return series_response(TREND_SERIES)
 
 @main.route('/api/predictions')
 @login_required
 def api_predictions():
-    predictions = ChurnPrediction.query.order_by(
-        ChurnPrediction.prediction_date
-    ).all()
-    
-    return jsonify({
-        'dates': [p.prediction_date.strftime('%Y-%m-%d') for p in predictions],
-        'predicted_rates': [p.predicted_churn_rate for p in predictions],
-        'confidence_scores': [p.confidence_score for p in predictions],
-        'segment_predictions': [p.segment_predictions for p in predictions],
-        'factor_changes': predictions[-1].factor_changes if predictions else {}
-    })
+    return series_response(PREDICTION_SERIES)
+
+@main.route('/api/trend-metrics')
+@login_required
+def api_trend_metrics():
+    """Pre-aggregated metric series; `resolution=auto` picks the finest one retained for `start`."""
+    user_id = series_user_id()
+    if request.args.get('list'):
+        return jsonify({'metrics': list_metrics(user_id)})
+    try:
+        params = parse_metric_args(request.args, retention_from_config(current_app.config))
+        version, last_modified = metrics_version(user_id, params['resolution'])
+        etag = make_etag('trend-metrics', user_id, sorted(params.items()), version)
+
+        def build():
+            return dict(query_metric_series(user_id, **params), resolution=params['resolution'])
+        return cached_json_response('series', etag, last_modified, build)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @main.route('/login', methods=['GET', 'POST'])
 def login():
@@ -317,18 +349,18 @@ def add_customer():
                 monthly_bill=form.monthly_bill.data,
                 total_usage_gb=form.total_usage_gb.data
             )
+            
+            # Score on create so the customer never waits for a rescoring run
+            scores, model_version = score_batch(customer_features([customer]), return_version=True)
+            customer.churn_score = float(scores[0])
+            customer.model_version = model_version
+            
             db.session.add(customer)
             db.session.commit()
             
             # Create activity record
-            activity = CustomerActivity(
-                customer_id=customer.id,
-                activity_type='create',
-                description='New customer added',
-                activity_metadata={'source': 'manual_entry'}
-            )
-            db.session.add(activity)
-            db.session.commit()
+            log_activity(current_user.id, 'create', 'New customer added',
+                         customer_id=customer.id, metadata={'source': 'manual_entry'})
             
             flash('Customer added successfully', 'success')
             return redirect(url_for('main.customers'))
@@ -341,8 +373,10 @@ def add_customer():
 @main.route('/analysis')
 @login_required
 def view_analysis():
-    customers = Customer.query.filter_by(user_id=current_user.id).all()
-    analysis = analyze_customer_base(customers)
+    analysis = analyze_customer_base(get_customer_snapshot(current_user.id))
+    if analysis is None:
+        flash('Add or upload customers to see an analysis', 'info')
+        return redirect(url_for('main.customers'))
     
     # Store the analysis
     churn_analysis = ChurnAnalysis(
@@ -372,25 +406,16 @@ def process_data(filepath, user_id):
     except Exception as e:
         handle_processing_error(user_id, str(e))
 
-def calculate_churn_stats(customers):
-    if not customers:
-        return {
-            'total_customers': 0,
-            'churn_rate': 0,
-            'avg_churn_score': 0,
-            'high_risk_customers': 0
-        }
-    
-    total_customers = len(customers)
-    churn_rate = sum(1 for c in customers if c.churn_prediction) / total_customers
-    avg_churn_score = sum(c.churn_score for c in customers) / total_customers
-    high_risk_customers = sum(1 for c in customers if c.churn_score > 0.7)
+def calculate_churn_stats(user_id):
+    # O(1): read from the per-user aggregates kept up to date on every write
+    stats = get_churn_stats(user_id)
+    total_customers = stats['total_customers']
     
     return {
         'total_customers': total_customers,
-        'churn_rate': churn_rate,
-        'avg_churn_score': avg_churn_score,
-        'high_risk_customers': high_risk_customers
+        'churn_rate': stats['churned_customers'] / total_customers if total_customers else 0,
+        'avg_churn_score': stats['avg_churn_score'],
+        'high_risk_customers': stats['high_risk_customers']
     }
 
 def preprocess_input(data):
@@ -439,144 +464,41 @@ def upload_customers():
         else:  # Excel file
             df = pd.read_excel(file)
         
-        # Define column name mappings for common variations
-        column_mappings = {
-            'customer_id': ['customer_id', 'customerid', 'id', 'customer', 'client_id', 'CustomerID'],
-            'name': ['name', 'customer_name', 'full_name', 'client_name', 'Name'],
-            'age': ['age', 'customer_age', 'Age'],
-            'gender': ['gender', 'sex', 'Gender'],
-            'location': ['location', 'city', 'region', 'area', 'Location'],
-            'subscription_length_months': ['subscription_length_months', 'subscription_length', 'months_subscribed', 'tenure', 'Subscription_Length_Months'],
-            'monthly_bill': ['monthly_bill', 'monthly_charges', 'bill_amount', 'monthly_payment', 'Monthly_Bill'],
-            'total_usage_gb': ['total_usage_gb', 'data_usage', 'usage_gb', 'total_data', 'Total_Usage_GB']
-        }
-        
-        # Map column names to standard names
-        for standard_name, variations in column_mappings.items():
-            for variation in variations:
-                if variation in df.columns:
-                    df = df.rename(columns={variation: standard_name})
-                    break
+        df = normalize_columns(df)
         
         # Check for missing required columns
-        required_columns = ['customer_id', 'name', 'age', 'gender', 'location', 
-                          'subscription_length_months', 'monthly_bill', 'total_usage_gb']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = missing_required_columns(df)
         
         if missing_columns:
             # Provide helpful suggestions for missing columns
             suggestions = []
             for col in missing_columns:
-                possible_names = column_mappings[col]
+                possible_names = COLUMN_MAPPINGS[col]
                 suggestions.append(f"{col} (possible names: {', '.join(possible_names)})")
             
             flash(f'Missing required columns. Please check your file headers. Missing: {", ".join(suggestions)}', 'error')
             return redirect(url_for('main.customers'))
         
-        # Clean and validate numeric columns
-        numeric_columns = ['age', 'subscription_length_months', 'monthly_bill', 'total_usage_gb']
-        for col in numeric_columns:
-            # Convert to numeric, replacing non-numeric values with NaN
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            # Fill NaN values with appropriate defaults
-            if col == 'age':
-                df[col] = df[col].fillna(df[col].median()).astype(int)
-            elif col == 'subscription_length_months':
-                df[col] = df[col].fillna(0).astype(int)
-            elif col in ['monthly_bill', 'total_usage_gb']:
-                df[col] = df[col].fillna(0.0).astype(float)
-
-        # Clean text columns
-        text_columns = ['name', 'gender', 'location']
-        for col in text_columns:
-            df[col] = df[col].fillna('').astype(str).str.strip()
-
-        # Process each row and save to database
-        for _, row in df.iterrows():
-            try:
-                customer_id = str(row.get('customer_id', '')).strip()
-                if not customer_id:  # Skip rows with empty customer_id
-                    continue
-                    
-                # Check if customer already exists
-                existing_customer = Customer.query.filter_by(
-                    user_id=current_user.id,
-                    customer_id=customer_id
-                ).first()
-                
-                if existing_customer:
-                    # Update existing customer
-                    existing_customer.name = str(row.get('name', existing_customer.name))
-                    existing_customer.age = int(row.get('age', 0)) if pd.notna(row.get('age')) else existing_customer.age
-                    existing_customer.gender = str(row.get('gender')) if pd.notna(row.get('gender')) else existing_customer.gender
-                    existing_customer.location = str(row.get('location')) if pd.notna(row.get('location')) else existing_customer.location
-                    existing_customer.subscription_length_months = int(row.get('subscription_length_months', existing_customer.subscription_length_months))
-                    existing_customer.monthly_bill = float(row.get('monthly_bill', existing_customer.monthly_bill))
-                    existing_customer.total_usage_gb = float(row.get('total_usage_gb', existing_customer.total_usage_gb))
-                    
-                    # Recalculate churn score
-                    existing_customer.churn_score = predict_churn({
-                        'Monthly_Bill': existing_customer.monthly_bill,
-                        'Total_Usage_GB': existing_customer.total_usage_gb,
-                        'Subscription_Length_Months': existing_customer.subscription_length_months,
-                        'Age': existing_customer.age if existing_customer.age is not None else 0
-                    })
-                    
-                    # Save the customer first
-                    db.session.add(existing_customer)
-                    db.session.flush()  # This will assign an ID to the customer
-                    
-                    # Create activity record for update
-                    activity = CustomerActivity(
-                        customer_id=existing_customer.id,
-                        activity_type='update',
-                        description='Customer updated from file import',
-                        activity_metadata={'source': 'file_upload', 'file_type': file_ext}
-                    )
-                    db.session.add(activity)
-                    
-                else:
-                    # Create new customer
-                    customer = Customer(
-                        user_id=current_user.id,
-                        customer_id=customer_id,
-                        name=str(row.get('name', '')),
-                        age=int(row.get('age', 0)) if pd.notna(row.get('age')) else None,
-                        gender=str(row.get('gender')) if pd.notna(row.get('gender')) else None,
-                        location=str(row.get('location')) if pd.notna(row.get('location')) else None,
-                        subscription_length_months=int(row.get('subscription_length_months', 0)),
-                        monthly_bill=float(row.get('monthly_bill', 0)),
-                        total_usage_gb=float(row.get('total_usage_gb', 0))
-                    )
-                    
-                    # Calculate churn score
-                    customer.churn_score = predict_churn({
-                        'Monthly_Bill': customer.monthly_bill,
-                        'Total_Usage_GB': customer.total_usage_gb,
-                        'Subscription_Length_Months': customer.subscription_length_months,
-                        'Age': customer.age if customer.age is not None else 0
-                    })
-                    
-                    # Save the customer first
-                    db.session.add(customer)
-                    db.session.flush()  # This will assign an ID to the customer
-                    
-                    # Create activity record for new customer
-                    activity = CustomerActivity(
-                        customer_id=customer.id,
-                        activity_type='import',
-                        description='Customer imported from file',
-                        activity_metadata={'source': 'file_upload', 'file_type': file_ext}
-                    )
-                    db.session.add(activity)
-                
-            except Exception as e:
-                print(f"Error processing row: {str(e)}")
-                db.session.rollback()
-                continue
+        # Clean, score and write the rows in bulk batches
+        df = clean_customer_frame(df)
+        stats = bulk_upsert_customers(
+            df,
+            user_id=current_user.id,
+            source='file_upload',
+            file_type=file_ext,
+            batch_size=current_app.config['IMPORT_BATCH_SIZE']
+        )
+        current_app.logger.info(
+            f"Imported {stats['rows']} rows for user {current_user.id} "
+            f"in {stats['elapsed']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec)"
+        )
         
-        db.session.commit()
-        flash('File uploaded and processed successfully', 'success')
+        if stats['failed']:
+            flash(f"File processed with errors: {stats['inserted']} added, {stats['updated']} updated, "
+                  f"{stats['failed']} failed", 'warning')
+        else:
+            flash(f"File uploaded and processed successfully: {stats['inserted']} added, "
+                  f"{stats['updated']} updated ({stats['rows_per_sec']:.0f} rows/sec)", 'success')
         return redirect(url_for('main.customers'))
         
     except Exception as e:
@@ -613,24 +535,16 @@ def edit_customer(customer_id):
             customer.total_usage_gb = form.total_usage_gb.data
             
             # Recalculate churn score
-            churn_score = predict_churn({
-                'Monthly_Bill': customer.monthly_bill,
-                'Total_Usage_GB': customer.total_usage_gb,
-                'Subscription_Length_Months': customer.subscription_length_months,
-                'Age': customer.age if customer.age is not None else 0  # Handle null age
-            })
-            customer.churn_score = churn_score
+            scores, model_version = score_batch(customer_features([customer]), return_version=True)
+            customer.churn_score = float(scores[0])
+            customer.model_version = model_version
             
-            # Create activity record
-            activity = CustomerActivity(
-                customer_id=customer.id,
-                activity_type='update',
-                description='Customer details updated',
-                activity_metadata={'updated_fields': list(form.data.keys())}
-            )
-            db.session.add(activity)
             db.session.commit()
             
+            # Create activity record
+            log_activity(current_user.id, 'update', 'Customer details updated',
+                         customer_id=customer.id, metadata={'updated_fields': list(form.data.keys())})
+            
             flash('Customer updated successfully', 'success')
             return redirect(url_for('main.view_customer', customer_id=customer.id))
         except Exception as e:
@@ -647,19 +561,21 @@ def delete_customer(customer_id):
         abort(403)
     
     try:
-        # Create activity record before deletion
-        activity = CustomerActivity(
-            customer_id=customer.id,
-            activity_type='delete',
-            description='Customer deleted',
-            activity_metadata={'customer_id': customer.customer_id}
-        )
-        db.session.add(activity)
-        
-        # Delete the customer
+        # Delete the customer; its earlier activity and prediction history
+        # are kept with customer_id NULL
+        deleted = {'customer_id': customer.customer_id, 'name': customer.name}
+        # Write buffered events first, so none still points at the customer
+        activity_buffer.flush()
+        CustomerActivity.query.filter_by(customer_id=customer.id).update(
+            {'customer_id': None}, synchronize_session=False)
+        CustomerHistory.query.filter_by(customer_id=customer.id).update(
+            {'customer_id': None}, synchronize_session=False)
         db.session.delete(customer)
         db.session.commit()
         
+        # Create activity record
+        log_activity(current_user.id, 'delete', 'Customer deleted', metadata=deleted)
+        
         flash('Customer deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -669,228 +585,466 @@ def delete_customer(customer_id):
 
 @celery.task
 def import_customers(job_id):
+    """
+    Import a BatchJob's file chunk by chunk.
+
+    Each chunk is committed before the job's checkpoint_offset is advanced,
+    so a failed job can be resumed from the last committed row. Missing
+    ages are filled with the median of the whole file, stored with the
+    checkpoint so a resumed import fills the same value.
+    """
+    job = BatchJob.query.get(job_id)
+    if not job or job.status == 'completed':
+        return
+    
     try:
-        job = BatchJob.query.get(job_id)
-        if not job:
-            return
-        
         job.status = 'processing'
+        job.error_message = None
         db.session.commit()
         
-        # Read and process the file based on its type
         file_ext = os.path.splitext(job.file_path)[1].lower()
-        if file_ext == '.csv':
-            df = pd.read_csv(job.file_path)
-        elif file_ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(job.file_path)
-        else:
+        if file_ext not in ['.csv', '.xlsx', '.xls']:
             job.status = 'failed'
             job.error_message = f'Unsupported file type: {file_ext}'
             job.completed_at = datetime.utcnow()
             db.session.commit()
             return
         
-        # Process the data
-        for _, row in df.iterrows():
-            try:
-                customer = Customer(
-                    user_id=job.user_id,
-                    customer_id=str(row['customer_id']),
-                    name=str(row['name']),
-                    age=int(row.get('age', 0)) if pd.notna(row.get('age')) else None,
-                    gender=str(row.get('gender')) if pd.notna(row.get('gender')) else None,
-                    location=str(row.get('location')) if pd.notna(row.get('location')) else None,
-                    subscription_length_months=int(row['subscription_length_months']),
-                    monthly_bill=float(row['monthly_bill']),
-                    total_usage_gb=float(row['total_usage_gb'])
-                )
-                db.session.add(customer)
-                
-                # Create activity record
-                activity = CustomerActivity(
-                    customer_id=customer.id,
-                    activity_type='import',
-                    description='Customer imported from file',
-                    activity_metadata={'source': 'batch_import', 'file_type': file_ext}
-                )
-                db.session.add(activity)
-            except Exception as e:
-                # Log the error but continue processing other rows
-                print(f"Error processing row: {str(e)}")
-                continue
+        data = job.result_data or {}
+        totals = dict(data.get('totals', {}))
+        age_fill = data['age_fill'] if 'age_fill' in data else file_age_median(job.file_path)
+        existing_ids = fetch_customer_ids(job.user_id)
         
-        db.session.commit()
+        # Rows past the checkpoint are redone, so restart the counters there
+        job.rows_failed = totals.get('failed', 0)
+        job.rows_processed = max(0, (job.checkpoint_offset or 0) - job.rows_failed)
+        progress = JobProgress(
+            job,
+            total=count_file_rows(job.file_path),
+            interval=current_app.config['PROGRESS_INTERVAL']
+        )
+        chunks = iter_file_chunks(
+            job.file_path,
+            chunk_size=current_app.config['IMPORT_CHUNK_SIZE'],
+            skip_rows=job.checkpoint_offset or 0
+        )
+        
+        for offset, chunk in chunks:
+            chunk = normalize_columns(chunk)
+            missing_columns = missing_required_columns(chunk)
+            if missing_columns:
+                raise ValueError(f'Missing required columns: {", ".join(missing_columns)}')
+            
+            cleaned = clean_customer_frame(chunk, age_fill=age_fill)
+            stats = bulk_upsert_customers(
+                cleaned,
+                user_id=job.user_id,
+                source='batch_import',
+                file_type=file_ext,
+                batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                existing_ids=existing_ids,
+                on_batch=progress.advance
+            )
+            # Rows dropped while cleaning still count as processed
+            progress.advance(processed=len(chunk) - len(cleaned))
+            for key in ('rows', 'inserted', 'updated', 'failed'):
+                totals[key] = totals.get(key, 0) + stats[key]
+            
+            # Advance the checkpoint only after the chunk is committed
+            job.checkpoint_offset = offset + len(chunk)
+            job.result_data = {'totals': totals, 'age_fill': age_fill}
+            db.session.commit()
         
         # Update job status
         job.status = 'completed'
         job.completed_at = datetime.utcnow()
-        db.session.commit()
+        if job.rows_total is None:
+            # Files whose rows cannot be counted up front (.xls)
+            job.rows_total = job.rows_processed + job.rows_failed
+        progress.publish(force=True)
         
         # Clean up the temporary file
         if os.path.exists(job.file_path):
             os.remove(job.file_path)
         
     except Exception as e:
-        if job:
-            job.status = 'failed'
-            job.error_message = str(e)
-            job.completed_at = datetime.utcnow()
-            db.session.commit()
-        
-        # Clean up the temporary file if it exists
+        db.session.rollback()
+        # Keep the file so the job can be resumed from its checkpoint
+        job.status = 'failed'
+        job.error_message = str(e)
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        raise
+
+@celery.task
+def import_customers_chunk(job_id, start, stop, offset=None):
+    """
+    Import data rows [start, stop) of a chunked BatchJob.
+
+    Errors are returned rather than raised, so the chord callback still runs
+    and can record which ranges have to be retried. Existing customers are
+    looked up per chunk, so a customer_id repeated in two ranges that run at
+    the same time can make one of the inserting batches fail.
+    """
+    result = {'start': start, 'stop': stop, 'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0,
+              'error': None}
+    job = BatchJob.query.get(job_id)
+    if not job:
+        result['error'] = f'Import job {job_id} not found'
+        return result
+    
+    user_id = job.user_id
+    file_path = job.file_path
+    file_ext = os.path.splitext(file_path)[1].lower()
+    age_fill = (job.result_data or {}).get('age_fill')
+    progress = SharedJobProgress(job_id, interval=current_app.config['PROGRESS_INTERVAL'])
+    try:
+        chunks = iter_row_range(file_path, start, stop, offset=offset,
+                                chunk_size=current_app.config['IMPORT_CHUNK_SIZE'])
+        for _, chunk in chunks:
+            chunk = normalize_columns(chunk)
+            missing_columns = missing_required_columns(chunk)
+            if missing_columns:
+                raise ValueError(f'Missing required columns: {", ".join(missing_columns)}')
+            
+            cleaned = clean_customer_frame(chunk, age_fill=age_fill)
+            stats = bulk_upsert_customers(
+                cleaned,
+                user_id=user_id,
+                source='batch_import',
+                file_type=file_ext,
+                batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                existing_ids=fetch_customer_ids(user_id, cleaned['customer_id']),
+                on_batch=progress.advance
+            )
+            progress.advance(processed=len(chunk) - len(cleaned))
+            for key in ('rows', 'inserted', 'updated', 'failed'):
+                result[key] += stats[key]
+    except Exception as e:
+        db.session.rollback()
+        result['error'] = str(e)
+    progress.publish()
+    return result
+
+@celery.task
+def finalize_chunked_import(results, job_id):
+    """
+    Chord callback: combine the chunk results and close the BatchJob.
+
+    Ranges that raised are kept in result_data['failed_ranges'] (their
+    partial counts are dropped, since a resume redoes the whole range)
+    and fail the job; otherwise it completes and the file is removed.
+    """
+    job = BatchJob.query.get(job_id)
+    if not job:
+        return
+    
+    data = dict(job.result_data or {})
+    totals = dict(data.get('totals', {}))
+    ranges = {(r['start'], r['stop']): r for r in data.get('ranges', [])}
+    failed_ranges = []
+    for result in results:
+        if result.get('error'):
+            failed_ranges.append(dict(ranges.get((result['start'], result['stop']),
+                                                 {'start': result['start'], 'stop': result['stop'], 'offset': None}),
+                                      error=result['error']))
+            continue
+        for key in ('rows', 'inserted', 'updated', 'failed'):
+            totals[key] = totals.get(key, 0) + result[key]
+    
+    data['totals'] = totals
+    data['failed_ranges'] = failed_ranges
+    job.result_data = data
+    job.rows_processed = totals.get('rows', 0)
+    job.rows_failed = totals.get('failed', 0)
+    job.completed_at = datetime.utcnow()
+    if job.started_at and job.completed_at > job.started_at:
+        job.rows_per_sec = job.rows_processed / (job.completed_at - job.started_at).total_seconds()
+    job.progress_updated_at = job.completed_at
+    
+    if failed_ranges:
+        job.status = 'failed'
+        job.error_message = (f'{len(failed_ranges)} of {len(results)} chunk(s) failed: '
+                             f'{failed_ranges[0]["error"]}')
+    else:
+        job.status = 'completed'
+        job.error_message = None
         if os.path.exists(job.file_path):
             os.remove(job.file_path)
+    db.session.commit()
+
+def plan_chunked_import(job, split=True):
+    """
+    Row ranges to import in parallel for a job, or None to import it
+    sequentially. A failed chunked job retries only its failed ranges;
+    other jobs are only split when `split` is set.
+    """
+    data = job.result_data or {}
+    if data.get('mode') == 'chunked':
+        return [{key: r[key] for key in ('start', 'stop', 'offset')} for r in data.get('failed_ranges', [])]
+    if not split or job.checkpoint_offset:
+        return None  # A sequential import is resumed from its checkpoint
+    
+    ranges = plan_row_ranges(job.file_path, current_app.config['IMPORT_PARALLEL_CHUNK_ROWS'])
+    if not ranges or ranges[-1]['stop'] < current_app.config['IMPORT_PARALLEL_MIN_ROWS']:
+        return None
+    return ranges
+
+def start_chunked_import(job, ranges):
+    """Mark a job as a chunked import and dispatch its ranges as a chord."""
+    data = dict(job.result_data or {})
+    resuming = data.get('mode') == 'chunked'
+    data['mode'] = 'chunked'
+    if not resuming:
+        data['ranges'] = ranges
+        job.rows_total = ranges[-1]['stop']
+        job.rows_processed = 0
+        job.rows_failed = 0
+    else:
+        # The failed ranges are redone from scratch
+        job.rows_processed = data.get('totals', {}).get('rows', 0)
+        job.rows_failed = data.get('totals', {}).get('failed', 0)
+    if 'age_fill' not in data:
+        # Computed once, so every range fills missing ages with the file's median
+        data['age_fill'] = file_age_median(job.file_path)
+    data['failed_ranges'] = []
+    job.result_data = data
+    job.status = 'processing'
+    job.error_message = None
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+    
+    header = [import_customers_chunk.s(job.id, r['start'], r['stop'], r['offset']) for r in ranges]
+    result = chord(header)(finalize_chunked_import.s(job.id))
+    job.task_id = result.id
+    db.session.commit()
+
+@celery.task
+def import_ranges_sequentially(job_id, ranges):
+    """Import a chunked job's ranges one after another, then finalize it."""
+    job = BatchJob.query.get(job_id)
+    if not job:
+        return
+    data = dict(job.result_data or {})
+    data['failed_ranges'] = []
+    job.result_data = data
+    job.status = 'processing'
+    db.session.commit()
+    results = [import_customers_chunk(job_id, r['start'], r['stop'], r['offset']) for r in ranges]
+    finalize_chunked_import(results, job_id)
+
+def dispatch_import(job):
+    """
+    Queue the import of a job's file on Celery or the local task queue.
+
+    With a Celery worker pool, files of at least IMPORT_PARALLEL_MIN_ROWS
+    rows are split into IMPORT_PARALLEL_CHUNK_ROWS ranges imported by
+    parallel tasks; smaller files run as a single import_customers task.
+
+    Returns:
+        bool: True if the import runs in the background, False if it has
+        already run inline
+    """
+    parallel = hasattr(celery, 'conf')
+    ranges = plan_chunked_import(job, split=parallel)
+    job_id = job.id
+    try:
+        if ranges and parallel:
+            start_chunked_import(job, ranges)
+            return True
+        if ranges:
+            task = import_ranges_sequentially.delay(job_id, ranges)
+        else:
+            task = import_customers.delay(job_id)
+        job.task_id = task.id
+        db.session.commit()
+        return not task.ready()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Warning: Queueing import job {job_id} failed: {str(e)}")
+    
+    # Process synchronously if the task could not be queued
+    try:
+        if ranges:
+            import_ranges_sequentially(job_id, ranges)
+        else:
+            import_customers(job_id)
+    except Exception as e:
+        current_app.logger.error(f"Import job {job_id} failed: {str(e)}")
+    return False
+
+@main.route('/api/batch-jobs/<int:job_id>/progress')
+@login_required
+def api_batch_job_progress(job_id):
+    job = BatchJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403)
+    return jsonify(job_progress(job))
+
+@main.route('/batch-jobs/<int:job_id>/resume', methods=['POST'])
+@login_required
+def resume_batch_job(job_id):
+    job = BatchJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403)
+    
+    if job.job_type != 'import' or job.status != 'failed':
+        flash('Only failed import jobs can be resumed', 'error')
+    elif not job.file_path or not os.path.exists(job.file_path):
+        flash('The uploaded file for this job is no longer available', 'error')
+    else:
+        failed_ranges = (job.result_data or {}).get('failed_ranges')
+        job.status = 'pending'
+        job.completed_at = None
+        db.session.commit()
+        if dispatch_import(job):
+            if failed_ranges:
+                flash(f'Retrying {len(failed_ranges)} failed chunk(s) of the import.')
+            else:
+                flash(f'Resuming import from row {job.checkpoint_offset or 0}.')
+        else:
+            flash('Import resumed and processed.')
+    
+    return redirect(url_for('main.batch_jobs'))
+
+@celery.task
+def rescore_customers_task(job_id):
+    """
+    Score the customers of a 'rescore' BatchJob that are unscored or were
+    scored by an older model.
+
+    The job's result_data holds its options: 'scope' ('all' customers or just
+    the job owner's) and 'only_missing'.
+    """
+    job = BatchJob.query.get(job_id)
+    if not job or job.status == 'completed':
+        return
+    
+    try:
+        job.status = 'processing'
+        job.error_message = None
+        job.rows_processed = 0
+        job.rows_failed = 0
+        db.session.commit()
+        
+        options = dict(job.result_data or {})
+        user_id = None if options.get('scope') == 'all' else job.user_id
+        only_missing = bool(options.get('only_missing'))
+        progress = JobProgress(
+            job,
+            total=count_customers_to_rescore(user_id, only_missing=only_missing),
+            interval=current_app.config['PROGRESS_INTERVAL']
+        )
+        stats = rescore_customers(
+            user_id=user_id,
+            batch_size=current_app.config['RESCORE_BATCH_SIZE'],
+            only_missing=only_missing,
+            on_batch=progress.advance
+        )
+        
+        job.status = 'completed'
+        job.completed_at = datetime.utcnow()
+        job.result_data = dict(options, totals=stats)
+        progress.publish(force=True)
         
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.error_message = str(e)
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
         raise
 
+@celery.task
+def rescore_stale_customers():
+    """Periodic task: score every unscored or stale-model customer."""
+    return rescore_customers(batch_size=current_app.config['RESCORE_BATCH_SIZE'])
+
+@celery.task
+def compact_activity_log():
+    """Periodic task: apply the activity retention and compaction policy."""
+    return compact_activity(
+        compact_after_days=current_app.config['ACTIVITY_COMPACT_AFTER_DAYS'],
+        retention_days=current_app.config['ACTIVITY_RETENTION_DAYS']
+    )
+
+def start_rescoring(job):
+    """Queue rescore_customers_task for a job on Celery or the local task queue."""
+    job_id = job.id
+    try:
+        task = rescore_customers_task.delay(job_id)
+        job.task_id = task.id
+        db.session.commit()
+        return
+    except Exception as e:
+        db.session.rollback()
+        print(f"Warning: Queueing rescore job {job_id} failed: {str(e)}")
+    
+    try:
+        rescore_customers_task(job_id)
+    except Exception as e:
+        current_app.logger.error(f"Rescore job {job_id} failed: {str(e)}")
+
+@main.route('/admin/rescore', methods=['POST'])
+@login_required
+def admin_rescore():
+    if current_user.role != 'admin':
+        abort(403)
+    
+    job = BatchJob(
+        user_id=current_user.id,
+        job_type='rescore',
+        status='pending',
+        result_data={
+            'scope': 'all' if request.form.get('scope', 'all') == 'all' else 'user',
+            'only_missing': request.form.get('only_missing') == '1'
+        }
+    )
+    db.session.add(job)
+    db.session.commit()
+    
+    start_rescoring(job)
+    flash(f'Rescoring job #{job.id} started.')
+    return redirect(url_for('main.batch_jobs'))
+
+@main.route('/api/cache-stats')
+@login_required
+def api_cache_stats():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(cache_stats())
+
 @main.route('/dynamic-analysis', methods=['GET', 'POST'])
 @login_required
 def dynamic_analysis():
     form = DynamicAnalysisForm()
     
-    # Get unique locations from database for the dropdown
-    locations = [loc[0] for loc in db.session.query(Customer.location).distinct().filter(Customer.location.isnot(None)).all()]
+    # Get the current user's locations for the dropdown
+    locations, _ = listing_filter_choices(current_user.id)
     form.location.choices = [('all', 'All Locations')] + [(loc, loc) for loc in locations]
     
     if request.method == 'POST' and form.validate():
         try:
             # Get filter criteria from form
-            age_range = form.age_range.data
-            location = form.location.data
-            gender = form.gender.data
-            subscription_range = form.subscription_range.data
-            usage_range = form.usage_range.data
-            
-            # Start with base query for current user's customers
-            query = Customer.query.filter_by(user_id=current_user.id)
-            
-            # Apply filters
-            if age_range:
-                min_age, max_age = map(int, age_range.split('-'))
-                query = query.filter(Customer.age.between(min_age, max_age))
-            
-            if location and location != 'all':
-                query = query.filter(Customer.location == location)
-            
-            if gender and gender != 'all':
-                query = query.filter(Customer.gender == gender)
-            
-            if subscription_range:
-                min_months, max_months = map(int, subscription_range.split('-'))
-                query = query.filter(Customer.subscription_length_months.between(min_months, max_months))
-            
-            if usage_range:
-                min_gb, max_gb = map(float, usage_range.split('-'))
-                query = query.filter(Customer.total_usage_gb.between(min_gb, max_gb))
+            criteria = {
+                'age_range': form.age_range.data,
+                'location': form.location.data,
+                'gender': form.gender.data,
+                'subscription_range': form.subscription_range.data,
+                'usage_range': form.usage_range.data
+            }
             
-            # Get filtered customers
-            customers = query.all()
+            # Aggregate the filtered customers in the database (cached per data version)
+            analysis = get_dynamic_analysis(current_user.id, **criteria)
             
-            if not customers:
+            if analysis is None:
                 flash('No customers match the selected criteria', 'warning')
                 return redirect(request.url)
             
-            # Convert customers to list of dictionaries for analysis
-            customers_data = []
-            for customer in customers:
-                customer_dict = {
-                    'customer_id': customer.customer_id,
-                    'name': customer.name,
-                    'age': customer.age,
-                    'gender': customer.gender.lower() if customer.gender else 'other',
-                    'location': customer.location,
-                    'subscription_length_months': customer.subscription_length_months,
-                    'monthly_bill': customer.monthly_bill,
-                    'total_usage_gb': customer.total_usage_gb,
-                    'churn_score': customer.churn_score
-                }
-                customers_data.append(customer_dict)
-            
-            # Perform analysis on filtered data
-            total_customers = len(customers_data)
-            
-            # Calculate churn rate and risk distributions
-            churned_customers = sum(1 for c in customers_data if c['churn_score'] > 0.7)
-            churn_rate = (churned_customers / total_customers * 100) if total_customers > 0 else 0
-            
-            # Calculate averages
-            avg_monthly_bill = sum(c['monthly_bill'] for c in customers_data) / total_customers if total_customers > 0 else 0
-            avg_usage = sum(c['total_usage_gb'] for c in customers_data) / total_customers if total_customers > 0 else 0
-            
-            # Calculate risk based on monthly bill comparison
-            max_monthly_bill = max(c['monthly_bill'] for c in customers_data)
-            bill_risk_distribution = {
-                'very_high': 0,  # 0-20% of max bill
-                'high': 0,       # 21-40% of max bill
-                'medium': 0,     # 41-60% of max bill
-                'low': 0,        # 61-80% of max bill
-                'very_low': 0    # 81-100% of max bill
-            }
-            
-            total_risk_score = 0
-            for customer in customers_data:
-                bill_percentage = (customer['monthly_bill'] / max_monthly_bill) * 100
-                if bill_percentage <= 20:
-                    bill_risk_distribution['very_high'] += 1
-                    risk_score = 1.0
-                elif bill_percentage <= 40:
-                    bill_risk_distribution['high'] += 1
-                    risk_score = 0.8
-                elif bill_percentage <= 60:
-                    bill_risk_distribution['medium'] += 1
-                    risk_score = 0.6
-                elif bill_percentage <= 80:
-                    bill_risk_distribution['low'] += 1
-                    risk_score = 0.4
-                else:
-                    bill_risk_distribution['very_low'] += 1
-                    risk_score = 0.2
-                
-                total_risk_score += risk_score
-            
-            # Calculate average risk percentage
-            avg_risk_percentage = (total_risk_score / total_customers) * 100 if total_customers > 0 else 0
-            
-            # Risk distribution
-            high_risk = sum(1 for c in customers_data if c['churn_score'] > 0.7)
-            medium_risk = sum(1 for c in customers_data if 0.4 <= c['churn_score'] <= 0.7)
-            low_risk = sum(1 for c in customers_data if c['churn_score'] < 0.4)
-            
-            # Calculate distributions
-            age_dist = analyze_age_distribution(customers_data)
-            location_dist = analyze_location_distribution(customers_data)
-            gender_dist = analyze_gender_distribution(customers_data)
-            subscription_dist = analyze_subscription_distribution(customers_data)
-            usage_dist = analyze_usage_distribution(customers_data)
-            
-            analysis = {
-                'total_customers': total_customers,
-                'churn_rate': churn_rate,
-                'avg_monthly_bill': avg_monthly_bill,
-                'avg_usage': avg_usage,
-                'high_risk_customers': high_risk,
-                'medium_risk_customers': medium_risk,
-                'low_risk_customers': low_risk,
-                'age_distribution': age_dist,
-                'location_distribution': location_dist,
-                'gender_distribution': gender_dist,
-                'subscription_distribution': subscription_dist,
-                'usage_distribution': usage_dist,
-                'bill_risk_distribution': bill_risk_distribution,
-                'avg_risk_percentage': avg_risk_percentage,
-                'max_monthly_bill': max_monthly_bill
-            }
-            
             return render_template('dynamic_analysis.html', 
                                 form=form,
                                 analysis=analysis,
-                                selected_criteria={
-                                    'age_range': age_range,
-                                    'location': location,
-                                    'gender': gender,
-                                    'subscription_range': subscription_range,
-                                    'usage_range': usage_range
-                                },
+                                selected_criteria=criteria,
                                 locations=locations)
             
         except Exception as e:
@@ -899,121 +1053,7 @@ def dynamic_analysis():
             return redirect(request.url)
     
     # For GET request, show the analysis form with empty analysis
-    empty_analysis = {
-        'total_customers': 0,
-        'churn_rate': 0.0,
-        'avg_monthly_bill': 0.0,
-        'avg_usage': 0.0,
-        'high_risk_customers': 0,
-        'medium_risk_customers': 0,
-        'low_risk_customers': 0,
-        'age_distribution': {
-            '18-25': 0, '26-35': 0, '36-45': 0, '46-55': 0, '56+': 0
-        },
-        'location_distribution': {},
-        'gender_distribution': {'male': 0, 'female': 0, 'other': 0},
-        'subscription_distribution': {
-            '0-6 months': 0, '7-12 months': 0, '13-24 months': 0, '25+ months': 0
-        },
-        'usage_distribution': {
-            '0-50 GB': 0, '51-100 GB': 0, '101-200 GB': 0, '201+ GB': 0
-        },
-        'bill_risk_distribution': {
-            'very_high': 0,
-            'high': 0,
-            'medium': 0,
-            'low': 0,
-            'very_low': 0
-        },
-        'avg_risk_percentage': 0.0,
-        'max_monthly_bill': 0.0
-    }
     return render_template('dynamic_analysis.html', 
                          form=form,
-                         analysis=empty_analysis,
+                         analysis=empty_analysis(),
                          locations=locations)
-
-def analyze_age_distribution(customers):
-    age_groups = {
-        '18-25': 0,
-        '26-35': 0,
-        '36-45': 0,
-        '46-55': 0,
-        '56+': 0
-    }
-    
-    for customer in customers:
-        age = customer.get('age')
-        if age is not None:
-            if 18 <= age <= 25:
-                age_groups['18-25'] += 1
-            elif 26 <= age <= 35:
-                age_groups['26-35'] += 1
-            elif 36 <= age <= 45:
-                age_groups['36-45'] += 1
-            elif 46 <= age <= 55:
-                age_groups['46-55'] += 1
-            else:
-                age_groups['56+'] += 1
-    
-    return age_groups
-
-def analyze_location_distribution(customers):
-    locations = {}
-    for customer in customers:
-        location = customer.get('location')
-        if location:
-            locations[location] = locations.get(location, 0) + 1
-    return locations
-
-def analyze_gender_distribution(customers):
-    genders = {'male': 0, 'female': 0, 'other': 0}
-    for customer in customers:
-        gender = customer.get('gender', '').lower()
-        if gender in genders:
-            genders[gender] += 1
-        else:
-            genders['other'] += 1
-    return genders
-
-def analyze_subscription_distribution(customers):
-    subscription_ranges = {
-        '0-6 months': 0,
-        '7-12 months': 0,
-        '13-24 months': 0,
-        '25+ months': 0
-    }
-    
-    for customer in customers:
-        months = customer.get('subscription_length_months', 0)
-        if months <= 6:
-            subscription_ranges['0-6 months'] += 1
-        elif 7 <= months <= 12:
-            subscription_ranges['7-12 months'] += 1
-        elif 13 <= months <= 24:
-            subscription_ranges['13-24 months'] += 1
-        else:
-            subscription_ranges['25+ months'] += 1
-    
-    return subscription_ranges
-
-def analyze_usage_distribution(customers):
-    usage_ranges = {
-        '0-50 GB': 0,
-        '51-100 GB': 0,
-        '101-200 GB': 0,
-        '201+ GB': 0
-    }
-    
-    for customer in customers:
-        usage = customer.get('total_usage_gb', 0)
-        if usage <= 50:
-            usage_ranges['0-50 GB'] += 1
-        elif 51 <= usage <= 100:
-            usage_ranges['51-100 GB'] += 1
-        elif 101 <= usage <= 200:
-            usage_ranges['101-200 GB'] += 1
-        else:
-            usage_ranges['201+ GB'] += 1
-    
-    return usage_ranges
\ No newline at end of file
@@ -0,0 +1,290 @@
+import atexit
+import threading
+from datetime import datetime, timedelta
+import pandas as pd
+from sqlalchemy import insert, delete, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from .. import db
+from ..models import CustomerActivity
+from .series import date_bucket
+
+# Buffered events written per INSERT, and the longest an event waits for one
+DEFAULT_FLUSH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+# Events shown on a customer's page
+CUSTOMER_ACTIVITY_LIMIT = 50
+
+# Rows deleted per statement when applying the retention policy
+_DELETE_CHUNK_SIZE = 5000
+
+class ActivityBuffer:
+    """
+    Per-process write buffer for CustomerActivity rows.
+
+    Events are appended in memory and written with one multi-row INSERT once
+    `flush_size` events are pending or the oldest has waited `flush_interval`
+    seconds, on a connection of their own. Call log() after committing the
+    change it describes: a flush must not wait on the caller's open
+    transaction. Buffered events are lost if the process dies before a
+    flush, which is acceptable for an audit trail shown on the dashboard.
+    An event whose customer was deleted before the flush is written with
+    customer_id NULL, like the customer's earlier events.
+    """
+
+    def __init__(self, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.app = None
+        self._events = []
+        self._timer = None
+        self._lock = threading.Lock()
+        self.flushed = 0
+        self.flushes = 0
+
+    def configure(self, app, flush_size, flush_interval):
+        with self._lock:
+            self.app = app
+            self.flush_size = flush_size
+            self.flush_interval = flush_interval
+
+    def log(self, user_id, activity_type, description, customer_id=None, metadata=None):
+        """
+        Buffer one activity event.
+
+        Args:
+            user_id (int): Owner of the customer
+            activity_type (str): e.g. 'create', 'update', 'delete'
+            description (str): Human-readable summary
+            customer_id (int): Customer primary key, None if it no longer exists
+            metadata (dict): Stored as activity_metadata
+        """
+        event = {
+            'user_id': user_id,
+            'customer_id': customer_id,
+            'activity_type': activity_type,
+            'description': description,
+            'activity_metadata': metadata,
+            'timestamp': datetime.utcnow(),
+            'event_count': 1
+        }
+        with self._lock:
+            self._events.append(event)
+            full = len(self._events) >= self.flush_size
+            if not full and self._timer is None and self.flush_interval > 0:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full or self.flush_interval <= 0:
+            self.flush()
+
+    def _flush_from_timer(self):
+        if self.app is None:
+            return
+        with self.app.app_context():
+            self.flush()
+
+    def flush(self):
+        """Write all buffered events. Returns the number written."""
+        with self._lock:
+            events, self._events = self._events, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not events:
+            return 0
+
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(CustomerActivity.__table__), events)
+            written = len(events)
+        except IntegrityError:
+            written = self._write_each(events)
+        except Exception as e:
+            print(f"Error writing {len(events)} activity event(s): {str(e)}")
+            return 0
+        with self._lock:
+            self.flushed += written
+            self.flushes += 1
+        return written
+
+    def _write_each(self, events):
+        """
+        Write events one by one after a batch failed on a constraint, so one
+        bad event does not lose the others. An event that still fails is
+        retried without its customer, which may have been deleted meanwhile.
+        """
+        written = 0
+        for event in events:
+            for attempt in (event, {**event, 'customer_id': None}):
+                try:
+                    with db.engine.begin() as connection:
+                        connection.execute(insert(CustomerActivity.__table__), [attempt])
+                    written += 1
+                    break
+                except IntegrityError:
+                    continue
+                except Exception as e:
+                    print(f"Error writing activity event: {str(e)}")
+                    break
+            else:
+                print(f"Error writing activity event for customer {event['customer_id']}: constraint failed")
+        return written
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._events),
+                'flushed': self.flushed,
+                'flushes': self.flushes,
+                'flush_size': self.flush_size,
+                'flush_interval': self.flush_interval
+            }
+
+activity_buffer = ActivityBuffer()
+
+def _flush_at_exit():
+    if activity_buffer.app is not None and activity_buffer.pending():
+        with activity_buffer.app.app_context():
+            activity_buffer.flush()
+
+atexit.register(_flush_at_exit)
+
+def log_activity(user_id, activity_type, description, customer_id=None, metadata=None):
+    """Buffer a CustomerActivity event; see ActivityBuffer.log."""
+    activity_buffer.log(user_id, activity_type, description, customer_id=customer_id, metadata=metadata)
+
+def recent_activity(user_id, limit=5):
+    """
+    A user's latest activity events, newest first.
+
+    Served by the (user_id, timestamp) index; this process's buffered
+    events are flushed first so a user sees their own last action.
+    """
+    activity_buffer.flush()
+    return CustomerActivity.query.options(joinedload(CustomerActivity.customer)).filter(
+        CustomerActivity.user_id == user_id
+    ).order_by(CustomerActivity.timestamp.desc(), CustomerActivity.id.desc()).limit(limit).all()
+
+def customer_activity(customer_id, limit=CUSTOMER_ACTIVITY_LIMIT):
+    """A customer's latest activity events, newest first."""
+    activity_buffer.flush()
+    return CustomerActivity.query.filter(
+        CustomerActivity.customer_id == customer_id
+    ).order_by(CustomerActivity.timestamp.desc(), CustomerActivity.id.desc()).limit(limit).all()
+
+def purge_activity(retention_days, now=None):
+    """
+    Delete activity older than `retention_days`, oldest first, in chunks.
+
+    Returns:
+        int: Rows deleted
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db.session.query(CustomerActivity.id).filter(
+            CustomerActivity.timestamp < cutoff
+        ).order_by(CustomerActivity.timestamp).limit(_DELETE_CHUNK_SIZE).all()]
+        if not ids:
+            break
+        db.session.execute(delete(CustomerActivity).where(CustomerActivity.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+    return deleted
+
+def _days_to_compact(start, cutoff):
+    """Days in [start, cutoff) with more than one event per customer and type."""
+    day = date_bucket(CustomerActivity.timestamp, 'day').label('day')
+    query = select(day).where(
+        CustomerActivity.timestamp >= start,
+        CustomerActivity.timestamp < cutoff,
+        CustomerActivity.customer_id.isnot(None)
+    ).group_by(
+        day, CustomerActivity.user_id, CustomerActivity.customer_id, CustomerActivity.activity_type
+    ).having(func.count(CustomerActivity.id) > 1)
+    days = set()
+    for (value,) in db.session.execute(query):
+        if isinstance(value, str):
+            value = datetime.strptime(value, '%Y-%m-%d')
+        days.add(datetime(value.year, value.month, value.day))
+    return sorted(days)
+
+def _compact_day(day):
+    """Collapse one day's events into one row per (user, customer, type)."""
+    columns = ['id', 'user_id', 'customer_id', 'activity_type', 'description', 'timestamp', 'event_count']
+    rows = db.session.query(*[getattr(CustomerActivity, name) for name in columns]).filter(
+        CustomerActivity.timestamp >= day,
+        CustomerActivity.timestamp < day + timedelta(days=1),
+        CustomerActivity.customer_id.isnot(None)
+    ).order_by(CustomerActivity.timestamp, CustomerActivity.id).all()
+    df = pd.DataFrame(rows, columns=columns)
+    df['event_count'] = df['event_count'].fillna(1).astype(int)
+
+    keys = ['user_id', 'customer_id', 'activity_type']
+    groups = df.groupby(keys, dropna=False, sort=False)
+    df = df[groups['id'].transform('size') > 1]
+    if df.empty:
+        return 0, 0
+
+    summary = df.groupby(keys, dropna=False, sort=False).agg(
+        description=('description', 'last'),
+        timestamp=('timestamp', 'last'),
+        first=('timestamp', 'first'),
+        event_count=('event_count', 'sum')
+    ).reset_index()
+    summaries = [{
+        'user_id': None if pd.isna(row.user_id) else int(row.user_id),
+        'customer_id': None if pd.isna(row.customer_id) else int(row.customer_id),
+        'activity_type': row.activity_type,
+        'description': row.description,
+        'timestamp': row.timestamp.to_pydatetime(),
+        'event_count': int(row.event_count),
+        'activity_metadata': {'compacted': True, 'first': row.first.isoformat()}
+    } for row in summary.itertuples(index=False)]
+
+    ids = df['id'].tolist()
+    for start in range(0, len(ids), _DELETE_CHUNK_SIZE):
+        db.session.execute(delete(CustomerActivity).where(
+            CustomerActivity.id.in_(ids[start:start + _DELETE_CHUNK_SIZE])))
+    db.session.execute(insert(CustomerActivity.__table__), summaries)
+    db.session.commit()
+    return len(ids), len(summaries)
+
+def compact_activity(compact_after_days, retention_days, now=None):
+    """
+    Apply the activity retention policy.
+
+    Events older than `retention_days` are deleted. Events older than
+    `compact_after_days` are collapsed per day into one row per customer
+    and activity type, keeping the latest description and timestamp and
+    summing event_count, so hourly rescoring leaves one 'prediction' row
+    per customer and day. Each day is compacted in its own transaction.
+    Events without a customer (deletes, and the history of deleted
+    customers) are never compacted, so their metadata survives until
+    retention removes them.
+
+    Returns:
+        dict: purged, compacted (rows removed) and summaries (rows written)
+    """
+    now = now or datetime.utcnow()
+    stats = {'purged': purge_activity(retention_days, now=now), 'compacted': 0, 'summaries': 0}
+    cutoff = now - timedelta(days=compact_after_days)
+    # Whole days only, so a day is never compacted while it is still filling up
+    cutoff = datetime(cutoff.year, cutoff.month, cutoff.day)
+    start = now - timedelta(days=retention_days)
+    for day in _days_to_compact(start, cutoff):
+        try:
+            compacted, summaries = _compact_day(day)
+        except Exception as e:
+            print(f"Error compacting activity for {day:%Y-%m-%d}: {str(e)}")
+            db.session.rollback()
+            continue
+        stats['compacted'] += compacted
+        stats['summaries'] += summaries
+    return stats
@@ -0,0 +1,234 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, select, update, insert, delete, func, case, literal, and_
+from sqlalchemy.orm import Session
+from sqlalchemy.inspection import inspect
+from .. import db
+from ..models import Customer, CustomerAggregate
+
+# Customer attributes the aggregates depend on
+TRACKED_ATTRIBUTES = ('user_id', 'churn_score', 'churn_prediction', 'location', 'customer_segment')
+
+# Additive counters of a CustomerAggregate row
+COUNTERS = ('customers', 'scored', 'score_sum', 'high_risk', 'medium_risk', 'churned')
+
+HIGH_RISK_SCORE = 0.7
+MEDIUM_RISK_SCORE = 0.4
+
+# Ids per IN (...) when reading previous customer values
+_ID_CHUNK_SIZE = 500
+
+def _contribution(row):
+    """The counters one customer adds to each of its aggregate groups."""
+    score = row.get('churn_score')
+    scored = score is not None
+    return (
+        1,
+        1 if scored else 0,
+        score if scored else 0.0,
+        1 if scored and score > HIGH_RISK_SCORE else 0,
+        1 if scored and MEDIUM_RISK_SCORE < score <= HIGH_RISK_SCORE else 0,
+        1 if row.get('churn_prediction') else 0
+    )
+
+class AggregateDelta:
+    """Net counter changes per (user_id, dimension, group_key), applied in one go."""
+
+    def __init__(self):
+        self.changes = defaultdict(lambda: [0] * len(COUNTERS))
+
+    def add(self, row, sign=1):
+        """Count a customer (a mapping of TRACKED_ATTRIBUTES) in, or out with sign=-1."""
+        user_id = row.get('user_id')
+        if user_id is None:
+            return
+        contribution = _contribution(row)
+        for key in ((user_id, 'total', ''),
+                    (user_id, 'segment', row.get('customer_segment') or ''),
+                    (user_id, 'location', row.get('location') or '')):
+            counters = self.changes[key]
+            for index, value in enumerate(contribution):
+                counters[index] += sign * value
+
+    def remove(self, row):
+        self.add(row, sign=-1)
+
+    def apply(self, connection):
+        """Add the net changes to the aggregate table with atomic increments."""
+        now = datetime.utcnow()
+        rows = [
+            dict(zip(COUNTERS, counters), user_id=key[0], dimension=key[1], group_key=key[2], updated_at=now)
+            for key, counters in self.changes.items() if any(counters)
+        ]
+        if rows:
+            _upsert_increments(connection, rows)
+        self.changes.clear()
+
+def _upsert_increments(connection, rows):
+    table = CustomerAggregate.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table)
+        set_ = {name: table.c[name] + stmt.excluded[name] for name in COUNTERS}
+        set_['updated_at'] = stmt.excluded.updated_at
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'dimension', 'group_key'], set_=set_
+        ), rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.user_id == row['user_id'],
+                   table.c.dimension == row['dimension'],
+                   table.c.group_key == row['group_key'])
+            .values({name: table.c[name] + row[name] for name in COUNTERS}, updated_at=row['updated_at'])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+def tracked_rows(connection, ids):
+    """Current TRACKED_ATTRIBUTES of the given customers, keyed by id."""
+    columns = [Customer.id] + [getattr(Customer, name) for name in TRACKED_ATTRIBUTES]
+    ids = list(ids)
+    rows = {}
+    for start in range(0, len(ids), _ID_CHUNK_SIZE):
+        for row in connection.execute(select(*columns).where(Customer.id.in_(ids[start:start + _ID_CHUNK_SIZE]))):
+            rows[row.id] = {name: getattr(row, name) for name in TRACKED_ATTRIBUTES}
+    return rows
+
+def apply_customer_changes(connection, before=(), after=()):
+    """
+    Update the aggregates for customers written without the ORM unit of work.
+
+    Bulk statements (bulk_insert_mappings, bulk_update_mappings, ...) are not
+    seen by the flush hook, so code issuing them reports the affected rows
+    here, inside the same transaction.
+
+    Args:
+        connection: The session's connection (db.session.connection())
+        before (iterable of dict): Previous values of updated/deleted customers
+        after (iterable of dict): New values of inserted/updated customers
+    """
+    delta = AggregateDelta()
+    for row in before:
+        delta.remove(row)
+    for row in after:
+        delta.add(row)
+    delta.apply(connection)
+
+def _tracked_changed(state):
+    return any(state.attrs[name].history.has_changes() for name in TRACKED_ATTRIBUTES)
+
+def _update_aggregates_before_flush(session, flush_context, instances):
+    new = [obj for obj in session.new if isinstance(obj, Customer)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Customer) and obj.id is not None]
+    dirty = [obj for obj in session.dirty
+             if isinstance(obj, Customer) and obj.id is not None and _tracked_changed(inspect(obj))]
+    if not (new or deleted or dirty):
+        return
+
+    connection = session.connection()
+    previous = tracked_rows(connection, [obj.id for obj in deleted + dirty])
+    delta = AggregateDelta()
+    for obj in new:
+        delta.add({name: getattr(obj, name) for name in TRACKED_ATTRIBUTES})
+    for obj in deleted:
+        if obj.id in previous:
+            delta.remove(previous[obj.id])
+    for obj in dirty:
+        old = previous.get(obj.id)
+        if old is None:
+            continue
+        state = inspect(obj)
+        # Attributes that were never loaded cannot have changed
+        delta.remove(old)
+        delta.add({
+            name: old[name] if name in state.unloaded else getattr(obj, name)
+            for name in TRACKED_ATTRIBUTES
+        })
+    delta.apply(connection)
+
+def register_aggregate_events():
+    """Keep CustomerAggregate in step with ORM customer inserts, updates and deletes."""
+    if not event.contains(Session, 'before_flush', _update_aggregates_before_flush):
+        event.listen(Session, 'before_flush', _update_aggregates_before_flush)
+
+def rebuild_customer_aggregates(user_id=None):
+    """
+    Recompute the aggregates from the customer table, e.g. after raw SQL
+    writes. Commits the session.
+
+    Returns:
+        int: Number of aggregate rows written
+    """
+    table = CustomerAggregate.__table__
+    score = Customer.churn_score
+    counters = [
+        func.count(Customer.id),
+        func.count(score),
+        func.coalesce(func.sum(score), 0.0),
+        func.sum(case((score > HIGH_RISK_SCORE, 1), else_=0)),
+        func.sum(case((and_(score > MEDIUM_RISK_SCORE, score <= HIGH_RISK_SCORE), 1), else_=0)),
+        func.sum(case((Customer.churn_prediction.is_(True), 1), else_=0)),
+        func.now()
+    ]
+    columns = ['user_id', 'dimension', 'group_key'] + list(COUNTERS) + ['updated_at']
+
+    clear = delete(table)
+    if user_id is not None:
+        clear = clear.where(table.c.user_id == user_id)
+    db.session.execute(clear)
+
+    written = 0
+    for dimension, group_column in (('total', literal('')),
+                                    ('segment', func.coalesce(Customer.customer_segment, '')),
+                                    ('location', func.coalesce(Customer.location, ''))):
+        query = select(Customer.user_id, literal(dimension), group_column, *counters)
+        if user_id is not None:
+            query = query.where(Customer.user_id == user_id)
+        query = query.group_by(Customer.user_id, group_column)
+        written += db.session.execute(insert(table).from_select(columns, query)).rowcount or 0
+    db.session.commit()
+    return written
+
+def _stats_from_row(row):
+    scored = row.scored if row else 0
+    return {
+        'total_customers': row.customers if row else 0,
+        'scored_customers': scored,
+        'churned_customers': row.churned if row else 0,
+        'avg_churn_score': row.score_sum / scored if scored else 0,
+        'high_risk_customers': row.high_risk if row else 0,
+        'medium_risk_customers': row.medium_risk if row else 0,
+        'low_risk_customers': scored - row.high_risk - row.medium_risk if row else 0
+    }
+
+def get_churn_stats(user_id, breakdowns=False):
+    """
+    Headline churn numbers of a user's customers, read from the aggregates.
+
+    Args:
+        breakdowns (bool): Also return the same numbers per 'segments' and
+            'locations' (NULL values under None)
+
+    Returns:
+        dict: total/scored/churned/high/medium/low-risk counts and avg_churn_score
+    """
+    query = CustomerAggregate.query.filter_by(user_id=user_id)
+    if not breakdowns:
+        return _stats_from_row(query.filter_by(dimension='total').first())
+
+    rows = query.all()
+    total = next((row for row in rows if row.dimension == 'total'), None)
+    stats = _stats_from_row(total)
+    for dimension, key in (('segment', 'segments'), ('location', 'locations')):
+        stats[key] = {
+            row.group_key or None: _stats_from_row(row)
+            for row in rows if row.dimension == dimension and row.customers
+        }
+    return stats
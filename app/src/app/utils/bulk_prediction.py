@@ -0,0 +1,176 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+import pandas as pd
+from .. import db
+from ..models import Customer, CustomerHistory, HISTORY_FEATURES
+from .ml_models import score_batch
+from .churn_analysis import CHURN_PREDICTION_THRESHOLD, risk_factor_flags, segment_customers
+from .events import notify_customers_changed
+from .aggregates import apply_customer_changes
+
+# Customers predicted and written per batch/commit
+DEFAULT_PREDICTION_BATCH_SIZE = 5000
+
+_FEATURE_ATTRIBUTES = ['monthly_bill', 'total_usage_gb', 'subscription_length_months', 'age']
+
+# Previous values needed to move the customer out of its old aggregate buckets
+_AGGREGATE_ATTRIBUTES = ['churn_score', 'churn_prediction', 'customer_segment']
+
+_HISTORY_COLUMNS = ['customer_id', 'churn_score', 'prediction', 'risk_flags', 'created_at']
+
+def _history_rows(customers, scores, predictions, risk_flags, now, typed_features):
+    """CustomerHistory mappings for a batch, with features as JSON or typed columns."""
+    rows = []
+    for customer, score, prediction, flags in zip(customers, scores, predictions, risk_flags):
+        row = {
+            'customer_id': customer['id'],
+            'churn_score': score,
+            'prediction': prediction,
+            'risk_flags': flags,
+            'created_at': now
+        }
+        values = {name: customer[name] for name in HISTORY_FEATURES}
+        if typed_features:
+            row.update(values)
+        else:
+            row['features'] = values
+        rows.append(row)
+    return rows
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+def _copy_history(connection, rows, columns):
+    """Write history rows with COPY FROM STDIN on the session's psycopg2 connection."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row.get(name)) for name in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {CustomerHistory.__tablename__} ({', '.join(columns)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def insert_history(rows, typed_features=False):
+    """
+    Write CustomerHistory mappings in the current transaction.
+
+    On PostgreSQL with psycopg2 the rows are streamed with COPY; elsewhere
+    they go through bulk_insert_mappings (one executemany).
+    """
+    if not rows:
+        return
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        columns = _HISTORY_COLUMNS + (list(HISTORY_FEATURES) if typed_features else ['features'])
+        _copy_history(connection, rows, columns)
+    else:
+        db.session.bulk_insert_mappings(CustomerHistory, rows)
+
+def predict_customers(user_id=None, batch_size=DEFAULT_PREDICTION_BATCH_SIZE, typed_features=False,
+                      on_batch=None):
+    """
+    Predict churn for customers in id-ordered batches and record history.
+
+    Each batch is scored with one vectorized call; the churn prediction,
+    risk_flags bitmask and segment come from the vectorized rules in
+    utils.risk_rules. Customers are updated with one bulk UPDATE, their
+    CustomerHistory rows written with one bulk insert (COPY on PostgreSQL),
+    and the per-user aggregates adjusted in the same transaction.
+
+    Args:
+        user_id (int): Only predict this user's customers (all users if None)
+        batch_size (int): Customers per batch and commit
+        typed_features (bool): Store history features in typed columns
+            instead of the per-row features JSON
+        on_batch (callable): Called as on_batch(processed, failed) after each
+            batch, e.g. JobProgress.advance
+
+    Returns:
+        dict: predicted/failed counts, model_version, elapsed seconds and rows_per_sec
+    """
+    started = time.perf_counter()
+    stats = {'predicted': 0, 'failed': 0, 'model_version': None}
+    changed_users = set()
+
+    names = ['id', 'user_id'] + list(HISTORY_FEATURES) + _AGGREGATE_ATTRIBUTES
+    columns = [getattr(Customer, name) for name in names]
+    last_id = 0
+    while True:
+        query = db.session.query(*columns).filter(Customer.id > last_id)
+        if user_id is not None:
+            query = query.filter(Customer.user_id == user_id)
+        rows = query.order_by(Customer.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        before = [dict(zip(names, row)) for row in rows]
+        batch = pd.DataFrame(rows, columns=names)
+        try:
+            scores, model_version = score_batch(batch[_FEATURE_ATTRIBUTES], return_version=True)
+            predictions = (scores > CHURN_PREDICTION_THRESHOLD).tolist()
+            risk_flags = risk_factor_flags(batch).tolist()
+            segments = segment_customers(batch).tolist()
+            scores = scores.tolist()
+            now = datetime.utcnow()
+
+            db.session.bulk_update_mappings(Customer, [{
+                'id': customer_id,
+                'churn_score': score,
+                'churn_prediction': prediction,
+                'model_version': model_version,
+                'risk_flags': flags,
+                'risk_factors': None,
+                'customer_segment': segment,
+                'last_prediction_date': now
+            } for customer_id, score, prediction, flags, segment in zip(
+                batch['id'].tolist(), scores, predictions, risk_flags, segments)])
+            insert_history(_history_rows(before, scores, predictions, risk_flags, now, typed_features),
+                           typed_features=typed_features)
+
+            apply_customer_changes(
+                db.session.connection(),
+                before=before,
+                after=[dict(row, churn_score=score, churn_prediction=prediction, customer_segment=segment)
+                       for row, score, prediction, segment in zip(before, scores, predictions, segments)]
+            )
+            db.session.commit()
+        except Exception as e:
+            print(f"Error predicting customers {rows[0][0]}-{last_id}: {str(e)}")
+            db.session.rollback()
+            stats['failed'] += len(rows)
+            if on_batch:
+                on_batch(0, len(rows))
+            continue
+
+        stats['predicted'] += len(rows)
+        stats['model_version'] = model_version
+        changed_users.update(batch['user_id'].unique().tolist())
+        if on_batch:
+            on_batch(len(rows), 0)
+
+    if changed_users:
+        notify_customers_changed(changed_users)
+
+    elapsed = time.perf_counter() - started
+    stats['elapsed'] = elapsed
+    stats['rows_per_sec'] = stats['predicted'] / elapsed if elapsed > 0 else 0.0
+    return stats
@@ -0,0 +1,200 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func
+from .. import db
+from ..models import Customer
+from .events import on_customers_changed
+
+# Named caches created by init_caches, e.g. caches['dashboard']
+caches = {}
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after `ttl` seconds.
+
+    Keeps hit/miss/eviction counters so cache effectiveness can be monitored.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, namespace, maxsize=1024, ttl=60):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'size': size,
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+class RedisCache:
+    """
+    Redis-backed cache with the same interface as TTLCache.
+
+    Values are pickled and expire through Redis TTLs, so every worker process
+    shares one cache and invalidations are seen everywhere.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, client, namespace, ttl=60):
+        self.client = client
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        return f'churn:{self.namespace}:{key}'
+
+    def get(self, key, default=None):
+        value = self.client.get(self._key(key))
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.setex(self._key(key), int(self.ttl if ttl is None else ttl) or 1, pickle.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self._key('*')))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+def make_cache(app, namespace, ttl, maxsize=None):
+    """
+    Create a cache for `namespace`, shared through Redis when USE_REDIS is on
+    and the server answers, in-process otherwise.
+    """
+    maxsize = maxsize or app.config.get('CACHE_MAX_ENTRIES', 1024)
+    if app.config.get('USE_REDIS', False):
+        try:
+            import redis
+            client = redis.Redis.from_url(app.config['REDIS_URL'])
+            client.ping()
+            return RedisCache(client, namespace, ttl=ttl)
+        except Exception as e:
+            print(f"Warning: Redis cache unavailable for '{namespace}': {str(e)}")
+    return TTLCache(namespace, maxsize=maxsize, ttl=ttl)
+
+def init_caches(app):
+    """Create the application's named caches from configuration."""
+    caches['dashboard'] = make_cache(app, 'dashboard', ttl=app.config['DASHBOARD_CACHE_TTL'])
+    # Marks users with a queued trend snapshot rebuild
+    caches['trend_refresh'] = make_cache(app, 'trend_refresh', ttl=app.config['TRENDS_REFRESH_INTERVAL'])
+    caches['dynamic_analysis'] = make_cache(app, 'dynamic_analysis', ttl=app.config['ANALYSIS_CACHE_TTL'],
+                                            maxsize=app.config['ANALYSIS_CACHE_MAX_ENTRIES'])
+    # Per-user customer data versions, part of the key of derived results
+    caches['data_version'] = make_cache(app, 'data_version', ttl=app.config['DATA_VERSION_TTL'])
+    # Gzip-compressed series API bodies keyed by ETag
+    caches['series'] = make_cache(app, 'series', ttl=app.config['SERIES_CACHE_TTL'],
+                                  maxsize=app.config['SERIES_CACHE_MAX_ENTRIES'])
+    return caches
+
+def cache_stats():
+    """Hit/miss counters for every named cache."""
+    return {name: cache.stats() for name, cache in caches.items()}
+
+def _new_data_version():
+    return format(time.time_ns(), 'x')
+
+def _customer_fingerprint(user_id):
+    """
+    Count, newest id and newest updated_at of a user's customers, read from
+    the (user_id, id) and (user_id, updated_at) indexes. Every insert,
+    update and delete changes at least one of them.
+    """
+    count, last_id, last_update = db.session.query(
+        func.count(Customer.id), func.max(Customer.id), func.max(Customer.updated_at)
+    ).filter(Customer.user_id == user_id).one()
+    return f"{count}:{last_id}:{last_update.isoformat() if last_update else ''}"
+
+def customer_data_version(user_id):
+    """
+    Opaque token that changes whenever the user's customers change.
+
+    Tokens are never reused, so a version that expired from the cache can
+    not make results computed from older data look current again. An
+    in-process version cache only sees this process's bumps, so the token
+    then also carries a fingerprint of the user's customer rows, which
+    picks up writes made by other processes.
+    """
+    versions = caches.get('data_version')
+    if versions is None:
+        return None
+    version = versions.get(user_id)
+    if version is None:
+        version = _new_data_version()
+        versions.set(user_id, version)
+    if versions.backend == 'memory':
+        version = f'{version}:{_customer_fingerprint(user_id)}'
+    return version
+
+@on_customers_changed
+def bump_customer_data_version(user_ids):
+    versions = caches.get('data_version')
+    if versions is not None:
+        version = _new_data_version()
+        for user_id in user_ids:
+            versions.set(user_id, version)
@@ -1,7 +1,10 @@
 import random
 from datetime import datetime, timedelta
 import numpy as np
-from collections import defaultdict
+from ..models import CustomerHistory
+from .customer_snapshot import as_snapshot
+from .ml_models import score_batch
+from .risk_rules import risk_rules, RULE_COLUMNS
 
 def will_churn(customer):
     """Dummy function that randomly predicts churn based on customer characteristics"""
@@ -24,118 +27,133 @@ def will_churn(customer):
     
     return random.random() < base_prob, base_prob
 
+# Churn score above which a customer is predicted to churn
+CHURN_PREDICTION_THRESHOLD = 0.5
+
+def _customer_columns(customers):
+    return {name: [getattr(c, name) for c in customers] for name in RULE_COLUMNS}
+
+def risk_factor_flags(columns):
+    """
+    risk_flags bitmask per customer under the active risk rules.
+
+    Args:
+        columns (DataFrame or dict of lists): age, subscription_length_months,
+            monthly_bill and total_usage_gb
+
+    Returns:
+        ndarray: int64 bitmasks; see risk_rules.DEFAULT_RULES for the bits
+    """
+    return risk_rules.get().flags(columns)
+
+def describe_risk_flags(flags):
+    """Risk factor dicts (factor, description, severity) set in a risk_flags bitmask."""
+    return risk_rules.get().describe(flags)
+
+def segment_customers(columns):
+    """Value segment per customer under the active segment rules."""
+    return risk_rules.get().segment(columns)
+
 def identify_risk_factors(customer):
     """Identify risk factors for churn"""
-    risk_factors = []
-    
-    if customer.subscription_length_months < 12:
-        risk_factors.append({
-            'factor': 'New Customer',
-            'description': 'Customers with less than 12 months of subscription are more likely to churn',
-            'severity': 'high'
-        })
-    
-    if customer.monthly_bill > 100:
-        risk_factors.append({
-            'factor': 'High Monthly Bill',
-            'description': 'Customers with high monthly bills may be more price-sensitive',
-            'severity': 'medium'
-        })
-    
-    if customer.total_usage_gb < 100:
-        risk_factors.append({
-            'factor': 'Low Usage',
-            'description': 'Customers with low data usage may not be getting value from the service',
-            'severity': 'medium'
-        })
-    
-    if customer.age > 60:
-        risk_factors.append({
-            'factor': 'Senior Customer',
-            'description': 'Older customers may be less tech-savvy and more likely to churn',
-            'severity': 'low'
-        })
-    
-    return risk_factors
+    return describe_risk_flags(risk_factor_flags(_customer_columns([customer]))[0])
 
 def segment_customer(customer):
     """Segment customer based on value and risk"""
-    if customer.monthly_bill > 100 and customer.total_usage_gb > 200:
-        return 'High-value'
-    elif customer.monthly_bill > 50 and customer.total_usage_gb > 100:
-        return 'Medium-value'
-    else:
-        return 'Low-value'
+    return str(segment_customers(_customer_columns([customer]))[0])
+
+# Group label for customers with a NULL attribute
+UNKNOWN_GROUP = 'Unknown'
+
+def _churn_by_group(codes, labels, churned):
+    """Total and churned customers per group; codes index labels, -1 is unknown."""
+    bins = codes + 1
+    totals = np.bincount(bins, minlength=len(labels) + 1)
+    churns = np.bincount(bins, weights=churned, minlength=len(labels) + 1)
+    names = [UNKNOWN_GROUP] + list(labels)
+
+    groups = {}
+    # Known groups first, the unknown group last
+    for index in [i for i in np.flatnonzero(totals) if i] + ([0] if totals[0] else []):
+        group = groups.setdefault(names[index], {'total': 0, 'churn': 0})
+        group['total'] += int(totals[index])
+        group['churn'] += int(churns[index])
+    return groups
+
+def _range_codes(values, width, suffix=''):
+    """Bucket values into fixed-width ranges labelled like "30-39"; NaN gets code -1."""
+    known = ~np.isnan(values)
+    starts = (np.floor(values[known] / width) * width).astype(np.int64)
+    unique_starts, inverse = np.unique(starts, return_inverse=True)
+    codes = np.full(len(values), -1, dtype=np.int64)
+    codes[known] = inverse
+    labels = [f"{start}-{start + width - 1}{suffix}" for start in unique_starts.tolist()]
+    return codes, labels
 
 def analyze_customer_base(customers):
-    """Analyze the entire customer base for churn patterns"""
-    if not customers:
+    """
+    Analyze the entire customer base for churn patterns.
+
+    Every breakdown is a bincount over the customers' columns, so the work
+    is a handful of vectorized passes however many customers there are.
+    Customers with a NULL age, gender, location, segment or subscription
+    length are counted in an 'Unknown' group.
+
+    Args:
+        customers (CustomerSnapshot or list of Customer): Customers to analyze
+    """
+    snapshot = as_snapshot(customers)
+    total_customers = len(snapshot)
+    if not total_customers:
         return None
-    
+
+    churned = (snapshot.churn_prediction == 1).astype(float)
+
     # Basic metrics
-    total_customers = len(customers)
-    churn_rate = sum(1 for c in customers if c.churn_prediction) / total_customers
-    avg_monthly_bill = sum(c.monthly_bill for c in customers) / total_customers
-    avg_usage = sum(c.total_usage_gb for c in customers) / total_customers
-    
+    churn_rate = churned.sum() / total_customers
+    avg_monthly_bill = np.nansum(snapshot.monthly_bill) / total_customers
+    avg_usage = np.nansum(snapshot.total_usage_gb) / total_customers
+
     # Segment distribution
-    segments = defaultdict(int)
-    for c in customers:
-        segments[c.customer_segment] += 1
-    segment_distribution = {k: v/total_customers for k, v in segments.items()}
-    
-    # Location analysis
-    location_analysis = defaultdict(lambda: {'total': 0, 'churn': 0})
-    for c in customers:
-        location_analysis[c.location]['total'] += 1
-        if c.churn_prediction:
-            location_analysis[c.location]['churn'] += 1
-    
-    # Age group analysis
-    age_groups = defaultdict(lambda: {'total': 0, 'churn': 0})
-    for c in customers:
-        age_group = (c.age // 10) * 10
-        age_groups[f"{age_group}-{age_group+9}"]['total'] += 1
-        if c.churn_prediction:
-            age_groups[f"{age_group}-{age_group+9}"]['churn'] += 1
-    
-    # Gender analysis
-    gender_analysis = defaultdict(lambda: {'total': 0, 'churn': 0})
-    for c in customers:
-        gender_analysis[c.gender]['total'] += 1
-        if c.churn_prediction:
-            gender_analysis[c.gender]['churn'] += 1
-    
-    # Subscription length analysis
-    sub_length_groups = defaultdict(lambda: {'total': 0, 'churn': 0})
-    for c in customers:
-        group = (c.subscription_length_months // 6) * 6
-        sub_length_groups[f"{group}-{group+5} months"]['total'] += 1
-        if c.churn_prediction:
-            sub_length_groups[f"{group}-{group+5} months"]['churn'] += 1
-    
+    segments = _churn_by_group(snapshot.customer_segment, snapshot.categories['customer_segment'], churned)
+    segment_distribution = {k: v['total'] / total_customers for k, v in segments.items()}
+
+    age_codes, age_labels = _range_codes(snapshot.age, 10)
+    sub_codes, sub_labels = _range_codes(snapshot.subscription_length_months, 6, ' months')
+
     return {
         'total_customers': total_customers,
-        'churn_rate': churn_rate,
-        'avg_monthly_bill': avg_monthly_bill,
-        'avg_usage': avg_usage,
+        'churn_rate': float(churn_rate),
+        'avg_monthly_bill': float(avg_monthly_bill),
+        'avg_usage': float(avg_usage),
         'segment_distribution': segment_distribution,
-        'location_analysis': location_analysis,
-        'age_group_analysis': age_groups,
-        'gender_analysis': gender_analysis,
-        'subscription_length_analysis': sub_length_groups
+        'location_analysis': _churn_by_group(snapshot.location, snapshot.categories['location'], churned),
+        'age_group_analysis': _churn_by_group(age_codes, age_labels, churned),
+        'gender_analysis': _churn_by_group(snapshot.gender, snapshot.categories['gender'], churned),
+        'subscription_length_analysis': _churn_by_group(sub_codes, sub_labels, churned)
     }
 
 def predict_customer_churn(customer):
-    """Predict churn for a single customer and store the analysis"""
-    prediction, score = will_churn(customer)
-    risk_factors = identify_risk_factors(customer)
-    customer_segment = segment_customer(customer)
+    """
+    Predict churn for a single customer and store the analysis.
+
+    Uses the same model and rules as bulk_prediction.predict_customers,
+    which should be preferred for more than a handful of customers.
+
+    Returns:
+        CustomerHistory: Unsaved history row for the prediction
+    """
+    score, model_version = score_batch(_customer_columns([customer]), return_version=True)
+    score = float(score[0])
+    prediction = score > CHURN_PREDICTION_THRESHOLD
+    risk_flags = int(risk_factor_flags(_customer_columns([customer]))[0])
     
     customer.churn_score = score
     customer.churn_prediction = prediction
-    customer.risk_factors = risk_factors
-    customer.customer_segment = customer_segment
+    customer.model_version = model_version
+    customer.risk_flags = risk_flags
+    customer.risk_factors = None  # Superseded by risk_flags
+    customer.customer_segment = segment_customer(customer)
     customer.last_prediction_date = datetime.utcnow()
     
     # Store history
@@ -151,7 +169,7 @@ def predict_customer_churn(customer):
             'monthly_bill': customer.monthly_bill,
             'total_usage_gb': customer.total_usage_gb
         },
-        risk_factors=risk_factors
+        risk_flags=risk_flags
     )
     
-    return history 
\ No newline at end of file
+    return history
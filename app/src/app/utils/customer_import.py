@@ -0,0 +1,439 @@
+import os
+import time
+from itertools import islice
+import pandas as pd
+from .. import db
+from ..models import Customer, CustomerActivity
+from .ml_models import score_batch
+from .events import notify_customers_changed
+from .aggregates import tracked_rows, apply_customer_changes
+
+# Rows written per bulk INSERT/UPDATE and per commit
+DEFAULT_IMPORT_BATCH_SIZE = 1000
+
+# Rows read from an import file at a time when streaming
+DEFAULT_IMPORT_CHUNK_SIZE = 10000
+
+# Rows per range when an import is split across parallel tasks
+DEFAULT_PARALLEL_CHUNK_ROWS = 50000
+
+# customer_ids per IN (...) when looking up existing customers
+_LOOKUP_CHUNK_SIZE = 500
+
+# Define column name mappings for common variations
+COLUMN_MAPPINGS = {
+    'customer_id': ['customer_id', 'customerid', 'id', 'customer', 'client_id', 'CustomerID'],
+    'name': ['name', 'customer_name', 'full_name', 'client_name', 'Name'],
+    'age': ['age', 'customer_age', 'Age'],
+    'gender': ['gender', 'sex', 'Gender'],
+    'location': ['location', 'city', 'region', 'area', 'Location'],
+    'subscription_length_months': ['subscription_length_months', 'subscription_length', 'months_subscribed', 'tenure', 'Subscription_Length_Months'],
+    'monthly_bill': ['monthly_bill', 'monthly_charges', 'bill_amount', 'monthly_payment', 'Monthly_Bill'],
+    'total_usage_gb': ['total_usage_gb', 'data_usage', 'usage_gb', 'total_data', 'Total_Usage_GB']
+}
+
+REQUIRED_COLUMNS = ['customer_id', 'name', 'age', 'gender', 'location',
+                    'subscription_length_months', 'monthly_bill', 'total_usage_gb']
+
+def normalize_columns(df):
+    """Rename known column name variations to the standard names."""
+    renames = {}
+    for standard_name, variations in COLUMN_MAPPINGS.items():
+        for variation in variations:
+            if variation in df.columns:
+                renames[variation] = standard_name
+                break
+    return df.rename(columns=renames)
+
+def missing_required_columns(df):
+    """Return the required columns that are not present in df."""
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+def clean_customer_frame(df, age_fill=None):
+    """
+    Clean an import frame with normalized column names.
+
+    Numeric columns are coerced with the same defaults as manual entry,
+    text columns are stripped, rows without a customer_id are dropped and
+    only the last occurrence of a repeated customer_id is kept.
+
+    Args:
+        age_fill (float): Value for missing ages. Chunked imports pass
+            file_age_median so every chunk fills the same value; by default
+            the frame's own median is used
+    """
+    df = df.copy()
+
+    # Clean and validate numeric columns
+    for col in ['age', 'subscription_length_months', 'monthly_bill', 'total_usage_gb']:
+        # Convert to numeric, replacing non-numeric values with NaN
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['age'] = df['age'].fillna(df['age'].median() if age_fill is None else age_fill).round()
+    df['subscription_length_months'] = df['subscription_length_months'].fillna(0).astype(int)
+    df['monthly_bill'] = df['monthly_bill'].fillna(0.0).astype(float)
+    df['total_usage_gb'] = df['total_usage_gb'].fillna(0.0).astype(float)
+
+    # Clean text columns
+    for col in ['name', 'gender', 'location']:
+        df[col] = df[col].fillna('').astype(str).str.strip()
+
+    # Skip rows with empty customer_id
+    df['customer_id'] = df['customer_id'].fillna('').astype(str).str.strip()
+    df = df[df['customer_id'] != '']
+    df = df.drop_duplicates(subset='customer_id', keep='last')
+
+    # Ages stay NULL when the file has no ages at all
+    df['age'] = df['age'].astype('Int64').astype(object).where(df['age'].notna(), None)
+    return df
+
+def _raw_column(header, standard_name):
+    """The header column normalize_columns would rename to standard_name, or None."""
+    return next((name for name in COLUMN_MAPPINGS[standard_name] if name in header), None)
+
+def _text_id_dtype(header):
+    """
+    read_csv/read_excel dtype that keeps the customer_id column as text.
+
+    Chunks are type-inferred separately, so without it numeric ids come out
+    as '5' in one chunk and '5.0' in another with a blank id.
+    """
+    column = _raw_column(header, 'customer_id')
+    return {column: str} if column is not None else None
+
+def file_age_median(path):
+    """
+    Median age of an import file, the value clean_customer_frame fills
+    missing ages with. Only the age column is read.
+
+    Returns:
+        float: The median, or None if the file has no ages
+    """
+    file_ext = os.path.splitext(path)[1].lower()
+    if file_ext == '.csv':
+        header = list(pd.read_csv(path, nrows=0).columns)
+    elif file_ext == '.xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            header = list(next(workbook.active.iter_rows(max_row=1, values_only=True), ()))
+        finally:
+            workbook.close()
+    elif file_ext == '.xls':
+        header = list(pd.read_excel(path, nrows=0).columns)
+    else:
+        raise ValueError(f'Unsupported file type: {file_ext}')
+
+    column = _raw_column(header, 'age')
+    if column is None:
+        return None
+
+    if file_ext == '.csv':
+        ages = pd.read_csv(path, usecols=[column])[column]
+    elif file_ext == '.xlsx':
+        index = header.index(column) + 1
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            ages = pd.Series([row[0] for row in workbook.active.iter_rows(
+                min_row=2, min_col=index, max_col=index, values_only=True)], dtype=object)
+        finally:
+            workbook.close()
+    else:
+        ages = pd.read_excel(path, usecols=[column])[column]
+
+    median = pd.to_numeric(ages, errors='coerce').median()
+    return None if pd.isna(median) else float(median)
+
+def iter_file_chunks(path, chunk_size=DEFAULT_IMPORT_CHUNK_SIZE, skip_rows=0):
+    """
+    Stream an import file as DataFrames of at most chunk_size rows.
+
+    CSV files are read with pandas' chunked reader and .xlsx files row by row
+    through openpyxl's read-only mode, so memory stays bounded by the chunk
+    size. Legacy .xls files cannot be streamed and are read whole, then
+    sliced into chunks.
+
+    Args:
+        path (str): CSV or Excel file with a header row
+        chunk_size (int): Maximum rows per chunk
+        skip_rows (int): Data rows to skip, e.g. a job's checkpoint
+
+    Yields:
+        tuple: (offset, DataFrame) where offset is the index of the chunk's
+        first data row in the file
+    """
+    file_ext = os.path.splitext(path)[1].lower()
+    offset = skip_rows
+
+    if file_ext == '.csv':
+        header = list(pd.read_csv(path, nrows=0).columns)
+        reader = pd.read_csv(path, chunksize=chunk_size, skiprows=range(1, skip_rows + 1),
+                             dtype=_text_id_dtype(header))
+        for chunk in reader:
+            yield offset, chunk
+            offset += len(chunk)
+
+    elif file_ext == '.xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            rows = islice(rows, skip_rows, None)
+            while True:
+                block = list(islice(rows, chunk_size))
+                if not block:
+                    break
+                # Object columns keep cell values as read, so ids are not
+                # turned into floats by a blank cell in the block
+                yield offset, pd.DataFrame(block, columns=header, dtype=object)
+                offset += len(block)
+        finally:
+            workbook.close()
+
+    elif file_ext == '.xls':
+        header = list(pd.read_excel(path, nrows=0).columns)
+        df = pd.read_excel(path, dtype=_text_id_dtype(header))
+        for start in range(skip_rows, len(df), chunk_size):
+            yield start, df.iloc[start:start + chunk_size]
+
+    else:
+        raise ValueError(f'Unsupported file type: {file_ext}')
+
+def count_file_rows(path):
+    """
+    Count the data rows of an import file without parsing it, or None.
+
+    CSV rows are counted as newlines (quoted multi-line fields make this an
+    estimate); .xlsx uses the sheet's recorded dimensions.
+    """
+    file_ext = os.path.splitext(path)[1].lower()
+    if file_ext == '.csv':
+        lines = 0
+        last = b'\n'
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                lines += block.count(b'\n')
+                last = block[-1:]
+        if last != b'\n':
+            lines += 1  # Final line without a trailing newline
+        return max(0, lines - 1)
+    if file_ext == '.xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max(0, max_row - 1) if max_row else None
+    return None
+
+def plan_row_ranges(path, rows_per_range=DEFAULT_PARALLEL_CHUNK_ROWS):
+    """
+    Split an import file into row ranges that can be imported independently.
+
+    CSV ranges carry the byte offset of their first row, found in the same
+    newline scan count_file_rows does (one record per line is assumed), so
+    a range is read without parsing the rows before it. .xlsx ranges are
+    read by row number. Legacy .xls files cannot be split.
+
+    Returns:
+        list: dicts with start, stop (data row indexes, stop exclusive) and
+        offset (byte offset for CSV, else None); None for .xls files
+    """
+    file_ext = os.path.splitext(path)[1].lower()
+    if file_ext == '.csv':
+        offsets = []
+        rows = -1  # The header line is not a data row
+        position = 0
+        last = b'\n'
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                start = 0
+                while True:
+                    newline = block.find(b'\n', start)
+                    if newline == -1:
+                        break
+                    rows += 1
+                    if rows % rows_per_range == 0:
+                        # Byte offset of data row `rows`
+                        offsets.append(position + newline + 1)
+                    start = newline + 1
+                position += len(block)
+                last = block[-1:]
+        if last != b'\n':
+            rows += 1  # Final line without a trailing newline
+        total = max(0, rows)
+        return [
+            {'start': start, 'stop': min(start + rows_per_range, total), 'offset': offsets[index]}
+            for index, start in enumerate(range(0, total, rows_per_range))
+        ]
+    if file_ext == '.xlsx':
+        total = count_file_rows(path) or 0
+        return [
+            {'start': start, 'stop': min(start + rows_per_range, total), 'offset': None}
+            for start in range(0, total, rows_per_range)
+        ]
+    return None
+
+def iter_row_range(path, start, stop, offset=None, chunk_size=DEFAULT_IMPORT_CHUNK_SIZE):
+    """
+    Stream data rows [start, stop) of an import file, like iter_file_chunks.
+
+    Args:
+        offset (int): Byte offset of row `start` in a CSV file, from
+            plan_row_ranges; without it the preceding rows are skipped
+
+    Yields:
+        tuple: (offset, DataFrame) as iter_file_chunks does
+    """
+    file_ext = os.path.splitext(path)[1].lower()
+    if file_ext == '.csv' and offset is not None:
+        header = list(pd.read_csv(path, nrows=0).columns)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            reader = pd.read_csv(f, header=None, names=header, nrows=stop - start, chunksize=chunk_size,
+                                 dtype=_text_id_dtype(header))
+            row = start
+            for chunk in reader:
+                yield row, chunk
+                row += len(chunk)
+        return
+
+    for row, chunk in iter_file_chunks(path, chunk_size=chunk_size, skip_rows=start):
+        if row >= stop:
+            break
+        yield row, chunk.iloc[:stop - row]
+
+def fetch_customer_ids(user_id, customer_ids=None):
+    """
+    Map customer_id to primary key for a user's customers.
+
+    Args:
+        customer_ids (iterable): Only look these up (all customers if None),
+            e.g. the ids of one import chunk
+    """
+    query = db.session.query(Customer.customer_id, Customer.id).filter(Customer.user_id == user_id)
+    if customer_ids is None:
+        return dict(query.all())
+
+    customer_ids = list(customer_ids)
+    found = {}
+    for start in range(0, len(customer_ids), _LOOKUP_CHUNK_SIZE):
+        found.update(query.filter(
+            Customer.customer_id.in_(customer_ids[start:start + _LOOKUP_CHUNK_SIZE])
+        ).all())
+    return found
+
+def bulk_upsert_customers(df, user_id, source, file_type, batch_size=DEFAULT_IMPORT_BATCH_SIZE,
+                          existing_ids=None, on_batch=None):
+    """
+    Insert or update a cleaned customer frame for one user.
+
+    Existing customer_ids are fetched in a single query, the whole frame is
+    scored in one vectorized pass, and customers plus their activity records
+    are written with bulk statements, committing every batch_size rows
+    together with the matching change to the per-user aggregates.
+    A batch that fails is rolled back and counted as failed without
+    affecting batches already committed.
+
+    Args:
+        df (DataFrame): Output of clean_customer_frame
+        user_id (int): Owner of the imported customers
+        source (str): Recorded in each activity's metadata
+        file_type (str): Recorded in each activity's metadata
+        batch_size (int): Rows per bulk write and commit
+        existing_ids (dict): Result of fetch_customer_ids, reused across
+            calls when importing a file chunk by chunk; updated in place
+        on_batch (callable): Called as on_batch(processed, failed) after each
+            batch, e.g. JobProgress.advance
+
+    Returns:
+        dict: inserted/updated/failed counts, elapsed seconds and rows_per_sec
+    """
+    started = time.perf_counter()
+    stats = {'rows': len(df), 'inserted': 0, 'updated': 0, 'failed': 0}
+
+    if existing_ids is None:
+        existing_ids = fetch_customer_ids(user_id)
+
+    scores, model_version = score_batch(df, return_version=True)
+    df = df.assign(churn_score=scores)
+    metadata = {'source': source, 'file_type': file_type}
+
+    columns = ['customer_id', 'name', 'age', 'gender', 'location',
+               'subscription_length_months', 'monthly_bill', 'total_usage_gb', 'churn_score']
+    for start in range(0, len(df), batch_size):
+        records = df.iloc[start:start + batch_size][columns].to_dict('records')
+        inserts, updates = [], []
+        for record in records:
+            record['model_version'] = model_version
+            if record['customer_id'] in existing_ids:
+                record['id'] = existing_ids[record['customer_id']]
+                updates.append(record)
+            else:
+                record['user_id'] = user_id
+                inserts.append(record)
+
+        try:
+            # Values before the update, to move customers between aggregate groups
+            previous = tracked_rows(db.session.connection(), [r['id'] for r in updates])
+            if updates:
+                db.session.bulk_update_mappings(Customer, updates)
+            if inserts:
+                db.session.bulk_insert_mappings(Customer, inserts)
+                new_ids = dict(
+                    db.session.query(Customer.customer_id, Customer.id)
+                    .filter(Customer.user_id == user_id,
+                            Customer.customer_id.in_([r['customer_id'] for r in inserts]))
+                    .all()
+                )
+            else:
+                new_ids = {}
+
+            activities = [{
+                'user_id': user_id,
+                'customer_id': r['id'],
+                'activity_type': 'update',
+                'description': 'Customer updated from file import',
+                'activity_metadata': metadata
+            } for r in updates] + [{
+                'user_id': user_id,
+                'customer_id': new_ids[r['customer_id']],
+                'activity_type': 'import',
+                'description': 'Customer imported from file',
+                'activity_metadata': metadata
+            } for r in inserts]
+            db.session.bulk_insert_mappings(CustomerActivity, activities)
+            apply_customer_changes(
+                db.session.connection(),
+                before=previous.values(),
+                after=[dict(previous[r['id']], churn_score=r['churn_score'], location=r['location'])
+                       for r in updates if r['id'] in previous] +
+                      [{'user_id': user_id, 'churn_score': r['churn_score'], 'location': r['location']}
+                       for r in inserts]
+            )
+            db.session.commit()
+        except Exception as e:
+            print(f"Error importing rows {start}-{start + len(records) - 1}: {str(e)}")
+            db.session.rollback()
+            stats['failed'] += len(records)
+            if on_batch:
+                on_batch(0, len(records))
+            continue
+
+        existing_ids.update(new_ids)
+        stats['inserted'] += len(inserts)
+        stats['updated'] += len(updates)
+        if on_batch:
+            on_batch(len(records), 0)
+
+    # Bulk statements bypass the ORM change tracking
+    if stats['inserted'] or stats['updated']:
+        notify_customers_changed({user_id})
+
+    elapsed = time.perf_counter() - started
+    stats['elapsed'] = elapsed
+    stats['rows_per_sec'] = stats['rows'] / elapsed if elapsed > 0 else 0.0
+    return stats
@@ -0,0 +1,171 @@
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+from .. import db
+from ..models import Customer
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Columns needed to render a listing row; risk_factors and other wide
+# columns are never loaded
+LISTING_COLUMNS = (
+    Customer.id,
+    Customer.customer_id,
+    Customer.name,
+    Customer.age,
+    Customer.location,
+    Customer.subscription_length_months,
+    Customer.monthly_bill,
+    Customer.total_usage_gb,
+    Customer.churn_score,
+    Customer.customer_segment
+)
+
+RISK_FILTERS = {
+    'high': Customer.churn_score > 0.7,
+    'medium': and_(Customer.churn_score > 0.4, Customer.churn_score <= 0.7),
+    'low': Customer.churn_score <= 0.4
+}
+
+SORT_FIELDS = ('id', 'churn_score')
+
+# Customers loaded per query when exporting a user's whole customer list
+EXPORT_BATCH_SIZE = 1000
+
+def parse_listing_args(args):
+    """
+    Validate listing query arguments.
+
+    Raises:
+        ValueError: On an unknown sort, order or risk bucket
+    """
+    sort = args.get('sort') or 'id'
+    order = args.get('order') or ('desc' if sort == 'churn_score' else 'asc')
+    risk = args.get('risk') or None
+    if sort not in SORT_FIELDS:
+        raise ValueError(f'sort must be one of: {", ".join(SORT_FIELDS)}')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    if risk is not None and risk not in RISK_FILTERS:
+        raise ValueError(f'risk must be one of: {", ".join(RISK_FILTERS)}')
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+
+    return {
+        'sort': sort,
+        'order': order,
+        'risk': risk,
+        'segment': args.get('segment') or None,
+        'location': args.get('location') or None,
+        'after': args.get('after') or None,
+        'limit': max(1, min(limit, MAX_PAGE_SIZE))
+    }
+
+def _score_cursor_filter(after, descending):
+    """Rows after a "score,id" cursor; unscored customers sort last."""
+    try:
+        score, last_id = after.rsplit(',', 1)
+        last_id = int(last_id)
+        score = None if score == 'null' else float(score)
+    except ValueError:
+        raise ValueError(f'Invalid cursor: {after}')
+
+    if score is None:
+        id_after = Customer.id < last_id if descending else Customer.id > last_id
+        return and_(Customer.churn_score.is_(None), id_after)
+
+    if descending:
+        beyond = or_(Customer.churn_score < score,
+                     and_(Customer.churn_score == score, Customer.id < last_id))
+    else:
+        beyond = or_(Customer.churn_score > score,
+                     and_(Customer.churn_score == score, Customer.id > last_id))
+    return or_(beyond, Customer.churn_score.is_(None))
+
+def list_customers(user_id, sort='id', order='asc', risk=None, segment=None, location=None,
+                   after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Load one keyset-paginated page of a user's customers.
+
+    Returns:
+        tuple: (customers, next_cursor) where next_cursor is None on the last page
+    """
+    descending = order == 'desc'
+    query = Customer.query.options(load_only(*LISTING_COLUMNS)).filter(Customer.user_id == user_id)
+
+    if risk:
+        query = query.filter(RISK_FILTERS[risk])
+    if segment:
+        query = query.filter(Customer.customer_segment == segment)
+    if location:
+        query = query.filter(Customer.location == location)
+
+    if sort == 'churn_score':
+        if after:
+            query = query.filter(_score_cursor_filter(after, descending))
+        score_order = Customer.churn_score.desc() if descending else Customer.churn_score.asc()
+        id_order = Customer.id.desc() if descending else Customer.id.asc()
+        query = query.order_by(Customer.churn_score.is_(None), score_order, id_order)
+    else:
+        if after:
+            try:
+                last_id = int(after)
+            except ValueError:
+                raise ValueError(f'Invalid cursor: {after}')
+            query = query.filter(Customer.id < last_id if descending else Customer.id > last_id)
+        query = query.order_by(Customer.id.desc() if descending else Customer.id.asc())
+
+    customers = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(customers) > limit:
+        customers = customers[:limit]
+        last = customers[-1]
+        if sort == 'churn_score':
+            score = 'null' if last.churn_score is None else repr(last.churn_score)
+            next_cursor = f'{score},{last.id}'
+        else:
+            next_cursor = str(last.id)
+    return customers, next_cursor
+
+def listing_filter_choices(user_id):
+    """Distinct locations and segments of a user's customers, for filter menus."""
+    locations = db.session.query(Customer.location).filter(
+        Customer.user_id == user_id, Customer.location.isnot(None)
+    ).distinct().order_by(Customer.location).all()
+    segments = db.session.query(Customer.customer_segment).filter(
+        Customer.user_id == user_id, Customer.customer_segment.isnot(None)
+    ).distinct().order_by(Customer.customer_segment).all()
+    return [row[0] for row in locations], [row[0] for row in segments]
+
+def iter_customers(user_id, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield all of a user's customers in id order, loading the listing
+    columns in keyset batches so memory stays bounded by one batch.
+    """
+    last_id = 0
+    while True:
+        batch = Customer.query.options(load_only(*LISTING_COLUMNS)).filter(
+            Customer.user_id == user_id,
+            Customer.id > last_id
+        ).order_by(Customer.id).limit(batch_size).all()
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1].id
+
+def customer_to_dict(customer):
+    """Serialize the listing columns of a customer."""
+    return {
+        'id': customer.id,
+        'customer_id': customer.customer_id,
+        'name': customer.name,
+        'age': customer.age,
+        'location': customer.location,
+        'subscription_length_months': customer.subscription_length_months,
+        'monthly_bill': customer.monthly_bill,
+        'total_usage_gb': customer.total_usage_gb,
+        'churn_score': customer.churn_score,
+        'customer_segment': customer.customer_segment
+    }
@@ -0,0 +1,205 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from .. import db
+from ..models import Customer
+from .cache import customer_data_version
+
+# Numeric columns, held as float64 arrays with NaN for NULL
+NUMERIC_COLUMNS = ('age', 'monthly_bill', 'total_usage_gb', 'subscription_length_months',
+                   'churn_score', 'churn_prediction')
+
+# Low-cardinality text columns, dictionary-encoded as int32 codes (-1 for NULL)
+CATEGORICAL_COLUMNS = ('location', 'gender', 'customer_segment')
+
+# Snapshots kept per process, least recently used evicted first
+DEFAULT_MAX_SNAPSHOTS = 32
+
+# Incremental refreshes re-read rows updated this long before the newest
+# timestamp seen, so writes from processes with a slightly late clock are not missed
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+def _encode(values, categories):
+    """Dictionary-encode values against `categories`, appending unseen values to it."""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    lookup = {value: index for index, value in enumerate(categories)}
+    for value in uniques:
+        if value not in lookup:
+            lookup[value] = len(categories)
+            categories.append(value)
+    # Trailing -1 maps factorize's NULL code (-1) back to -1
+    mapping = np.array([lookup[value] for value in uniques] + [-1], dtype=np.int32)
+    return mapping[codes]
+
+class CustomerSnapshot:
+    """
+    Columnar, read-only copy of a set of customers for vectorized analytics.
+
+    Each column of NUMERIC_COLUMNS and CATEGORICAL_COLUMNS is an attribute
+    holding one array, aligned with `ids` (sorted ascending). Categorical
+    codes index into `categories[name]`; use labels(name) to decode them.
+    """
+
+    def __init__(self, ids, columns, categories):
+        self.ids = ids
+        self.columns = columns
+        self.categories = categories
+        for name, values in columns.items():
+            setattr(self, name, values)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_frame(cls, df, categories=None):
+        """Build a snapshot from a frame with an 'id' column plus the snapshot columns."""
+        categories = {name: list(values) for name, values in (categories or {}).items()}
+        df = df.sort_values('id')
+        columns = {
+            name: pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            for name in NUMERIC_COLUMNS
+        }
+        for name in CATEGORICAL_COLUMNS:
+            columns[name] = _encode(df[name].to_numpy(dtype=object), categories.setdefault(name, []))
+        return cls(df['id'].to_numpy(dtype=np.int64), columns, categories)
+
+    @classmethod
+    def from_customers(cls, customers):
+        """Build a snapshot from Customer objects (or anything with the same attributes)."""
+        names = ('id',) + NUMERIC_COLUMNS + CATEGORICAL_COLUMNS
+        return cls.from_frame(pd.DataFrame(
+            [[getattr(c, name, None) for name in names] for c in customers],
+            columns=names
+        ))
+
+    def labels(self, name):
+        """Decoded values of a categorical column, None for NULL."""
+        lookup = np.array(self.categories[name] + [None], dtype=object)
+        return lookup[self.columns[name]]
+
+    def select(self, mask):
+        """A snapshot of the rows where `mask` is true, sharing the category lists."""
+        return CustomerSnapshot(
+            self.ids[mask],
+            {name: values[mask] for name, values in self.columns.items()},
+            self.categories
+        )
+
+    def scored(self):
+        """The customers that have a churn score."""
+        return self.select(~np.isnan(self.churn_score))
+
+    def restrict(self, ids):
+        """A snapshot of the rows whose id is in `ids`, e.g. to drop deleted customers."""
+        return self.select(np.isin(self.ids, ids))
+
+    def merge(self, changed):
+        """Return a new snapshot with `changed` rows replacing or adding to these."""
+        keep = ~np.isin(self.ids, changed.ids)
+
+        ids = np.concatenate([self.ids[keep], changed.ids])
+        order = np.argsort(ids, kind='stable')
+        columns = {}
+        for name, values in self.columns.items():
+            incoming = changed.columns[name]
+            if name in CATEGORICAL_COLUMNS:
+                # Re-encode the incoming codes against this snapshot's categories
+                incoming = _encode(changed.labels(name), self.categories[name])
+            columns[name] = np.concatenate([values[keep], incoming])[order]
+        return CustomerSnapshot(ids[order], columns, self.categories)
+
+def as_snapshot(customers):
+    """Accept a CustomerSnapshot or a list of Customer objects."""
+    if isinstance(customers, CustomerSnapshot):
+        return customers
+    return CustomerSnapshot.from_customers(customers)
+
+def _load_customers(user_id, updated_since=None):
+    columns = [Customer.id] + [getattr(Customer, name) for name in NUMERIC_COLUMNS + CATEGORICAL_COLUMNS]
+    query = db.session.query(*columns).filter(Customer.user_id == user_id)
+    if updated_since is not None:
+        query = query.filter(Customer.updated_at >= updated_since)
+    names = ['id'] + list(NUMERIC_COLUMNS + CATEGORICAL_COLUMNS)
+    return pd.DataFrame(query.all(), columns=names)
+
+def _latest_update(user_id):
+    return db.session.query(func.max(Customer.updated_at), func.count(Customer.id)).filter(
+        Customer.user_id == user_id
+    ).one()
+
+class SnapshotStore:
+    """
+    Per-process registry of customer snapshots, one per user.
+
+    A snapshot is reused while the user's customer data version is unchanged.
+    Once it changes, only rows with a newer updated_at are read and merged in;
+    deleted customers are detected by comparing row counts.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAX_SNAPSHOTS):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def get(self, user_id):
+        with self._lock:
+            version = customer_data_version(user_id)
+            entry = self._entries.get(user_id)
+            if entry is not None and version is not None and entry['version'] == version:
+                self._entries.move_to_end(user_id)
+                return entry['snapshot']
+
+            # Read the high-water mark first so rows written meanwhile are re-read next time
+            latest, count = _latest_update(user_id)
+            if entry is None or entry['latest'] is None:
+                snapshot = CustomerSnapshot.from_frame(_load_customers(user_id))
+                self.full_loads += 1
+            else:
+                changed = CustomerSnapshot.from_frame(
+                    _load_customers(user_id, updated_since=entry['latest'] - REFRESH_OVERLAP)
+                )
+                snapshot = entry['snapshot'].merge(changed)
+                if len(snapshot) != count:
+                    ids = np.array([row[0] for row in db.session.query(Customer.id).filter(
+                        Customer.user_id == user_id).all()], dtype=np.int64)
+                    snapshot = snapshot.restrict(ids)
+                self.incremental_loads += 1
+
+            self._entries[user_id] = {'snapshot': snapshot, 'version': version, 'latest': latest}
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return snapshot
+
+    def configure(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'snapshots': len(self._entries),
+                'maxsize': self.maxsize,
+                'rows': sum(len(entry['snapshot']) for entry in self._entries.values()),
+                'full_loads': self.full_loads,
+                'incremental_loads': self.incremental_loads
+            }
+
+snapshot_store = SnapshotStore()
+
+def get_customer_snapshot(user_id):
+    """Return an up-to-date columnar snapshot of all of a user's customers."""
+    return snapshot_store.get(user_id)
@@ -0,0 +1,32 @@
+from .cache import caches
+from .events import on_customers_changed
+from .aggregates import get_churn_stats
+
+def compute_dashboard_stats(user_id):
+    """Read a user's customer counts per risk bucket from the running aggregates."""
+    stats = get_churn_stats(user_id)
+    return {
+        'total_customers': stats['total_customers'],
+        'high_risk_customers': stats['high_risk_customers'],
+        'medium_risk_customers': stats['medium_risk_customers'],
+        'low_risk_customers': stats['low_risk_customers']
+    }
+
+def get_dashboard_stats(user_id):
+    """Return a user's dashboard stats, served from cache while fresh."""
+    cache = caches.get('dashboard')
+    if cache is None:
+        return compute_dashboard_stats(user_id)
+
+    stats = cache.get(user_id)
+    if stats is None:
+        stats = compute_dashboard_stats(user_id)
+        cache.set(user_id, stats)
+    return stats
+
+@on_customers_changed
+def invalidate_dashboard_stats(user_ids):
+    cache = caches.get('dashboard')
+    if cache is not None:
+        for user_id in user_ids:
+            cache.delete(user_id)
@@ -0,0 +1,208 @@
+from sqlalchemy import func, case, select, true
+from .. import db
+from ..models import Customer
+from .cache import caches, customer_data_version
+
+_months = func.coalesce(Customer.subscription_length_months, 0)
+_usage = func.coalesce(Customer.total_usage_gb, 0)
+_bill = func.coalesce(Customer.monthly_bill, 0)
+
+# Distribution buckets as (label, condition) in evaluation order; a row is
+# counted in the first bucket whose condition matches, like an if/elif chain
+AGE_BUCKETS = [
+    ('18-25', Customer.age.between(18, 25)),
+    ('26-35', Customer.age.between(26, 35)),
+    ('36-45', Customer.age.between(36, 45)),
+    ('46-55', Customer.age.between(46, 55)),
+    ('56+', Customer.age.isnot(None))
+]
+
+GENDER_BUCKETS = [
+    ('male', func.lower(Customer.gender) == 'male'),
+    ('female', func.lower(Customer.gender) == 'female'),
+    ('other', true())
+]
+
+SUBSCRIPTION_BUCKETS = [
+    ('0-6 months', _months <= 6),
+    ('7-12 months', _months <= 12),
+    ('13-24 months', _months <= 24),
+    ('25+ months', true())
+]
+
+USAGE_BUCKETS = [
+    ('0-50 GB', _usage <= 50),
+    ('51-100 GB', _usage <= 100),
+    ('101-200 GB', _usage <= 200),
+    ('201+ GB', true())
+]
+
+# Monthly bill as a share of the highest bill in the selection; cheaper plans
+# are the likelier to churn. Each bucket has the risk score it contributes.
+BILL_RISK_BUCKETS = [
+    ('very_high', 20, 1.0),
+    ('high', 40, 0.8),
+    ('medium', 60, 0.6),
+    ('low', 80, 0.4),
+    ('very_low', 100, 0.2)
+]
+
+RISK_BUCKETS = [
+    ('high_risk_customers', Customer.churn_score > 0.7),
+    ('medium_risk_customers', Customer.churn_score >= 0.4),
+    ('low_risk_customers', Customer.churn_score.isnot(None))
+]
+
+# Order of the criteria in a cache key
+CRITERIA = ('age_range', 'location', 'gender', 'subscription_range', 'usage_range')
+
+DISTRIBUTIONS = {
+    'age_distribution': AGE_BUCKETS,
+    'gender_distribution': GENDER_BUCKETS,
+    'subscription_distribution': SUBSCRIPTION_BUCKETS,
+    'usage_distribution': USAGE_BUCKETS
+}
+
+def _parse_range(value, cast):
+    try:
+        low, high = value.split('-')
+        return cast(low), cast(high)
+    except ValueError:
+        raise ValueError(f'Invalid range: {value}')
+
+def analysis_filters(user_id, age_range=None, location=None, gender=None,
+                     subscription_range=None, usage_range=None):
+    """
+    SQL conditions selecting a user's customers for the analysis form's criteria.
+
+    Ranges are "min-max" strings; 'all' or an empty value disables a filter.
+
+    Raises:
+        ValueError: On a malformed range
+    """
+    conditions = [Customer.user_id == user_id]
+    if age_range:
+        conditions.append(Customer.age.between(*_parse_range(age_range, int)))
+    if location and location != 'all':
+        conditions.append(Customer.location == location)
+    if gender and gender != 'all':
+        conditions.append(Customer.gender == gender)
+    if subscription_range:
+        conditions.append(Customer.subscription_length_months.between(*_parse_range(subscription_range, int)))
+    if usage_range:
+        conditions.append(Customer.total_usage_gb.between(*_parse_range(usage_range, float)))
+    return conditions
+
+def _bucket_counts(prefix, buckets):
+    """One conditional SUM per bucket, each row counted in its first matching bucket."""
+    columns = []
+    for index, (label, condition) in enumerate(buckets):
+        earlier = [(c, 0) for _, c in buckets[:index]]
+        columns.append(func.sum(case(*earlier, (condition, 1), else_=0)).label(f'{prefix}:{label}'))
+    return columns
+
+def empty_analysis():
+    """Analysis result with every count at zero, for the blank form."""
+    analysis = {
+        'total_customers': 0,
+        'churn_rate': 0.0,
+        'avg_monthly_bill': 0.0,
+        'avg_usage': 0.0,
+        'location_distribution': {},
+        'bill_risk_distribution': {label: 0 for label, _, _ in BILL_RISK_BUCKETS},
+        'avg_risk_percentage': 0.0,
+        'max_monthly_bill': 0.0
+    }
+    analysis.update({label: 0 for label, _ in RISK_BUCKETS})
+    for key, buckets in DISTRIBUTIONS.items():
+        analysis[key] = {label: 0 for label, _ in buckets}
+    return analysis
+
+def compute_dynamic_analysis(user_id, **criteria):
+    """
+    Aggregate the customers matching the analysis criteria in the database.
+
+    Every count, sum and distribution is computed by one statement grouped
+    by location, so only one row per location crosses the wire regardless
+    of how many customers match. The per-location rows are then added up.
+
+    Args:
+        user_id (int): Owner of the customers
+        **criteria: age_range, location, gender, subscription_range, usage_range
+
+    Returns:
+        dict or None: The analysis, or None when no customer matches
+    """
+    conditions = analysis_filters(user_id, **criteria)
+
+    max_bill = select(func.max(Customer.monthly_bill)).where(*conditions).scalar_subquery()
+    bill_buckets = [
+        (label, Customer.monthly_bill * 100 <= max_bill * threshold)
+        for label, threshold, _ in BILL_RISK_BUCKETS[:-1]
+    ] + [(BILL_RISK_BUCKETS[-1][0], Customer.monthly_bill.isnot(None))]
+
+    columns = [
+        Customer.location,
+        func.count(Customer.id).label('total'),
+        func.sum(_bill).label('bill_sum'),
+        func.sum(_usage).label('usage_sum'),
+        func.max(Customer.monthly_bill).label('max_bill')
+    ]
+    columns += _bucket_counts('risk', RISK_BUCKETS)
+    columns += _bucket_counts('bill_risk', bill_buckets)
+    for key, buckets in DISTRIBUTIONS.items():
+        columns += _bucket_counts(key, buckets)
+
+    rows = db.session.query(*columns).filter(*conditions).group_by(Customer.location).all()
+    total = sum(row.total for row in rows)
+    if not total:
+        return None
+
+    def add_up(label):
+        return sum(row._mapping[label] or 0 for row in rows)
+
+    analysis = empty_analysis()
+    analysis['total_customers'] = total
+    analysis['avg_monthly_bill'] = add_up('bill_sum') / total
+    analysis['avg_usage'] = add_up('usage_sum') / total
+    analysis['max_monthly_bill'] = max((row.max_bill for row in rows if row.max_bill is not None), default=0.0)
+    analysis['location_distribution'] = {row.location: row.total for row in rows if row.location}
+
+    for label, _ in RISK_BUCKETS:
+        analysis[label] = add_up(f'risk:{label}')
+    analysis['churn_rate'] = analysis['high_risk_customers'] / total * 100
+
+    risk_score = 0.0
+    for label, _, score in BILL_RISK_BUCKETS:
+        analysis['bill_risk_distribution'][label] = add_up(f'bill_risk:{label}')
+        risk_score += score * analysis['bill_risk_distribution'][label]
+    analysis['avg_risk_percentage'] = risk_score / total * 100
+
+    for key, buckets in DISTRIBUTIONS.items():
+        analysis[key] = {label: add_up(f'{key}:{label}') for label, _ in buckets}
+    return analysis
+
+def normalize_criteria(criteria):
+    """Criteria as a tuple in CRITERIA order, with disabled filters as None."""
+    return tuple(
+        None if criteria.get(name) in (None, '', 'all') else criteria[name]
+        for name in CRITERIA
+    )
+
+def get_dynamic_analysis(user_id, **criteria):
+    """
+    Return compute_dynamic_analysis(), served from cache when the same
+    criteria were analyzed since the user's customers last changed.
+    """
+    cache = caches.get('dynamic_analysis')
+    version = customer_data_version(user_id)
+    if cache is None or version is None:
+        return compute_dynamic_analysis(user_id, **criteria)
+
+    key = f"{user_id}:{version}:" + '|'.join('' if v is None else str(v) for v in normalize_criteria(criteria))
+    entry = cache.get(key)
+    if entry is None:
+        # Wrapped so that "no matching customers" is cached too
+        entry = {'analysis': compute_dynamic_analysis(user_id, **criteria)}
+        cache.set(key, entry)
+    return entry['analysis']
@@ -0,0 +1,53 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from ..models import Customer
+
+# Callbacks run with a set of user ids after customer writes are committed
+_customer_listeners = []
+
+_PENDING_KEY = 'changed_customer_users'
+
+def on_customers_changed(callback):
+    """Register callback(user_ids) to run after customers are committed."""
+    _customer_listeners.append(callback)
+    return callback
+
+def notify_customers_changed(user_ids):
+    """
+    Run the customer change callbacks for the given users.
+
+    ORM inserts, updates and deletes are picked up automatically on commit;
+    bulk statements that bypass the unit of work (bulk_insert_mappings,
+    query.update, ...) must call this after committing.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    for callback in _customer_listeners:
+        try:
+            callback(user_ids)
+        except Exception as e:
+            print(f"Warning: customer change listener failed: {str(e)}")
+
+def register_customer_events():
+    """Track customer writes per session and notify listeners on commit."""
+    if event.contains(Session, 'after_flush', _collect_changed_customers):
+        return
+
+    event.listen(Session, 'after_flush', _collect_changed_customers)
+    event.listen(Session, 'after_commit', _dispatch_changed_customers)
+    event.listen(Session, 'after_rollback', _discard_changed_customers)
+
+def _collect_changed_customers(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Customer):
+            pending.add(obj.user_id)
+
+def _dispatch_changed_customers(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        notify_customers_changed(pending)
+
+def _discard_changed_customers(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+from datetime import timezone
+from flask import current_app, request
+from .cache import caches
+from .json_provider import dumps_bytes
+
+# Responses are cached gzip-compressed at this level
+GZIP_LEVEL = 6
+
+def make_etag(*parts):
+    """Strong ETag value derived from the parts that determine a response body."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+def _http_datetime(value):
+    """A naive UTC datetime as an aware one, truncated to HTTP's one-second precision."""
+    if value is None:
+        return None
+    return value.replace(microsecond=0, tzinfo=timezone.utc)
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Whether the request's validators match, per RFC 9110: If-None-Match wins
+    over If-Modified-Since when both are sent, and is compared weakly, so an
+    ETag a compressing proxy marked W/ still matches.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients may keep the body but must revalidate it on every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def cached_json_response(namespace, etag, last_modified, build):
+    """
+    Serve a JSON body with ETag/Last-Modified validators and a body cache.
+
+    A request whose validators match gets 304 Not Modified without `build`
+    running. Otherwise the serialized body is looked up by ETag in the
+    `namespace` cache, where it is kept gzip-compressed; it is only built
+    and serialized on a miss. Because the ETag is derived from the data
+    version, entries never need invalidating; old ones age out. The gzip
+    and identity bodies differ byte for byte, so the gzip one is served
+    under the ETag with a '-gzip' suffix.
+
+    Args:
+        namespace (str): Name of the body cache in utils.cache.caches
+        etag (str): From make_etag, covering the user, arguments and data version
+        last_modified (datetime): Naive UTC time of the newest data, or None
+        build (callable): Returns the JSON-serializable body
+
+    Returns:
+        Response
+    """
+    last_modified = _http_datetime(last_modified)
+    use_gzip = 'gzip' in request.accept_encodings
+    response_etag = f'{etag}-gzip' if use_gzip else etag
+    if is_not_modified(response_etag, last_modified):
+        return _set_validators(current_app.response_class(status=304), response_etag, last_modified)
+
+    cache = caches.get(namespace)
+    compressed = cache.get(etag) if cache is not None else None
+    if compressed is None:
+        body = dumps_bytes(build())
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        if cache is not None:
+            cache.set(etag, compressed)
+
+    if use_gzip:
+        response = current_app.response_class(compressed, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(gzip.decompress(compressed), mimetype='application/json')
+    return _set_validators(response, response_etag, last_modified)
@@ -0,0 +1,133 @@
+import dataclasses
+import decimal
+import uuid
+from datetime import date, datetime, time
+import numpy as np
+from flask import current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder is used without it
+    orjson = None
+
+# Items serialized per chunk of a streamed JSON array
+STREAM_CHUNK_ITEMS = 500
+
+def _default(value):
+    """Types neither encoder handles natively, as the app serializes them."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """
+    Flask's json-module provider, with NumPy values and ISO 8601 dates.
+
+    Dates are written as ISO 8601 instead of Flask's HTTP date format, the
+    same as the orjson provider and the app's hand-built dicts.
+    """
+
+    name = 'json'
+    default = staticmethod(_default)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson.
+
+    NumPy arrays and scalars, datetimes and non-string dict keys are
+    encoded natively; anything else goes through the same default hook as
+    the stdlib provider. Unlike the json module, NaN and infinity are
+    written as null.
+    """
+
+    name = 'orjson'
+    default = staticmethod(_default)
+
+    def _options(self, indent=False, sort_keys=None):
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys if sort_keys is None else sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, **kwargs):
+        """Serialize to UTF-8 bytes, skipping the str round trip of dumps()."""
+        return orjson.dumps(obj, default=kwargs.get('default', self.default),
+                            option=self._options(bool(kwargs.get('indent')), kwargs.get('sort_keys')))
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, **kwargs).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent=indent) + b'\n', mimetype=self.mimetype)
+
+def make_json_provider(app, backend='auto'):
+    """
+    The JSON provider for JSON_BACKEND: 'orjson', 'json', or 'auto' (orjson
+    when it is installed).
+    """
+    if backend not in ('auto', 'orjson', 'json'):
+        raise ValueError(f'JSON_BACKEND must be auto, orjson or json, not {backend!r}')
+    if backend == 'orjson' and orjson is None:
+        print("Warning: JSON_BACKEND is orjson but orjson is not installed, using the json module")
+    if backend != 'json' and orjson is not None:
+        return OrjsonProvider(app)
+    return StdlibJSONProvider(app)
+
+def dumps_bytes(obj):
+    """Serialize with the app's provider to compact UTF-8 bytes."""
+    provider = current_app.json
+    if hasattr(provider, 'dumps_bytes'):
+        return provider.dumps_bytes(obj)
+    return provider.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def iter_json_array(items, chunk_size=STREAM_CHUNK_ITEMS):
+    """
+    Yield a JSON array of `items` in byte chunks of up to `chunk_size` items.
+
+    Each chunk is one dumps() call on a list, so per-item encoder overhead
+    stays small and only one chunk is held in memory at a time.
+    """
+    yield b'['
+    first = True
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield (b'' if first else b',') + dumps_bytes(chunk)[1:-1]
+            first = False
+            chunk = []
+    if chunk:
+        yield (b'' if first else b',') + dumps_bytes(chunk)[1:-1]
+    yield b']\n'
+
+def stream_json_array(items, chunk_size=STREAM_CHUNK_ITEMS):
+    """
+    A streamed response with a JSON array of `items`, e.g. a generator over
+    a large query. The request context stays available while it streams.
+    """
+    return current_app.response_class(
+        stream_with_context(iter_json_array(items, chunk_size)),
+        mimetype='application/json'
+    )
@@ -0,0 +1,313 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Task states, named as Celery names them
+PENDING = 'PENDING'
+STARTED = 'STARTED'
+SUCCESS = 'SUCCESS'
+FAILURE = 'FAILURE'
+
+# Seconds between heartbeats of running tasks; a task whose heartbeat is
+# older than STALE_AFTER belongs to a process that died and is requeued,
+# at startup or by the heartbeat thread of any process running the queue
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS local_task (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    state TEXT NOT NULL,
+    result TEXT,
+    traceback TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    heartbeat_at TEXT,
+    finished_at TEXT
+)
+"""
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+class LocalAsyncResult:
+    """Handle to a queued local task, with the parts of Celery's AsyncResult the app uses."""
+
+    def __init__(self, queue, task_id):
+        self.queue = queue
+        self.id = task_id
+
+    def _row(self):
+        return self.queue._fetch(self.id)
+
+    @property
+    def state(self):
+        row = self._row()
+        return row['state'] if row else PENDING
+
+    status = state
+
+    def ready(self):
+        return self.state in (SUCCESS, FAILURE)
+
+    def successful(self):
+        return self.state == SUCCESS
+
+    def failed(self):
+        return self.state == FAILURE
+
+    @property
+    def result(self):
+        """The return value once successful, the error message once failed, else None."""
+        row = self._row()
+        if not row or row['result'] is None:
+            return None
+        return json.loads(row['result'])
+
+    @property
+    def traceback(self):
+        row = self._row()
+        return row['traceback'] if row else None
+
+    def get(self, timeout=None, interval=0.1, propagate=True):
+        """Wait for the task and return its result, like AsyncResult.get."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f'Task {self.id} did not finish within {timeout}s')
+            time.sleep(interval)
+        if propagate and self.failed():
+            raise RuntimeError(f'Task {self.id} failed: {self.result}')
+        return self.result
+
+class LocalTaskQueue:
+    """
+    Celery stand-in for running without a broker.
+
+    Tasks are recorded in a small SQLite database before they are handed to
+    a thread pool, so `.delay()` returns at once with a LocalAsyncResult whose
+    id can be stored in BatchJob.task_id. Each task runs in its own app
+    context. Tasks still queued are picked up again by the next process
+    that starts the queue, and tasks left running by a process that died
+    are requeued once their heartbeat is stale, even if the process
+    restarted sooner than that. A task is claimed with a conditional
+    UPDATE, so processes sharing the database never run it twice. With
+    workers=0 tasks run inline in the caller.
+
+    The queue starts lazily, on the first delay() or request, so CLI
+    commands do not resume queued work.
+    """
+
+    def __init__(self, app, db_path, workers=2, result_ttl=86400):
+        self.app = app
+        self.db_path = db_path
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.tasks = {}
+        self._executor = None
+        self._running = set()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    # Task registration
+
+    def task(self, *args, **kwargs):
+        """Register a function as a task, as `@celery.task` / `@celery.task(...)` does."""
+        def decorator(f):
+            name = kwargs.get('name') or f'{f.__module__}.{f.__name__}'
+
+            def wrapper(*call_args, **call_kwargs):
+                return f(*call_args, **call_kwargs)
+            wrapper.__name__ = f.__name__
+            wrapper.__doc__ = f.__doc__
+            wrapper.name = name
+            wrapper.delay = lambda *a, **kw: self.submit(name, a, kw)
+            wrapper.apply_async = lambda args=(), kwargs=None, **options: self.submit(name, args, kwargs or {})
+            self.tasks[name] = f
+            return wrapper
+        # Support bare @celery.task as well as @celery.task(...)
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return decorator(args[0])
+        return decorator
+
+    def AsyncResult(self, task_id):
+        return LocalAsyncResult(self, task_id)
+
+    # Storage
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _execute(self, sql, params=()):
+        connection = self._connect()
+        try:
+            return connection.execute(sql, params).rowcount
+        finally:
+            connection.close()
+
+    def _fetch(self, task_id):
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT * FROM local_task WHERE id = ?', (task_id,)).fetchone()
+        finally:
+            connection.close()
+
+    def _finish(self, task_id, state, result, tb=None):
+        self._execute(
+            'UPDATE local_task SET state = ?, result = ?, traceback = ?, finished_at = ? WHERE id = ?',
+            (state, json.dumps(result, default=str), tb, _now(), task_id)
+        )
+
+    # Lifecycle
+
+    def start(self):
+        """Create the queue database, requeue orphaned tasks and resume queued ones."""
+        with self._start_lock:
+            if not self._started:
+                self._start()
+                self._started = True
+
+    def _start(self):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(_SCHEMA)
+            self._requeue_stale(connection)
+            expired = (datetime.utcnow() - timedelta(seconds=self.result_ttl)).isoformat()
+            connection.execute(
+                'DELETE FROM local_task WHERE state IN (?, ?) AND finished_at < ?',
+                (SUCCESS, FAILURE, expired)
+            )
+            queued = [row['id'] for row in connection.execute(
+                'SELECT id FROM local_task WHERE state = ? ORDER BY created_at', (PENDING,))]
+        finally:
+            connection.close()
+
+        if self.workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='local-task')
+            for task_id in queued:
+                self._executor.submit(self._run, task_id)
+        heartbeat = threading.Thread(target=self._heartbeat, name='local-task-heartbeat', daemon=True)
+        heartbeat.start()
+
+    def _requeue_stale(self, connection):
+        """
+        Put STARTED tasks whose heartbeat is older than STALE_AFTER back to
+        PENDING. Each row is requeued with a conditional UPDATE, so only one
+        process requeues (and then runs) it.
+
+        Returns:
+            list: Ids of the tasks requeued
+        """
+        stale = (datetime.utcnow() - timedelta(seconds=STALE_AFTER)).isoformat()
+        condition = 'state = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)'
+        candidates = [row['id'] for row in connection.execute(
+            f'SELECT id FROM local_task WHERE {condition} ORDER BY created_at', (STARTED, stale))]
+        requeued = []
+        for task_id in candidates:
+            updated = connection.execute(
+                f'UPDATE local_task SET state = ?, started_at = NULL WHERE id = ? AND {condition}',
+                (PENDING, task_id, STARTED, stale)
+            ).rowcount
+            if updated:
+                requeued.append(task_id)
+        return requeued
+
+    def submit(self, name, args=(), kwargs=None):
+        """Record a task and queue it; returns a LocalAsyncResult."""
+        if name not in self.tasks:
+            raise KeyError(f'Unknown task: {name}')
+        self.start()
+        task_id = str(uuid.uuid4())
+        self._execute(
+            'INSERT INTO local_task (id, name, args, kwargs, state, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (task_id, name, json.dumps(list(args)), json.dumps(kwargs or {}), PENDING, _now())
+        )
+        if self._executor is None:
+            self._run(task_id, inline=True)
+        else:
+            self._executor.submit(self._run, task_id)
+        return LocalAsyncResult(self, task_id)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                running = list(self._running)
+            for task_id in running:
+                try:
+                    self._execute('UPDATE local_task SET heartbeat_at = ? WHERE id = ?', (_now(), task_id))
+                except sqlite3.Error as e:
+                    print(f"Warning: heartbeat for task {task_id} failed: {str(e)}")
+            # Inline queues only run tasks for their callers, so they leave
+            # stale tasks to a process with workers
+            if self._executor is None:
+                continue
+            connection = self._connect()
+            try:
+                requeued = self._requeue_stale(connection)
+            except sqlite3.Error as e:
+                print(f"Warning: requeueing stale tasks failed: {str(e)}")
+                requeued = []
+            finally:
+                connection.close()
+            for task_id in requeued:
+                self._executor.submit(self._run, task_id)
+
+    def _run(self, task_id, inline=False):
+        now = _now()
+        claimed = self._execute(
+            'UPDATE local_task SET state = ?, started_at = ?, heartbeat_at = ? WHERE id = ? AND state = ?',
+            (STARTED, now, now, task_id, PENDING)
+        )
+        if not claimed:
+            return  # Another process got it first
+        row = self._fetch(task_id)
+        func = self.tasks.get(row['name'])
+        if func is None:
+            self._finish(task_id, FAILURE, f"Unknown task: {row['name']}")
+            return
+
+        with self._lock:
+            self._running.add(task_id)
+        try:
+            if inline:
+                result = func(*json.loads(row['args']), **json.loads(row['kwargs']))
+            else:
+                with self.app.app_context():
+                    from .. import db
+                    try:
+                        result = func(*json.loads(row['args']), **json.loads(row['kwargs']))
+                    finally:
+                        db.session.remove()
+            self._finish(task_id, SUCCESS, result)
+        except Exception as e:
+            self._finish(task_id, FAILURE, str(e), traceback.format_exc())
+            self.app.logger.error(f"Task {row['name']} ({task_id}) failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(task_id)
+
+    def stats(self):
+        """Number of recorded tasks per state."""
+        self.start()
+        connection = self._connect()
+        try:
+            return {row['state']: row['count'] for row in connection.execute(
+                'SELECT state, COUNT(*) AS count FROM local_task GROUP BY state')}
+        finally:
+            connection.close()
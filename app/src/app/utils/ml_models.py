@@ -2,142 +2,326 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 import joblib
+import hashlib
 import os
+import threading
+import time
+from collections import namedtuple
 from datetime import datetime, timedelta
+from .customer_snapshot import as_snapshot
 
-def predict_churn(customer_data):
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), '../../models/churn_model.pkl')
+DEFAULT_SCALER_PATH = os.path.join(os.path.dirname(__file__), '../../models/scaler.pkl')
+
+# Version reported for scores produced without model artifacts
+DEFAULT_MODEL_VERSION = 'default'
+
+LoadedModel = namedtuple('LoadedModel', ['model', 'scaler', 'version', 'key', 'loaded_at'])
+
+class ModelRegistry:
     """
-    Predict churn probability for a customer or set of customers.
+    Process-wide cache of the churn model and scaler.
+
+    Artifacts are loaded once and keyed by (path, mtime, size) of both files.
+    When either file changes on disk the pair is reloaded and swapped in as a
+    single object, so callers never see a new model with an old scaler. If
+    the new files fail to load (e.g. one is still being copied), the
+    previous pair stays in use until the files change again and load.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, scaler_path=DEFAULT_SCALER_PATH,
+                 check_interval=1.0):
+        self._lock = threading.Lock()
+        self._loaded = None
+        self._failed_key = None
+        self._last_check = 0.0
+        self.configure(model_path, scaler_path, check_interval)
+
+    def configure(self, model_path=None, scaler_path=None, check_interval=None):
+        """Point the registry at different artifacts; the next get() reloads."""
+        with self._lock:
+            if model_path is not None:
+                self.model_path = os.path.abspath(model_path)
+            if scaler_path is not None:
+                self.scaler_path = os.path.abspath(scaler_path)
+            if check_interval is not None:
+                self.check_interval = check_interval
+            self._loaded = None
+            self._failed_key = None
+            self._last_check = 0.0
+
+    def _artifact_key(self):
+        key = []
+        for path in (self.model_path, self.scaler_path):
+            stat = os.stat(path)
+            key.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(key)
+
+    def _load(self, key):
+        digest = hashlib.sha1()
+        for path in (self.model_path, self.scaler_path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        model = joblib.load(self.model_path)
+        scaler = joblib.load(self.scaler_path)
+        return LoadedModel(model, scaler, digest.hexdigest()[:12], key, datetime.utcnow())
+
+    def get(self):
+        """
+        Return the current LoadedModel, reloading it if the files changed.
+
+        Returns:
+            LoadedModel or None: None when the artifacts do not exist, or
+            have never loaded successfully
+        """
+        loaded = self._loaded
+        now = time.monotonic()
+        if loaded is not None and now - self._last_check < self.check_interval:
+            return loaded
+
+        with self._lock:
+            self._last_check = now
+            try:
+                key = self._artifact_key()
+            except FileNotFoundError:
+                self._loaded = None
+                return None
+
+            if (self._loaded is None or self._loaded.key != key) and key != self._failed_key:
+                try:
+                    self._loaded = self._load(key)
+                    self._failed_key = None
+                except Exception as e:
+                    # Retried once the files change again
+                    self._failed_key = key
+                    print(f"Warning: Loading the churn model failed, keeping the previous one: {e!r}")
+            return self._loaded
+
+    @property
+    def version(self):
+        loaded = self.get()
+        return loaded.version if loaded is not None else DEFAULT_MODEL_VERSION
+
+model_registry = ModelRegistry()
+
+def get_model_version():
+    """Return the version of the model currently used for scoring."""
+    return model_registry.version
+
+# Feature columns expected by the scaler/model, in order
+FEATURES = [
+    'Monthly_Bill',
+    'Total_Usage_GB',
+    'Subscription_Length_Months',
+    'Age'
+]
+
+# Customer attribute names accepted as aliases for the model feature names
+CUSTOMER_FEATURE_COLUMNS = {
+    'monthly_bill': 'Monthly_Bill',
+    'total_usage_gb': 'Total_Usage_GB',
+    'subscription_length_months': 'Subscription_Length_Months',
+    'age': 'Age'
+}
+
+# Rows scored per predict_proba call; bounds the size of intermediate arrays
+DEFAULT_SCORE_CHUNK_SIZE = 50000
+
+def customer_features(customers):
+    """Build a feature frame from Customer objects, in the given order."""
+    return pd.DataFrame({
+        'Monthly_Bill': [c.monthly_bill for c in customers],
+        'Total_Usage_GB': [c.total_usage_gb for c in customers],
+        'Subscription_Length_Months': [c.subscription_length_months for c in customers],
+        'Age': [c.age for c in customers]
+    }, columns=FEATURES)
+
+def _feature_frame(data):
+    """Normalize a columnar block into a float DataFrame with FEATURES columns."""
+    if isinstance(data, np.ndarray):
+        if data.ndim != 2 or data.shape[1] != len(FEATURES):
+            raise ValueError(f'Expected an array of shape (n, {len(FEATURES)}), got {data.shape}')
+        df = pd.DataFrame(data, columns=FEATURES)
+    else:
+        df = pd.DataFrame(data).rename(columns=CUSTOMER_FEATURE_COLUMNS)
+    
+    # Ensure all required features are present
+    for feature in FEATURES:
+        if feature not in df.columns:
+            df[feature] = 0  # Default value if feature is missing
+    
+    # Missing values (e.g. NULL ages) are scored as 0, like single predictions
+    return df[FEATURES].apply(pd.to_numeric, errors='coerce').fillna(0).astype(float)
+
+def score_batch(data, chunk_size=DEFAULT_SCORE_CHUNK_SIZE, return_version=False):
+    """
+    Score a block of customers with one vectorized pass per chunk.
     
     Args:
-        customer_data (dict or list): Customer data to predict churn for
+        data (DataFrame, dict of arrays or ndarray): Columns named after FEATURES
+            (or the matching Customer attributes); an ndarray must have its
+            columns in FEATURES order
+        chunk_size (int): Maximum number of rows scored per predict_proba call
+        return_version (bool): Also return the version of the model used
         
     Returns:
-        float or list: Churn probability/probabilities
+        ndarray: Churn probabilities in input order, or a
+        (probabilities, model_version) tuple when return_version is set
     """
-    # Load the model and scaler
-    model_path = os.path.join(os.path.dirname(__file__), '../../models/churn_model.pkl')
-    scaler_path = os.path.join(os.path.dirname(__file__), '../../models/scaler.pkl')
-    
-    try:
-        model = joblib.load(model_path)
-        scaler = joblib.load(scaler_path)
-    except FileNotFoundError:
+    df = _feature_frame(data)
+    loaded = model_registry.get()
+    if loaded is None:
         # Return a default prediction if model files are not found
-        return 0.5 if isinstance(customer_data, dict) else [0.5] * len(customer_data)
+        scores = np.full(len(df), 0.5)
+        return (scores, DEFAULT_MODEL_VERSION) if return_version else scores
     
+    scores = np.empty(len(df), dtype=float)
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        X = loaded.scaler.transform(chunk)
+        scores[start:start + len(chunk)] = loaded.model.predict_proba(X)[:, 1]
+    
+    return (scores, loaded.version) if return_version else scores
+
+def predict_churn(customer_data, return_version=False):
+    """
+    Predict churn probability for a customer or set of customers.
+    
+    Args:
+        customer_data (dict or list): Customer data to predict churn for
+        return_version (bool): Also return the version of the model used
+        
+    Returns:
+        float or list: Churn probability/probabilities, or a
+        (predictions, model_version) tuple when return_version is set
+    """
     # Convert input to DataFrame if it's a single customer
     if isinstance(customer_data, dict):
         df = pd.DataFrame([customer_data])
     else:
         df = pd.DataFrame(customer_data)
     
-    # Preprocess the data
-    # Add any necessary feature engineering here
-    features = [
-        'Monthly_Bill',
-        'Total_Usage_GB',
-        'Subscription_Length_Months',
-        'Age'
-    ]
-    
-    # Ensure all required features are present
-    for feature in features:
-        if feature not in df.columns:
-            df[feature] = 0  # Default value if feature is missing
-    
-    # Scale the features
-    X = scaler.transform(df[features])
-    
-    # Make predictions
-    predictions = model.predict_proba(X)[:, 1]
-    
-    return predictions[0] if isinstance(customer_data, dict) else predictions.tolist()
+    predictions, version = score_batch(df, return_version=True)
+    predictions = float(predictions[0]) if isinstance(customer_data, dict) else predictions.tolist()
+    return (predictions, version) if return_version else predictions
 
-def analyze_segments(customers):
-    """Analyze churn risk by customer segments."""
-    # Group customers by usage
-    usage_thresholds = {
-        'low': 50,  # GB
-        'medium': 200  # GB
-    }
-    
-    usage_segments = {
-        'low': [],
-        'medium': [],
-        'high': []
-    }
-    
-    # Group customers by subscription length
-    subscription_thresholds = {
-        'new': 6,  # months
-        'medium': 24  # months
-    }
-    
-    subscription_segments = {
-        'new': [],
-        'medium': [],
-        'long_term': []
+# Segment names and the upper bounds separating them (the last segment is
+# open-ended): usage in GB, subscription length in months
+USAGE_SEGMENTS = ('low', 'medium', 'high')
+USAGE_THRESHOLDS = (50, 200)
+SUBSCRIPTION_SEGMENTS = ('new', 'medium', 'long_term')
+SUBSCRIPTION_THRESHOLDS = (6, 24)
+
+# Churn score above which a customer counts as high risk
+HIGH_RISK_THRESHOLD = 0.7
+
+def _group_stats(codes, size, scores, extra_stats=False, risk_threshold=HIGH_RISK_THRESHOLD):
+    """
+    Per-group churn score statistics for group codes in range(size).
+
+    Counts and means come from np.bincount. With extra_stats, the scores
+    are sorted once by (group, score) and every group's median and 90th
+    percentile are read off that single sorted array.
+
+    Returns:
+        dict: 'count' and 'mean' arrays, plus 'median', 'p90' and
+        'high_risk' (scores above risk_threshold) with extra_stats
+    """
+    counts = np.bincount(codes, minlength=size)
+    sums = np.bincount(codes, weights=scores, minlength=size)
+    stats = {
+        'count': counts,
+        'mean': np.divide(sums, counts, out=np.zeros(size), where=counts > 0)
     }
-    
-    for customer in customers:
-        # Analyze usage segments
-        if customer.total_usage_gb <= usage_thresholds['low']:
-            usage_segments['low'].append(customer.churn_score)
-        elif customer.total_usage_gb <= usage_thresholds['medium']:
-            usage_segments['medium'].append(customer.churn_score)
-        else:
-            usage_segments['high'].append(customer.churn_score)
-        
-        # Analyze subscription segments
-        if customer.subscription_length_months <= subscription_thresholds['new']:
-            subscription_segments['new'].append(customer.churn_score)
-        elif customer.subscription_length_months <= subscription_thresholds['medium']:
-            subscription_segments['medium'].append(customer.churn_score)
+    if not extra_stats:
+        return stats
+
+    stats['high_risk'] = np.bincount(codes, weights=scores > risk_threshold, minlength=size).astype(np.int64)
+    sorted_scores = scores[np.lexsort((scores, codes))]
+    starts = np.cumsum(counts) - counts
+    last = max(len(sorted_scores) - 1, 0)
+    for name, q in (('median', 0.5), ('p90', 0.9)):
+        # Linear interpolation between the closest ranks, like np.percentile
+        position = starts + q * np.maximum(counts - 1, 0)
+        low = np.clip(np.floor(position).astype(np.int64), 0, last)
+        high = np.clip(np.ceil(position).astype(np.int64), 0, last)
+        if len(sorted_scores):
+            values = sorted_scores[low] + (sorted_scores[high] - sorted_scores[low]) * (position - np.floor(position))
         else:
-            subscription_segments['long_term'].append(customer.churn_score)
-    
-    # Calculate average churn scores for each segment
+            values = np.zeros(size)
+        stats[name] = np.where(counts > 0, values, 0.0)
+    return stats
+
+def _stats_at(stats, index):
+    """The statistics of one group as plain Python numbers."""
     return {
-        'usage_segments': {
-            'low': np.mean(usage_segments['low']) if usage_segments['low'] else 0,
-            'medium': np.mean(usage_segments['medium']) if usage_segments['medium'] else 0,
-            'high': np.mean(usage_segments['high']) if usage_segments['high'] else 0
-        },
-        'subscription_segments': {
-            'new': np.mean(subscription_segments['new']) if subscription_segments['new'] else 0,
-            'medium': np.mean(subscription_segments['medium']) if subscription_segments['medium'] else 0,
-            'long_term': np.mean(subscription_segments['long_term']) if subscription_segments['long_term'] else 0
-        }
+        name: int(values[index]) if name in ('count', 'high_risk') else float(values[index])
+        for name, values in stats.items()
     }
 
-def analyze_locations(customers):
-    """Analyze churn risk by location."""
-    location_stats = {}
+def _segment_codes(values, thresholds, names):
+    if len(thresholds) != len(names) - 1:
+        raise ValueError(f'Expected {len(names) - 1} thresholds for segments {", ".join(names)}')
+    # right=True: a value equal to a threshold belongs to the lower segment
+    return np.digitize(np.nan_to_num(values), thresholds, right=True)
+
+def analyze_segments(customers, usage_thresholds=USAGE_THRESHOLDS,
+                     subscription_thresholds=SUBSCRIPTION_THRESHOLDS,
+                     extra_stats=False, risk_threshold=HIGH_RISK_THRESHOLD):
+    """
+    Analyze churn risk by usage and subscription length segments.
     
-    for customer in customers:
-        if customer.location not in location_stats:
-            location_stats[customer.location] = {
-                'scores': [],
-                'count': 0
-            }
+    Args:
+        customers (CustomerSnapshot or list of Customer): Scored customers
+        usage_thresholds (tuple): GB upper bounds of the low and medium usage segments
+        subscription_thresholds (tuple): Month upper bounds of the new and medium segments
+        extra_stats (bool): Also return count, median, p90 and high-risk
+            count per segment under 'usage_segment_stats' and
+            'subscription_segment_stats'
+        risk_threshold (float): Score above which a customer is high risk
         
-        location_stats[customer.location]['scores'].append(customer.churn_score)
-        location_stats[customer.location]['count'] += 1
+    Returns:
+        dict: Average churn score per segment under 'usage_segments' and
+        'subscription_segments' (0 for empty segments)
+    """
+    snapshot = as_snapshot(customers)
+    result = {}
+    for key, values, thresholds, names in (
+        ('usage_segments', snapshot.total_usage_gb, usage_thresholds, USAGE_SEGMENTS),
+        ('subscription_segments', snapshot.subscription_length_months, subscription_thresholds, SUBSCRIPTION_SEGMENTS)
+    ):
+        codes = _segment_codes(values, thresholds, names)
+        stats = _group_stats(codes, len(names), snapshot.churn_score, extra_stats, risk_threshold)
+        result[key] = {name: float(stats['mean'][index]) for index, name in enumerate(names)}
+        if extra_stats:
+            result[key.replace('_segments', '_segment_stats')] = {
+                name: _stats_at(stats, index) for index, name in enumerate(names)
+            }
+    return result
+
+def analyze_locations(customers, extra_stats=False, risk_threshold=HIGH_RISK_THRESHOLD):
+    """
+    Analyze churn risk by location.
     
-    # Calculate statistics for each location
+    Returns:
+        dict: Per location, the 'mean' churn score and customer 'count';
+        with extra_stats also 'median', 'p90' and 'high_risk' (customers
+        scoring above risk_threshold)
+    """
+    snapshot = as_snapshot(customers)
+    
+    # Shift codes by one so customers without a location land in group 0
+    labels = [None] + snapshot.categories['location']
+    stats = _group_stats(snapshot.location + 1, len(labels), snapshot.churn_score, extra_stats, risk_threshold)
     return {
-        location: {
-            'mean': np.mean(stats['scores']),
-            'count': stats['count']
-        }
-        for location, stats in location_stats.items()
+        labels[index]: _stats_at(stats, index)
+        for index in np.flatnonzero(stats['count'])
     }
 
 def predict_future_churn(customers):
     """Predict churn rates for the next 6 months."""
     # Get current churn rate
-    current_rate = np.mean([c.churn_score for c in customers])
+    current_rate = float(np.mean(as_snapshot(customers).churn_score))
     
     # Generate predictions with some variation
     predictions = []
@@ -151,14 +335,16 @@ def predict_future_churn(customers):
 
 def analyze_key_factors(customers):
     """Analyze which factors most influence churn."""
+    snapshot = as_snapshot(customers)
+    
     # Create a DataFrame for analysis
-    df = pd.DataFrame([{
-        'monthly_bill': c.monthly_bill,
-        'total_usage': c.total_usage_gb,
-        'subscription_length': c.subscription_length_months,
-        'age': c.age or 0,
-        'churn_score': c.churn_score
-    } for c in customers])
+    df = pd.DataFrame({
+        'monthly_bill': snapshot.monthly_bill,
+        'total_usage': snapshot.total_usage_gb,
+        'subscription_length': snapshot.subscription_length_months,
+        'age': np.nan_to_num(snapshot.age),
+        'churn_score': snapshot.churn_score
+    })
     
     # Calculate correlations with churn score
     correlations = df.corr()['churn_score'].abs()
@@ -177,12 +363,14 @@ def analyze_key_factors(customers):
 
 def predict_factor_changes(customers):
     """Predict how key factors might change in the future."""
+    snapshot = as_snapshot(customers)
+    
     # Get current averages
     current_metrics = {
-        'Monthly Bill': np.mean([c.monthly_bill for c in customers]),
-        'Usage': np.mean([c.total_usage_gb for c in customers]),
-        'Subscription Length': np.mean([c.subscription_length_months for c in customers]),
-        'Age': np.mean([c.age or 0 for c in customers])
+        'Monthly Bill': np.mean(snapshot.monthly_bill),
+        'Usage': np.mean(snapshot.total_usage_gb),
+        'Subscription Length': np.mean(snapshot.subscription_length_months),
+        'Age': np.mean(np.nan_to_num(snapshot.age))
     }
     
     # Predict changes (simple linear projection)
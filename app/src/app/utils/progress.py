@@ -0,0 +1,129 @@
+import time
+from datetime import datetime
+from sqlalchemy import update, func
+from .. import db
+from ..models import BatchJob
+
+# Minimum seconds between progress commits for a job
+DEFAULT_PROGRESS_INTERVAL = 2.0
+
+class JobProgress:
+    """
+    Publish row counts, throughput and ETA for a running BatchJob.
+
+    Counters are updated on every call, but the job row is only committed
+    when at least `interval` seconds have passed since the last commit, so
+    fast loops do not turn into a write per batch. Failed rows count as
+    done, both in the rate and against rows_total.
+    """
+
+    def __init__(self, job, total=None, interval=DEFAULT_PROGRESS_INTERVAL):
+        self.job = job
+        self.interval = interval
+        self._started = time.monotonic()
+        self._last_commit = self._started
+        job.started_at = job.started_at or datetime.utcnow()
+        job.rows_processed = job.rows_processed or 0
+        job.rows_failed = job.rows_failed or 0
+        # Rows already done by an earlier run are not counted in the rate
+        self._initial = job.rows_processed + job.rows_failed
+        if total is not None:
+            job.rows_total = total
+        self.publish(force=True)
+
+    def advance(self, processed=0, failed=0):
+        """Record newly processed/failed rows and publish if due."""
+        self.job.rows_processed = (self.job.rows_processed or 0) + processed
+        self.job.rows_failed = (self.job.rows_failed or 0) + failed
+        self.publish()
+
+    def publish(self, force=False):
+        """Refresh the rate and commit the job if the interval has elapsed."""
+        now = time.monotonic()
+        elapsed = now - self._started
+        done = (self.job.rows_processed or 0) + (self.job.rows_failed or 0) - self._initial
+        self.job.rows_per_sec = done / elapsed if elapsed > 0 else 0.0
+        self.job.progress_updated_at = datetime.utcnow()
+
+        if force or now - self._last_commit >= self.interval:
+            db.session.commit()
+            self._last_commit = now
+
+class SharedJobProgress:
+    """
+    Progress of one of several tasks working on the same BatchJob.
+
+    Counts are buffered locally and added to the job row with an atomic
+    UPDATE ... SET rows_processed = rows_processed + n at most every
+    `interval` seconds, so parallel chunk tasks never overwrite each
+    other's progress. The rate is recomputed from the job's started_at.
+    """
+
+    def __init__(self, job_id, interval=DEFAULT_PROGRESS_INTERVAL):
+        self.job_id = job_id
+        self.interval = interval
+        self._processed = 0
+        self._failed = 0
+        self._last_commit = time.monotonic()
+
+    def advance(self, processed=0, failed=0):
+        """Record newly processed/failed rows and publish if due."""
+        self._processed += processed
+        self._failed += failed
+        if time.monotonic() - self._last_commit >= self.interval:
+            self.publish()
+
+    def publish(self):
+        """Add the buffered counts to the job row and commit."""
+        self._last_commit = time.monotonic()
+        if not (self._processed or self._failed):
+            return
+        now = datetime.utcnow()
+        db.session.execute(
+            update(BatchJob).where(BatchJob.id == self.job_id).values(
+                rows_processed=func.coalesce(BatchJob.rows_processed, 0) + self._processed,
+                rows_failed=func.coalesce(BatchJob.rows_failed, 0) + self._failed,
+                progress_updated_at=now
+            )
+        )
+        processed, failed, started_at = db.session.query(
+            BatchJob.rows_processed, BatchJob.rows_failed, BatchJob.started_at
+        ).filter(BatchJob.id == self.job_id).one()
+        if started_at is not None and now > started_at:
+            db.session.execute(update(BatchJob).where(BatchJob.id == self.job_id).values(
+                rows_per_sec=((processed or 0) + (failed or 0)) / (now - started_at).total_seconds()
+            ))
+        db.session.commit()
+        self._processed = 0
+        self._failed = 0
+
+def rows_done(job):
+    """Rows a job has finished with, processed or failed."""
+    return (job.rows_processed or 0) + (job.rows_failed or 0)
+
+def job_progress(job):
+    """Serialize a BatchJob's progress for the polling endpoint."""
+    percent = None
+    eta_seconds = None
+    if job.rows_total:
+        percent = min(100.0, 100.0 * rows_done(job) / job.rows_total)
+        remaining = job.rows_total - rows_done(job)
+        if job.status == 'processing' and job.rows_per_sec:
+            eta_seconds = max(0.0, remaining / job.rows_per_sec)
+
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'rows_total': job.rows_total,
+        'rows_processed': job.rows_processed or 0,
+        'rows_failed': job.rows_failed or 0,
+        'rows_per_sec': job.rows_per_sec or 0.0,
+        'percent': percent,
+        'eta_seconds': eta_seconds,
+        'checkpoint_offset': job.checkpoint_offset or 0,
+        'error_message': job.error_message,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'updated_at': job.progress_updated_at.isoformat() if job.progress_updated_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None
+    }
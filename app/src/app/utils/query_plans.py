@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, text
+from .. import db
+from ..models import Customer, CustomerActivity, ChurnTrend, ChurnPrediction, BatchJob, TrendMetric
+
+def _hot_queries(user_id):
+    """(name, statement, acceptable indexes) for the queries the app runs most."""
+    since = datetime.utcnow() - timedelta(days=30)
+    return [
+        ('customer listing by id',
+         select(Customer.id).where(Customer.user_id == user_id, Customer.id > 0)
+         .order_by(Customer.id).limit(51),
+         ['ix_customer_user_id']),
+        ('customer listing by churn score',
+         select(Customer.id).where(Customer.user_id == user_id, Customer.churn_score < 0.9)
+         .order_by(Customer.churn_score.desc(), Customer.id.desc()).limit(51),
+         ['ix_customer_user_churn_score']),
+        ('high-risk customers',
+         select(func.count(Customer.id)).where(Customer.user_id == user_id, Customer.churn_score > 0.7),
+         ['ix_customer_user_churn_score']),
+        ('customers by location',
+         select(Customer.id).where(Customer.user_id == user_id, Customer.location == 'New York'),
+         ['ix_customer_user_location']),
+        ('location filter choices',
+         select(Customer.location).where(Customer.user_id == user_id).distinct().order_by(Customer.location),
+         ['ix_customer_user_location']),
+        ('upload customer_id lookup',
+         select(Customer.id).where(Customer.user_id == user_id, Customer.customer_id.in_(['C1', 'C2'])),
+         # SQLite backs UNIQUE constraints with an unnamed sqlite_autoindex_<table>_N
+         ['uq_customer_user_customer_id', 'sqlite_autoindex_customer_']),
+        ('snapshot refresh',
+         select(Customer.id).where(Customer.user_id == user_id, Customer.updated_at >= since),
+         ['ix_customer_user_updated_at']),
+        ('recent activity',
+         select(CustomerActivity.id).where(CustomerActivity.user_id == user_id)
+         .order_by(CustomerActivity.timestamp.desc()).limit(5),
+         ['ix_customer_activity_user_timestamp']),
+        ('activity retention',
+         select(CustomerActivity.id).where(CustomerActivity.timestamp < since)
+         .order_by(CustomerActivity.timestamp).limit(5000),
+         ['ix_customer_activity_timestamp']),
+        ('customer activity timeline',
+         select(CustomerActivity.id).where(CustomerActivity.customer_id == 1)
+         .order_by(CustomerActivity.timestamp.desc()),
+         ['ix_customer_activity_customer_timestamp']),
+        ('latest trend snapshot',
+         select(ChurnTrend.id).where(ChurnTrend.user_id == user_id).order_by(ChurnTrend.date.desc()).limit(1),
+         ['ix_churn_trend_user_date']),
+        ('trend metric range',
+         select(TrendMetric.bucket).where(TrendMetric.user_id == user_id, TrendMetric.resolution == 'day',
+                                          TrendMetric.metric.in_(['churn_rate', 'avg_churn_score']),
+                                          TrendMetric.bucket >= since).distinct().order_by(TrendMetric.bucket),
+         ['trend_metric_pkey', 'sqlite_autoindex_trend_metric_']),
+        ('trend metric retention',
+         select(func.count()).select_from(TrendMetric).where(TrendMetric.resolution == 'hour',
+                                                             TrendMetric.bucket < since),
+         ['trend_metric_pkey', 'sqlite_autoindex_trend_metric_']),
+        ('prediction series',
+         select(ChurnPrediction.id).where(ChurnPrediction.user_id == user_id,
+                                          ChurnPrediction.prediction_date >= since),
+         ['ix_churn_prediction_user_date']),
+        ('batch jobs',
+         select(BatchJob.id).where(BatchJob.user_id == user_id).order_by(BatchJob.created_at.desc()),
+         ['ix_batch_job_user_created_at']),
+    ]
+
+def _explain(connection, statement):
+    dialect = connection.dialect.name
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    rows = connection.exec_driver_sql(prefix + str(compiled)).all()
+    if dialect == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+def _sqlite_full_scan(line):
+    # "SCAN customer" is a full scan; "SCAN customer USING INDEX ..." is an index scan
+    return line.startswith('SCAN ') and ' USING ' not in line
+
+def check_query_plans(user_id=1):
+    """
+    EXPLAIN the hot queries and check that each one is served by an index.
+
+    Supports SQLite (EXPLAIN QUERY PLAN) and PostgreSQL (EXPLAIN). On
+    PostgreSQL sequential scans are disabled for the check, so small tables
+    do not hide a missing index behind a cheaper seq scan.
+
+    Args:
+        user_id (int): User id the queries filter on; it need not exist
+
+    Returns:
+        list: One dict per query with name, ok, index (the one used, if
+            any) and the plan lines
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        raise ValueError(f'Query plan checks are not supported on {dialect}')
+
+    results = []
+    try:
+        if dialect == 'postgresql':
+            connection.execute(text('SET LOCAL enable_seqscan = off'))
+        for name, statement, indexes in _hot_queries(user_id):
+            plan = _explain(connection, statement)
+            used = next((index for index in indexes if any(index in line for line in plan)), None)
+            if dialect == 'sqlite':
+                ok = used is not None and not any(_sqlite_full_scan(line) for line in plan)
+            else:
+                ok = used is not None and not any('Seq Scan' in line for line in plan)
+            results.append({'name': name, 'ok': ok, 'index': used, 'plan': plan})
+    finally:
+        db.session.rollback()
+    return results
@@ -0,0 +1,125 @@
+import time
+import pandas as pd
+from sqlalchemy import or_
+from .. import db
+from ..models import Customer, CustomerActivity
+from .ml_models import score_batch, get_model_version
+from .events import notify_customers_changed
+from .aggregates import apply_customer_changes
+
+# Customers scored and written per batch/commit
+DEFAULT_RESCORE_BATCH_SIZE = 5000
+
+_FEATURE_ATTRIBUTES = ['monthly_bill', 'total_usage_gb', 'subscription_length_months', 'age']
+
+# Previous values needed to move the customer out of its old aggregate buckets
+_AGGREGATE_ATTRIBUTES = ['churn_score', 'churn_prediction', 'location', 'customer_segment']
+
+def rescore_filter(model_version=None, only_missing=False):
+    """
+    SQL condition selecting customers that need a (new) churn score.
+
+    Customers without a score always match; unless only_missing is set, so do
+    customers scored by a model other than `model_version`.
+    """
+    if only_missing:
+        return Customer.churn_score.is_(None)
+    return or_(
+        Customer.churn_score.is_(None),
+        Customer.model_version.is_(None),
+        Customer.model_version != model_version
+    )
+
+def count_customers_to_rescore(user_id=None, only_missing=False):
+    """Number of customers rescore_customers would score right now."""
+    query = Customer.query.filter(rescore_filter(get_model_version(), only_missing))
+    if user_id is not None:
+        query = query.filter(Customer.user_id == user_id)
+    return query.count()
+
+def rescore_customers(user_id=None, batch_size=DEFAULT_RESCORE_BATCH_SIZE, only_missing=False,
+                      on_batch=None):
+    """
+    Score unscored or stale-model customers in id-ordered batches.
+
+    Each batch loads only the columns needed for scoring and for the
+    aggregates, is scored with one vectorized call, and is written back with
+    a bulk UPDATE plus bulk 'prediction' activity inserts; the per-user
+    aggregates are adjusted in the same transaction. Readers therefore never
+    have to score customers themselves.
+
+    Args:
+        user_id (int): Only rescore this user's customers (all users if None)
+        batch_size (int): Customers per batch and commit
+        only_missing (bool): Skip customers that already have a score, even
+            if it came from an older model
+        on_batch (callable): Called as on_batch(processed, failed) after each
+            batch, e.g. JobProgress.advance
+
+    Returns:
+        dict: rescored/failed counts, model_version, elapsed seconds and rows_per_sec
+    """
+    started = time.perf_counter()
+    model_version = get_model_version()
+    stats = {'rescored': 0, 'failed': 0, 'model_version': model_version}
+    changed_users = set()
+
+    names = ['id', 'user_id'] + _FEATURE_ATTRIBUTES + _AGGREGATE_ATTRIBUTES
+    columns = [getattr(Customer, name) for name in names]
+    last_id = 0
+    while True:
+        query = db.session.query(*columns).filter(
+            rescore_filter(model_version, only_missing),
+            Customer.id > last_id
+        )
+        if user_id is not None:
+            query = query.filter(Customer.user_id == user_id)
+        rows = query.order_by(Customer.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        batch = pd.DataFrame(rows, columns=names)
+        try:
+            scores, model_version = score_batch(batch[_FEATURE_ATTRIBUTES], return_version=True)
+            scores = scores.tolist()
+            ids = batch['id'].tolist()
+            db.session.bulk_update_mappings(Customer, [
+                {'id': customer_id, 'churn_score': score, 'model_version': model_version}
+                for customer_id, score in zip(ids, scores)
+            ])
+            db.session.bulk_insert_mappings(CustomerActivity, [{
+                'user_id': owner_id,
+                'customer_id': customer_id,
+                'activity_type': 'prediction',
+                'description': 'Churn score calculated',
+                'activity_metadata': {'score': score, 'model_version': model_version}
+            } for customer_id, owner_id, score in zip(ids, batch['user_id'].tolist(), scores)])
+            before = [dict(zip(names, row)) for row in rows]
+            apply_customer_changes(
+                db.session.connection(),
+                before=before,
+                after=[dict(row, churn_score=score) for row, score in zip(before, scores)]
+            )
+            db.session.commit()
+        except Exception as e:
+            print(f"Error rescoring customers {rows[0][0]}-{last_id}: {str(e)}")
+            db.session.rollback()
+            stats['failed'] += len(rows)
+            if on_batch:
+                on_batch(0, len(rows))
+            continue
+
+        stats['rescored'] += len(rows)
+        changed_users.update(batch['user_id'].unique().tolist())
+        if on_batch:
+            on_batch(len(rows), 0)
+
+    if changed_users:
+        notify_customers_changed(changed_users)
+
+    elapsed = time.perf_counter() - started
+    stats['model_version'] = model_version
+    stats['elapsed'] = elapsed
+    stats['rows_per_sec'] = stats['rescored'] / elapsed if elapsed > 0 else 0.0
+    return stats
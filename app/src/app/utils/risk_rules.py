@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+# Customer columns rules may test
+RULE_COLUMNS = ('age', 'subscription_length_months', 'monthly_bill', 'total_usage_gb')
+
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal
+}
+
+# risk_flags is a 32-bit integer column
+MAX_RISK_BIT = 30
+
+# Bits are stored in risk_flags, so a rule keeps its bit for as long as rows
+# flagged with it exist; retire a rule by dropping it, never by reusing its bit
+DEFAULT_RULES = {
+    'risk_factors': [
+        {
+            'bit': 0,
+            'factor': 'New Customer',
+            'description': 'Customers with less than 12 months of subscription are more likely to churn',
+            'severity': 'high',
+            'column': 'subscription_length_months', 'op': '<', 'value': 12
+        },
+        {
+            'bit': 1,
+            'factor': 'High Monthly Bill',
+            'description': 'Customers with high monthly bills may be more price-sensitive',
+            'severity': 'medium',
+            'column': 'monthly_bill', 'op': '>', 'value': 100
+        },
+        {
+            'bit': 2,
+            'factor': 'Low Usage',
+            'description': 'Customers with low data usage may not be getting value from the service',
+            'severity': 'medium',
+            'column': 'total_usage_gb', 'op': '<', 'value': 100
+        },
+        {
+            'bit': 3,
+            'factor': 'Senior Customer',
+            'description': 'Older customers may be less tech-savvy and more likely to churn',
+            'severity': 'low',
+            'column': 'age', 'op': '>', 'value': 60
+        }
+    ],
+    # First matching segment wins; every condition of a segment must hold
+    'segments': [
+        {'segment': 'High-value', 'conditions': [
+            {'column': 'monthly_bill', 'op': '>', 'value': 100},
+            {'column': 'total_usage_gb', 'op': '>', 'value': 200}
+        ]},
+        {'segment': 'Medium-value', 'conditions': [
+            {'column': 'monthly_bill', 'op': '>', 'value': 50},
+            {'column': 'total_usage_gb', 'op': '>', 'value': 100}
+        ]}
+    ],
+    'default_segment': 'Low-value'
+}
+
+def _check_condition(condition):
+    if condition.get('column') not in RULE_COLUMNS:
+        raise ValueError(f"Unknown rule column: {condition.get('column')!r}")
+    if condition.get('op') not in OPERATORS:
+        raise ValueError(f"Unknown rule operator: {condition.get('op')!r}")
+    float(condition['value'])
+
+def _float_column(columns, name):
+    """A column of a DataFrame or dict of lists as floats, NULLs as NaN."""
+    values = columns[name]
+    if isinstance(values, pd.Series):
+        return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+class RiskRuleSet:
+    """
+    Risk factor and segment rules evaluated as NumPy masks over a batch.
+
+    Each risk factor rule owns one bit of the risk_flags bitmask; the
+    factor, description and severity are looked up from the flags instead
+    of being stored with every customer. A NULL value never matches a rule.
+    """
+
+    def __init__(self, rules, version='default'):
+        self.version = version
+        self.factors = sorted(rules['risk_factors'], key=lambda rule: rule['bit'])
+        bits = [rule['bit'] for rule in self.factors]
+        if len(set(bits)) != len(bits) or any(not 0 <= bit <= MAX_RISK_BIT for bit in bits):
+            raise ValueError(f'Risk factor bits must be unique and between 0 and {MAX_RISK_BIT}')
+        for rule in self.factors:
+            _check_condition(rule)
+        self.segments = rules.get('segments', [])
+        for segment in self.segments:
+            for condition in segment['conditions']:
+                _check_condition(condition)
+        self.default_segment = rules.get('default_segment')
+        self._weights = np.array([1 << bit for bit in bits], dtype=np.int64)
+        self._details = {}
+        self._lock = threading.Lock()
+
+    def _evaluate(self, values, condition):
+        return OPERATORS[condition['op']](values[condition['column']], float(condition['value']))
+
+    def _values(self, columns):
+        return {name: _float_column(columns, name) for name in RULE_COLUMNS if name in columns}
+
+    @staticmethod
+    def _length(values):
+        return len(next(iter(values.values()))) if values else 0
+
+    def masks(self, columns):
+        """
+        Args:
+            columns (DataFrame or dict of lists): The RULE_COLUMNS the rules test
+
+        Returns:
+            ndarray: Boolean array of shape (n, len(self.factors))
+        """
+        values = self._values(columns)
+        if not self.factors:
+            return np.zeros((self._length(values), 0), dtype=bool)
+        return np.column_stack([self._evaluate(values, rule) for rule in self.factors])
+
+    def flags(self, columns):
+        """risk_flags bitmask per customer, as an int64 array."""
+        return self.masks(columns).astype(np.int64) @ self._weights
+
+    def describe(self, flags):
+        """
+        Risk factors (factor, description, severity) set in a bitmask.
+
+        Results are cached per distinct bitmask and shared between callers;
+        bits of retired rules are ignored.
+        """
+        if flags is None:
+            return []
+        flags = int(flags)
+        details = self._details.get(flags)
+        if details is None:
+            details = [{'factor': rule['factor'], 'description': rule['description'], 'severity': rule['severity']}
+                       for rule in self.factors if flags >> rule['bit'] & 1]
+            with self._lock:
+                self._details[flags] = details
+        return details
+
+    def segment(self, columns):
+        """Segment name per customer, as an array of strings."""
+        values = self._values(columns)
+        if not self.segments:
+            return np.full(self._length(values), self.default_segment, dtype=object)
+        conditions = []
+        for segment in self.segments:
+            mask = np.ones(self._length(values), dtype=bool)
+            for condition in segment['conditions']:
+                mask &= self._evaluate(values, condition)
+            conditions.append(mask)
+        return np.select(conditions, [segment['segment'] for segment in self.segments],
+                         default=self.default_segment).astype(object)
+
+class RiskRuleRegistry:
+    """
+    Process-wide cache of the active RiskRuleSet.
+
+    Rules come from the JSON file at `path` (same layout as DEFAULT_RULES)
+    and are reloaded when it changes on disk, so thresholds and
+    descriptions can be tuned without a deploy. Without a file, or if the
+    file is invalid, DEFAULT_RULES apply.
+    """
+
+    def __init__(self, path=None, check_interval=1.0):
+        self._lock = threading.Lock()
+        self._default = RiskRuleSet(DEFAULT_RULES)
+        self.configure(path, check_interval)
+
+    def configure(self, path=None, check_interval=None):
+        with self._lock:
+            self.path = os.path.abspath(path) if path else None
+            if check_interval is not None:
+                self.check_interval = check_interval
+            self._loaded = None
+            self._key = None
+            self._last_check = 0.0
+
+    def _load(self, key):
+        with open(self.path) as f:
+            return RiskRuleSet(json.load(f), version=f'{os.path.basename(self.path)}@{key[1]}')
+
+    def get(self):
+        """Return the current RiskRuleSet, reloading the rule file if it changed."""
+        if self.path is None:
+            return self._default
+        loaded = self._loaded
+        now = time.monotonic()
+        if loaded is not None and now - self._last_check < self.check_interval:
+            return loaded
+
+        with self._lock:
+            self._last_check = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._loaded = self._default
+                return self._loaded
+            key = (self.path, stat.st_mtime_ns, stat.st_size)
+            if self._loaded is None or self._key != key:
+                try:
+                    self._loaded = self._load(key)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"Warning: Invalid risk rules in {self.path}, using the defaults: {str(e)}")
+                    self._loaded = self._default
+                self._key = key
+            return self._loaded
+
+risk_rules = RiskRuleRegistry()
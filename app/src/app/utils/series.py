@@ -0,0 +1,260 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, and_, or_
+from .. import db
+from ..models import ChurnTrend, ChurnPrediction
+from .trend_metrics import (RESOLUTIONS, AGGREGATIONS, HEADLINE_METRICS, DEFAULT_METRIC_LIMIT, MAX_METRIC_LIMIT,
+                            pick_resolution, query_metric_series, metrics_version, bucket_label)
+
+DEFAULT_SERIES_LIMIT = 500
+MAX_SERIES_LIMIT = 5000
+
+# Downsampling granularities accepted by the `bucket` argument
+BUCKETS = ('hour', 'day', 'week')
+
+# Per API: the model, its date column and the selectable fields mapped to
+# (response key, whether the column is a JSON blob)
+TREND_SERIES = {
+    'name': 'trends',
+    'model': ChurnTrend,
+    'date_column': ChurnTrend.date,
+    'fields': {
+        'churn_rate': ('churn_rates', False),
+        'high_risk_customers': ('high_risk_customers', False),
+        'avg_churn_score': ('avg_churn_scores', False),
+        'segment_analysis': ('segment_trends', True),
+        'location_analysis': ('location_trends', True),
+        'future_predictions': ('future_predictions', True),
+        'factor_importance': ('factor_importance', True),
+        'factor_changes': ('factor_changes', True)
+    },
+    'default_fields': ['churn_rate', 'high_risk_customers', 'avg_churn_score',
+                       'segment_analysis', 'location_analysis'],
+    # Bucketed series of these fields are read from TrendMetric rollups
+    'metrics': {
+        'churn_rate': 'churn_rate',
+        'high_risk_customers': 'high_risk_customers',
+        'avg_churn_score': 'avg_churn_score'
+    }
+}
+
+PREDICTION_SERIES = {
+    'name': 'predictions',
+    'model': ChurnPrediction,
+    'date_column': ChurnPrediction.prediction_date,
+    'fields': {
+        'predicted_churn_rate': ('predicted_rates', False),
+        'confidence_score': ('confidence_scores', False),
+        'segment_predictions': ('segment_predictions', True),
+        'location_predictions': ('location_predictions', True),
+        'age_group_predictions': ('age_group_predictions', True),
+        'key_factors': ('key_factors', True)
+    },
+    'default_fields': ['predicted_churn_rate', 'confidence_score', 'segment_predictions']
+}
+
+def parse_datetime_arg(value, end_of_day=False):
+    """Parse an ISO date/datetime query argument; bare end dates include the whole day."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def parse_series_args(spec, args):
+    """
+    Validate the query arguments of a series API.
+
+    Returns:
+        dict: fields, start, end, after, limit and bucket
+
+    Raises:
+        ValueError: On unknown fields, bad dates or an unsupported bucket
+    """
+    fields = args.get('fields')
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in spec['fields']]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    else:
+        fields = list(spec['default_fields'])
+
+    bucket = args.get('bucket') or None
+    if bucket is not None:
+        if bucket not in BUCKETS:
+            raise ValueError(f'bucket must be one of: {", ".join(BUCKETS)}')
+        # JSON blobs cannot be averaged; bucketed series are scalar only
+        fields = [f for f in fields if not spec['fields'][f][1]]
+
+    try:
+        limit = int(args.get('limit', DEFAULT_SERIES_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+
+    return {
+        'fields': fields,
+        'start': parse_datetime_arg(args.get('start')),
+        'end': parse_datetime_arg(args.get('end'), end_of_day=True),
+        'after': args.get('after') or None,
+        'limit': max(1, min(limit, MAX_SERIES_LIMIT)),
+        'bucket': bucket
+    }
+
+def parse_metric_args(args, retention_days):
+    """
+    Validate the query arguments of the trend metrics API.
+
+    Returns:
+        dict: metrics, resolution, start, end, after, limit and aggregation
+
+    Raises:
+        ValueError: On bad dates, an unknown resolution or aggregation
+    """
+    metrics = args.get('metrics')
+    if metrics:
+        metrics = [m.strip() for m in metrics.split(',') if m.strip()]
+    else:
+        metrics = list(HEADLINE_METRICS)
+
+    start = parse_datetime_arg(args.get('start'))
+    resolution = args.get('resolution') or 'auto'
+    if resolution == 'auto':
+        resolution = pick_resolution(start, retention_days)
+    elif resolution not in RESOLUTIONS:
+        raise ValueError(f'resolution must be auto or one of: {", ".join(RESOLUTIONS)}')
+
+    aggregation = args.get('agg') or 'avg'
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f'agg must be one of: {", ".join(AGGREGATIONS)}')
+
+    try:
+        limit = int(args.get('limit', DEFAULT_METRIC_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+
+    return {
+        'metrics': metrics,
+        'resolution': resolution,
+        'start': start,
+        'end': parse_datetime_arg(args.get('end'), end_of_day=True),
+        'after': args.get('after') or None,
+        'limit': max(1, min(limit, MAX_METRIC_LIMIT)),
+        'aggregation': aggregation
+    }
+
+def date_bucket(column, bucket):
+    """SQL expression truncating a datetime column to the start of its hour/day/week."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.date_trunc(bucket, column)
+    if dialect == 'sqlite':
+        if bucket == 'hour':
+            return func.strftime('%Y-%m-%d %H:00', column)
+        if bucket == 'week':
+            # Monday of the row's week
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.date(column)
+    raise ValueError(f'Downsampling is not supported on {dialect}')
+
+def _reads_metrics(spec, fields, bucket):
+    """Whether a bucketed page is served from the TrendMetric rollups."""
+    return bool(bucket and spec.get('metrics') and all(f in spec['metrics'] for f in fields))
+
+def series_version(spec, user_id, fields, bucket=None, **params):
+    """
+    Cheap data version of a user's series, for HTTP validators.
+
+    Reads only the count and newest id/date (or, for rollups, the newest
+    update) of the user's rows, which the (user_id, date) indexes answer
+    without touching the JSON columns. Deleting or adding rows changes the
+    count, so pruned history changes the version too.
+
+    Returns:
+        tuple: (version token, last modified datetime or None)
+    """
+    if _reads_metrics(spec, fields, bucket):
+        return metrics_version(user_id, bucket)
+
+    model = spec['model']
+    count, last_id, last_modified = db.session.query(
+        func.count(model.id), func.max(model.id), func.max(spec['date_column'])
+    ).filter(model.user_id == user_id).one()
+    return (count, last_id, last_modified and last_modified.isoformat()), last_modified
+
+def query_series(spec, user_id, fields, start=None, end=None, after=None,
+                 limit=DEFAULT_SERIES_LIMIT, bucket=None):
+    """
+    Load one page of a user's series, selecting only the requested columns.
+
+    Raw pages are keyset-paginated on (date, id). Bucketed pages of fields
+    with TrendMetric rollups are read from those; other bucketed pages are
+    averaged per hour/day/week in SQL. Both are paginated on the bucket.
+
+    Returns:
+        dict: 'dates', one list per field under its response key, and
+        'next_cursor' to pass back as `after` (None on the last page)
+    """
+    if _reads_metrics(spec, fields, bucket):
+        metrics = [spec['metrics'][f] for f in fields]
+        series = query_metric_series(user_id, metrics, bucket, start=start, end=end, after=after, limit=limit)
+        result = {'dates': series['dates']}
+        for field, metric in zip(fields, metrics):
+            result[spec['fields'][field][0]] = series[metric]
+        result['next_cursor'] = series['next_cursor']
+        return result
+
+    model = spec['model']
+    date_column = spec['date_column']
+    columns = [getattr(model, f) for f in fields]
+
+    if bucket:
+        bucket_column = date_bucket(date_column, bucket).label('bucket')
+        query = db.session.query(bucket_column, *[func.avg(c) for c in columns])
+    else:
+        query = db.session.query(model.id, date_column, *columns)
+
+    query = query.filter(model.user_id == user_id, date_column.isnot(None))
+    if start:
+        query = query.filter(date_column >= start)
+    if end:
+        query = query.filter(date_column < end)
+
+    if bucket:
+        query = query.group_by(bucket_column)
+        if after:
+            query = query.having(bucket_column > after)
+        query = query.order_by(bucket_column)
+    else:
+        if after:
+            try:
+                after_date, after_id = after.rsplit(',', 1)
+                after_date, after_id = datetime.fromisoformat(after_date), int(after_id)
+            except ValueError:
+                raise ValueError(f'Invalid cursor: {after}')
+            query = query.filter(or_(
+                date_column > after_date,
+                and_(date_column == after_date, model.id > after_id)
+            ))
+        query = query.order_by(date_column, model.id)
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if bucket:
+        result = {'dates': [bucket_label(row[0], bucket) for row in rows]}
+        values = [row[1:] for row in rows]
+        next_cursor = bucket_label(rows[-1][0], bucket) if has_more else None
+    else:
+        result = {'dates': [row[1].strftime('%Y-%m-%d') for row in rows]}
+        values = [row[2:] for row in rows]
+        next_cursor = f'{rows[-1][1].isoformat()},{rows[-1][0]}' if has_more else None
+
+    for index, field in enumerate(fields):
+        result[spec['fields'][field][0]] = [row[index] for row in values]
+    result['next_cursor'] = next_cursor
+    return result
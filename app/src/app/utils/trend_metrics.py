@@ -0,0 +1,338 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, delete, case, func
+from .. import db
+from ..models import TrendMetric, ChurnTrend
+from .aggregates import get_churn_stats
+
+# Bucket sizes, finest first
+RESOLUTIONS = ('hour', 'day', 'week')
+
+# Aggregations a series can be read with
+AGGREGATIONS = ('avg', 'min', 'max', 'last')
+
+# Scalar metrics recorded with every trend snapshot; per-group rates are
+# recorded as '<prefix>:<group>'
+HEADLINE_METRICS = ('churn_rate', 'avg_churn_score', 'high_risk_customers', 'scored_customers')
+SEGMENT_RATE_PREFIX = 'segment_churn_rate'
+LOCATION_RATE_PREFIX = 'location_churn_rate'
+UNKNOWN_GROUP = 'Unknown'
+
+DEFAULT_METRIC_LIMIT = 1000
+MAX_METRIC_LIMIT = 10000
+
+def retention_from_config(config):
+    """Per-resolution retention in days from the TREND_*_RETENTION_DAYS settings."""
+    return {
+        'hour': config['TREND_HOURLY_RETENTION_DAYS'],
+        'day': config['TREND_DAILY_RETENTION_DAYS'],
+        'week': config['TREND_WEEKLY_RETENTION_DAYS']
+    }
+
+def bucket_start(moment, resolution):
+    """Start of the hour, day or (Monday-based) week a datetime falls in."""
+    if resolution == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = datetime(moment.year, moment.month, moment.day)
+    if resolution == 'day':
+        return day
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f'resolution must be one of: {", ".join(RESOLUTIONS)}')
+
+def _rate(stats):
+    return stats['high_risk_customers'] / stats['scored_customers'] if stats['scored_customers'] else 0.0
+
+def current_metrics(user_id):
+    """
+    The user's scalar trend metrics right now, read from the aggregates.
+
+    churn_rate is the share of scored customers at high risk, as in
+    ChurnTrend; the per-segment and per-location rates use the same
+    definition.
+
+    Returns:
+        dict: metric name -> value
+    """
+    stats = get_churn_stats(user_id, breakdowns=True)
+    metrics = {
+        'churn_rate': _rate(stats),
+        'avg_churn_score': stats['avg_churn_score'],
+        'high_risk_customers': stats['high_risk_customers'],
+        'scored_customers': stats['scored_customers']
+    }
+    for prefix, key in ((SEGMENT_RATE_PREFIX, 'segments'), (LOCATION_RATE_PREFIX, 'locations')):
+        for group, group_stats in stats[key].items():
+            if group_stats['scored_customers']:
+                metrics[f'{prefix}:{group or UNKNOWN_GROUP}'] = _rate(group_stats)
+    return metrics
+
+def _upsert_samples(connection, rows):
+    table = TrendMetric.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table)
+        excluded = stmt.excluded
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['resolution', 'user_id', 'metric', 'bucket'],
+            set_={
+                'samples': table.c.samples + excluded.samples,
+                'value_sum': table.c.value_sum + excluded.value_sum,
+                'value_min': case((excluded.value_min < table.c.value_min, excluded.value_min),
+                                  else_=table.c.value_min),
+                'value_max': case((excluded.value_max > table.c.value_max, excluded.value_max),
+                                  else_=table.c.value_max),
+                'value_last': excluded.value_last,
+                'updated_at': excluded.updated_at
+            }
+        ), rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.user_id == row['user_id'],
+                   table.c.resolution == row['resolution'],
+                   table.c.metric == row['metric'],
+                   table.c.bucket == row['bucket'])
+            .values(
+                samples=table.c.samples + row['samples'],
+                value_sum=table.c.value_sum + row['value_sum'],
+                value_min=case((table.c.value_min > row['value_min'], row['value_min']), else_=table.c.value_min),
+                value_max=case((table.c.value_max < row['value_max'], row['value_max']), else_=table.c.value_max),
+                value_last=row['value_last'],
+                updated_at=row['updated_at']
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+def record_metrics(user_id, metrics, at=None):
+    """
+    Fold one sample of each metric into its hour, day and week buckets.
+
+    The rollups happen on write, with atomic upserts, so every resolution
+    is always complete and readers never aggregate raw samples. Commits
+    the session.
+
+    Args:
+        metrics (dict): metric name -> value
+        at (datetime): Sample time, now by default
+
+    Returns:
+        int: Bucket rows written
+    """
+    at = at or datetime.utcnow()
+    now = datetime.utcnow()
+    rows = [{
+        'user_id': user_id,
+        'resolution': resolution,
+        'metric': metric,
+        'bucket': bucket_start(at, resolution),
+        'samples': 1,
+        'value_sum': float(value),
+        'value_min': float(value),
+        'value_max': float(value),
+        'value_last': float(value),
+        'updated_at': now
+    } for resolution in RESOLUTIONS for metric, value in metrics.items() if value is not None]
+    if rows:
+        _upsert_samples(db.session.connection(), rows)
+        db.session.commit()
+    return len(rows)
+
+def record_current_metrics(user_id, at=None):
+    """Record current_metrics(user_id) as one sample; returns the bucket rows written."""
+    return record_metrics(user_id, current_metrics(user_id), at=at)
+
+def prune_trend_metrics(retention_days, now=None):
+    """
+    Delete buckets past their resolution's retention.
+
+    Args:
+        retention_days (dict): resolution -> days to keep; 0 or None keeps
+            that resolution forever
+
+    Returns:
+        dict: Rows deleted per resolution
+    """
+    now = now or datetime.utcnow()
+    deleted = {}
+    for resolution in RESOLUTIONS:
+        days = retention_days.get(resolution)
+        if not days:
+            deleted[resolution] = 0
+            continue
+        cutoff = bucket_start(now - timedelta(days=days), resolution)
+        result = db.session.execute(delete(TrendMetric).where(
+            TrendMetric.resolution == resolution,
+            TrendMetric.bucket < cutoff
+        ))
+        deleted[resolution] = result.rowcount or 0
+    db.session.commit()
+    return deleted
+
+def prune_trend_snapshots(retention_days, now=None):
+    """
+    Delete ChurnTrend snapshots older than `retention_days`, always keeping
+    each user's latest one for the trends page. Their scalar series live
+    on in TrendMetric.
+
+    Returns:
+        int: Snapshots deleted
+    """
+    if not retention_days:
+        return 0
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    latest = select(func.max(ChurnTrend.id)).group_by(ChurnTrend.user_id)
+    result = db.session.execute(delete(ChurnTrend).where(
+        ChurnTrend.date < cutoff,
+        ChurnTrend.id.not_in(latest)
+    ))
+    db.session.commit()
+    return result.rowcount or 0
+
+def backfill_trend_metrics(user_id=None):
+    """
+    Record the headline metrics of ChurnTrend snapshots taken before a
+    user's first TrendMetric sample, so series continue across the switch.
+    Running it again finds nothing left to backfill.
+
+    Returns:
+        int: Snapshots backfilled
+    """
+    query = db.session.query(ChurnTrend.user_id).distinct()
+    if user_id is not None:
+        query = query.filter(ChurnTrend.user_id == user_id)
+
+    backfilled = 0
+    for (owner_id,) in query.all():
+        first = db.session.query(func.min(TrendMetric.bucket)).filter(
+            TrendMetric.user_id == owner_id, TrendMetric.resolution == 'hour'
+        ).scalar()
+        snapshots = db.session.query(
+            ChurnTrend.date, ChurnTrend.churn_rate, ChurnTrend.avg_churn_score, ChurnTrend.high_risk_customers
+        ).filter(ChurnTrend.user_id == owner_id)
+        if first is not None:
+            snapshots = snapshots.filter(ChurnTrend.date < first)
+        for date, churn_rate, avg_churn_score, high_risk_customers in snapshots.order_by(ChurnTrend.date).all():
+            record_metrics(owner_id, {
+                'churn_rate': churn_rate,
+                'avg_churn_score': avg_churn_score,
+                'high_risk_customers': high_risk_customers
+            }, at=date)
+            backfilled += 1
+    return backfilled
+
+def pick_resolution(start, retention_days, now=None):
+    """The finest resolution whose retention still covers `start`."""
+    if start is None:
+        return RESOLUTIONS[-1]
+    now = now or datetime.utcnow()
+    for resolution in RESOLUTIONS:
+        days = retention_days.get(resolution)
+        if not days or start >= now - timedelta(days=days):
+            return resolution
+    return RESOLUTIONS[-1]
+
+def _aggregate_column(aggregation):
+    if aggregation == 'avg':
+        return TrendMetric.value_sum / TrendMetric.samples
+    if aggregation == 'min':
+        return TrendMetric.value_min
+    if aggregation == 'max':
+        return TrendMetric.value_max
+    if aggregation == 'last':
+        return TrendMetric.value_last
+    raise ValueError(f'aggregation must be one of: {", ".join(AGGREGATIONS)}')
+
+def bucket_label(bucket, resolution):
+    """
+    A bucket's label in series responses: '%Y-%m-%d %H:00' for hours,
+    '%Y-%m-%d' otherwise, the format SQLite's date_bucket produces.
+    Strings (already labelled by SQLite) are returned as they are.
+    """
+    if not isinstance(bucket, datetime):
+        return str(bucket)
+    return bucket.strftime('%Y-%m-%d %H:00') if resolution == 'hour' else bucket.strftime('%Y-%m-%d')
+
+def query_metric_series(user_id, metrics, resolution, start=None, end=None, after=None,
+                        limit=DEFAULT_METRIC_LIMIT, aggregation='avg'):
+    """
+    Read pre-aggregated series for several metrics at one resolution.
+
+    Both queries are range scans of the primary key (resolution, user_id,
+    metric, bucket), so the cost grows with the number of buckets returned,
+    not with the number of samples behind them.
+
+    Args:
+        metrics (list of str): Metric names
+        resolution (str): 'hour', 'day' or 'week'
+        start, end (datetime): Bucket range, end exclusive
+        after (str): Cursor from a previous page
+        limit (int): Maximum buckets per page
+        aggregation (str): 'avg', 'min', 'max' or 'last' value per bucket
+
+    Returns:
+        dict: 'dates', one list per metric (None where a metric has no
+        bucket) and 'next_cursor'
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f'resolution must be one of: {", ".join(RESOLUTIONS)}')
+    value = _aggregate_column(aggregation)
+
+    conditions = [
+        TrendMetric.user_id == user_id,
+        TrendMetric.resolution == resolution,
+        TrendMetric.metric.in_(metrics)
+    ]
+    if start:
+        conditions.append(TrendMetric.bucket >= bucket_start(start, resolution))
+    if end:
+        conditions.append(TrendMetric.bucket < end)
+    if after:
+        try:
+            conditions.append(TrendMetric.bucket > datetime.fromisoformat(after))
+        except ValueError:
+            raise ValueError(f'Invalid cursor: {after}')
+
+    buckets = [row[0] for row in db.session.execute(
+        select(TrendMetric.bucket).where(*conditions).distinct().order_by(TrendMetric.bucket).limit(limit + 1)
+    )]
+    has_more = len(buckets) > limit
+    buckets = buckets[:limit]
+
+    result = {'dates': [bucket_label(bucket, resolution) for bucket in buckets]}
+    positions = {bucket: index for index, bucket in enumerate(buckets)}
+    series = {metric: [None] * len(buckets) for metric in metrics}
+    if buckets:
+        rows = db.session.execute(
+            select(TrendMetric.metric, TrendMetric.bucket, value)
+            .where(*conditions, TrendMetric.bucket <= buckets[-1])
+        )
+        for metric, bucket, metric_value in rows:
+            series[metric][positions[bucket]] = metric_value
+    result.update(series)
+    result['next_cursor'] = buckets[-1].isoformat() if has_more else None
+    return result
+
+def metrics_version(user_id, resolution):
+    """
+    (version token, last modified) of a user's buckets at one resolution,
+    read from the primary key range and updated_at only.
+    """
+    count, last_modified = db.session.query(
+        func.count(), func.max(TrendMetric.updated_at)
+    ).filter(TrendMetric.resolution == resolution, TrendMetric.user_id == user_id).one()
+    return (count, last_modified and last_modified.isoformat()), last_modified
+
+def list_metrics(user_id, resolution='week'):
+    """Names of the metrics recorded for a user."""
+    return [row[0] for row in db.session.execute(
+        select(TrendMetric.metric).where(
+            TrendMetric.user_id == user_id, TrendMetric.resolution == resolution
+        ).distinct().order_by(TrendMetric.metric)
+    )]
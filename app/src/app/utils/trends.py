@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from .. import db
+from ..models import Customer, ChurnTrend
+from .customer_snapshot import get_customer_snapshot
+from .aggregates import get_churn_stats
+from .trend_metrics import record_current_metrics
+from .ml_models import (analyze_segments, analyze_locations,
+                        predict_future_churn, analyze_key_factors, predict_factor_changes)
+
+def latest_trend_snapshot(user_id):
+    """Return the user's most recent ChurnTrend, or None."""
+    return ChurnTrend.query.filter_by(user_id=user_id).order_by(ChurnTrend.date.desc()).first()
+
+def is_snapshot_stale(snapshot, max_age_seconds):
+    """A missing snapshot, or one older than max_age_seconds, is stale."""
+    if snapshot is None:
+        return True
+    return datetime.utcnow() - snapshot.date > timedelta(seconds=max_age_seconds)
+
+def build_trend_snapshot(user_id):
+    """
+    Run the trend analyses over a user's customers and store a ChurnTrend.
+
+    Returns:
+        ChurnTrend or None: None when the user has no scored customers
+    """
+    # Unscored customers are left to the rescoring job; building a snapshot never scores
+    customers_with_scores = get_customer_snapshot(user_id).scored()
+    if not len(customers_with_scores):
+        return None
+
+    # Headline numbers come from the running aggregates
+    stats = get_churn_stats(user_id)
+    churn_trend = ChurnTrend(
+        user_id=user_id,
+        date=datetime.utcnow(),
+        churn_rate=stats['high_risk_customers'] / stats['scored_customers'] if stats['scored_customers'] else 0,
+        high_risk_customers=stats['high_risk_customers'],
+        avg_churn_score=stats['avg_churn_score'],
+        segment_analysis=analyze_segments(
+            customers_with_scores,
+            usage_thresholds=current_app.config['SEGMENT_USAGE_THRESHOLDS'],
+            subscription_thresholds=current_app.config['SEGMENT_SUBSCRIPTION_THRESHOLDS'],
+            extra_stats=True
+        ),
+        location_analysis=analyze_locations(customers_with_scores, extra_stats=True),
+        future_predictions=predict_future_churn(customers_with_scores),
+        factor_importance=analyze_key_factors(customers_with_scores),
+        factor_changes=predict_factor_changes(customers_with_scores)
+    )
+    db.session.add(churn_trend)
+    db.session.commit()
+    
+    # Scalar series are served from the TrendMetric rollups
+    record_current_metrics(user_id, at=churn_trend.date)
+    return churn_trend
+
+def refresh_stale_snapshots(max_age_seconds):
+    """
+    Rebuild the snapshot of every user with customers whose latest one is stale.
+
+    Returns:
+        int: Number of snapshots rebuilt
+    """
+    refreshed = 0
+    user_ids = [row[0] for row in db.session.query(Customer.user_id).distinct().all()]
+    for user_id in user_ids:
+        if is_snapshot_stale(latest_trend_snapshot(user_id), max_age_seconds):
+            if build_trend_snapshot(user_id) is not None:
+                refreshed += 1
+    return refreshed
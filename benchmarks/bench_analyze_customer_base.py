@@ -0,0 +1,131 @@
+"""
+Benchmark analyze_customer_base against the per-customer loop it replaced.
+
+Usage (from the repository root):
+    python benchmarks/bench_analyze_customer_base.py [--sizes 10000,100000,1000000]
+
+Both versions run on the same synthetic customers. The vectorized version is
+timed on a prebuilt CustomerSnapshot (as the /analysis page uses it) and on a
+list of objects, which includes building the snapshot.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.src.app.utils.churn_analysis import analyze_customer_base
+from app.src.app.utils.customer_snapshot import CustomerSnapshot
+
+def analyze_customer_base_loop(customers):
+    """The previous implementation: six Python passes with defaultdict counters."""
+    if not customers:
+        return None
+
+    total_customers = len(customers)
+    churn_rate = sum(1 for c in customers if c.churn_prediction) / total_customers
+    avg_monthly_bill = sum(c.monthly_bill for c in customers) / total_customers
+    avg_usage = sum(c.total_usage_gb for c in customers) / total_customers
+
+    segments = defaultdict(int)
+    for c in customers:
+        segments[c.customer_segment] += 1
+    segment_distribution = {k: v/total_customers for k, v in segments.items()}
+
+    location_analysis = defaultdict(lambda: {'total': 0, 'churn': 0})
+    for c in customers:
+        location_analysis[c.location]['total'] += 1
+        if c.churn_prediction:
+            location_analysis[c.location]['churn'] += 1
+
+    age_groups = defaultdict(lambda: {'total': 0, 'churn': 0})
+    for c in customers:
+        age_group = (c.age // 10) * 10
+        age_groups[f"{age_group}-{age_group+9}"]['total'] += 1
+        if c.churn_prediction:
+            age_groups[f"{age_group}-{age_group+9}"]['churn'] += 1
+
+    gender_analysis = defaultdict(lambda: {'total': 0, 'churn': 0})
+    for c in customers:
+        gender_analysis[c.gender]['total'] += 1
+        if c.churn_prediction:
+            gender_analysis[c.gender]['churn'] += 1
+
+    sub_length_groups = defaultdict(lambda: {'total': 0, 'churn': 0})
+    for c in customers:
+        group = (c.subscription_length_months // 6) * 6
+        sub_length_groups[f"{group}-{group+5} months"]['total'] += 1
+        if c.churn_prediction:
+            sub_length_groups[f"{group}-{group+5} months"]['churn'] += 1
+
+    return {
+        'total_customers': total_customers,
+        'churn_rate': churn_rate,
+        'avg_monthly_bill': avg_monthly_bill,
+        'avg_usage': avg_usage,
+        'segment_distribution': segment_distribution,
+        'location_analysis': location_analysis,
+        'age_group_analysis': age_groups,
+        'gender_analysis': gender_analysis,
+        'subscription_length_analysis': sub_length_groups
+    }
+
+def make_customers(n, seed=0):
+    """Synthetic customers without NULLs, which the loop version cannot handle."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'age': rng.integers(18, 80, n),
+        'monthly_bill': rng.uniform(10, 150, n),
+        'total_usage_gb': rng.uniform(0, 500, n),
+        'subscription_length_months': rng.integers(0, 72, n),
+        'churn_score': rng.random(n),
+        'churn_prediction': rng.random(n) < 0.3,
+        'location': rng.choice(['New York', 'Chicago', 'Houston', 'Phoenix', 'Seattle'], n),
+        'gender': rng.choice(['Male', 'Female', 'Other'], n),
+        'customer_segment': rng.choice(['High-value', 'Medium-value', 'Low-value'], n)
+    })
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='Comma-separated customer counts (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best is reported')
+    args = parser.parse_args()
+
+    print(f"{'customers':>10} {'loop (s)':>10} {'snapshot (s)':>13} {'objects (s)':>12} {'speedup':>8}")
+    for n in [int(size) for size in args.sizes.split(',')]:
+        df = make_customers(n)
+        objects = [SimpleNamespace(**row) for row in df.to_dict('records')]
+        snapshot = CustomerSnapshot.from_frame(df)
+
+        loop_time, expected = timed(analyze_customer_base_loop, objects, repeat=args.repeat)
+        snapshot_time, result = timed(analyze_customer_base, snapshot, repeat=args.repeat)
+        objects_time, _ = timed(analyze_customer_base, objects, repeat=args.repeat)
+
+        assert result['total_customers'] == expected['total_customers']
+        assert np.isclose(result['churn_rate'], expected['churn_rate'])
+        for key in ('location_analysis', 'age_group_analysis', 'gender_analysis',
+                    'subscription_length_analysis'):
+            assert result[key] == dict(expected[key]), key
+
+        print(f"{n:>10} {loop_time:>10.3f} {snapshot_time:>13.4f} {objects_time:>12.3f} "
+              f"{loop_time / snapshot_time:>7.0f}x")
+
+if __name__ == '__main__':
+    main()
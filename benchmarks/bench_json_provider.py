@@ -0,0 +1,102 @@
+"""
+Benchmark the JSON providers on a trend series payload.
+
+Usage (from the repository root):
+    python benchmarks/bench_json_provider.py [--points 10000] [--repeat 5]
+
+The payload is shaped like an /api/trends page: dates, scalar series of
+NumPy floats and per-point segment/location JSON blobs. Each provider
+serializes it with app.json.response (as jsonify does), and the scalar
+series are also written as a streamed JSON array. orjson is skipped when
+it is not installed.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import Flask
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.src.app.utils.json_provider import StdlibJSONProvider, OrjsonProvider, iter_json_array, orjson
+
+SEGMENTS = ('High-value', 'Medium-value', 'Low-value')
+LOCATIONS = ('New York', 'Chicago', 'Houston', 'Phoenix', 'Seattle')
+
+def make_series(points, seed=0):
+    """A trend series page with `points` points, values as NumPy scalars."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    churn_rates = rng.random(points)
+    scores = rng.random(points)
+    high_risk = rng.integers(0, 1000, points)
+    return {
+        'dates': [start + timedelta(hours=i) for i in range(points)],
+        'churn_rates': list(churn_rates),
+        'avg_churn_scores': scores,
+        'high_risk_customers': list(high_risk),
+        'segment_trends': [
+            {segment: {'count': rng.integers(0, 500), 'mean': rng.random(), 'p90': rng.random()}
+             for segment in SEGMENTS}
+            for _ in range(points)
+        ],
+        'location_trends': [
+            {location: {'count': rng.integers(0, 500), 'mean': rng.random()} for location in LOCATIONS}
+            for _ in range(points)
+        ],
+        'next_cursor': None
+    }
+
+def make_points(series):
+    """The scalar part of the series as one dict per point, for streaming."""
+    return [
+        {'date': date, 'churn_rate': rate, 'avg_churn_score': score, 'high_risk_customers': high_risk}
+        for date, rate, score, high_risk in zip(series['dates'], series['churn_rates'],
+                                                series['avg_churn_scores'], series['high_risk_customers'])
+    ]
+
+def timed(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=10000, help='Points in the series (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the best is reported')
+    args = parser.parse_args()
+
+    series = make_series(args.points)
+    points = make_points(series)
+    providers = [StdlibJSONProvider]
+    if orjson is not None:
+        providers.append(OrjsonProvider)
+    else:
+        print('orjson is not installed; only the json module is measured')
+
+    print(f"{'provider':>10} {'response (ms)':>14} {'stream (ms)':>12} {'bytes':>10}")
+    baseline = None
+    for provider_class in providers:
+        app = Flask(__name__)
+        app.json = provider_class(app)
+        with app.app_context():
+            response_time, response = timed(lambda: app.json.response(series), args.repeat)
+            stream_time, _ = timed(lambda: b''.join(iter_json_array(points)), args.repeat)
+            body = response.get_data()
+            decoded = app.json.loads(body)
+        assert len(decoded['dates']) == args.points
+        assert np.isclose(decoded['churn_rates'][-1], series['churn_rates'][-1])
+
+        baseline = baseline or response_time
+        print(f"{provider_class.name:>10} {response_time * 1000:>14.1f} {stream_time * 1000:>12.1f} "
+              f"{len(body):>10} ({baseline / response_time:.1f}x)")
+
+if __name__ == '__main__':
+    main()
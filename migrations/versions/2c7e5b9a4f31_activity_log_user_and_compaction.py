@@ -0,0 +1,47 @@
+"""Activity log user_id, event_count and nullable customer_id
+
+Revision ID: 2c7e5b9a4f31
+Revises: 9d3f6a2b7c15
+Create Date: 2026-10-18 18:12:55.604391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7e5b9a4f31'
+down_revision = '9d3f6a2b7c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('customer_activity', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('event_count', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.alter_column('customer_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.create_foreign_key('fk_customer_activity_user_id', 'user', ['user_id'], ['id'])
+
+    # Backfill the owner from the customer
+    op.execute("""
+        UPDATE customer_activity
+        SET user_id = (SELECT customer.user_id FROM customer WHERE customer.id = customer_activity.customer_id)
+        WHERE user_id IS NULL
+    """)
+
+    op.create_index('ix_customer_activity_user_timestamp', 'customer_activity', ['user_id', 'timestamp'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_customer_activity_user_timestamp', table_name='customer_activity')
+
+    # Events of deleted customers cannot satisfy NOT NULL customer_id
+    op.execute("DELETE FROM customer_activity WHERE customer_id IS NULL")
+
+    with op.batch_alter_table('customer_activity', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_customer_activity_user_id', type_='foreignkey')
+        batch_op.alter_column('customer_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('event_count')
+        batch_op.drop_column('user_id')
@@ -0,0 +1,26 @@
+"""Add customer model version
+
+Revision ID: 3f9a2c7d41e8
+Revises: 81cdf5722fa1
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2c7d41e8'
+down_revision = '81cdf5722fa1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_version', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.drop_column('model_version')
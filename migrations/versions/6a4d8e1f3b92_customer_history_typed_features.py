@@ -0,0 +1,40 @@
+"""Typed feature columns and customer/date index on customer_history
+
+Revision ID: 6a4d8e1f3b92
+Revises: 2c7e5b9a4f31
+Create Date: 2026-10-18 19:26:41.083517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a4d8e1f3b92'
+down_revision = '2c7e5b9a4f31'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ('age', sa.Integer()),
+    ('gender', sa.String(length=10)),
+    ('location', sa.String(length=100)),
+    ('subscription_length_months', sa.Integer()),
+    ('monthly_bill', sa.Float()),
+    ('total_usage_gb', sa.Float()),
+]
+
+
+def upgrade():
+    with op.batch_alter_table('customer_history', schema=None) as batch_op:
+        for name, type_ in COLUMNS:
+            batch_op.add_column(sa.Column(name, type_, nullable=True))
+    op.create_index('ix_customer_history_customer_created_at', 'customer_history',
+                    ['customer_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_customer_history_customer_created_at', table_name='customer_history')
+    with op.batch_alter_table('customer_history', schema=None) as batch_op:
+        for name, type_ in reversed(COLUMNS):
+            batch_op.drop_column(name)
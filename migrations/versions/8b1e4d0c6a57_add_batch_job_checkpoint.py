@@ -0,0 +1,26 @@
+"""Add batch job checkpoint
+
+Revision ID: 8b1e4d0c6a57
+Revises: 3f9a2c7d41e8
+Create Date: 2026-10-18 10:03:17.492815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e4d0c6a57'
+down_revision = '3f9a2c7d41e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('batch_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('checkpoint_offset', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('batch_job', schema=None) as batch_op:
+        batch_op.drop_column('checkpoint_offset')
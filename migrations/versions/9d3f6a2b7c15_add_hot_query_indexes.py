@@ -0,0 +1,62 @@
+"""Add hot query indexes, make customer_id unique per user
+
+Revision ID: 9d3f6a2b7c15
+Revises: e4a81f6b92d0
+Create Date: 2026-10-18 16:41:09.274113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6a2b7c15'
+down_revision = 'e4a81f6b92d0'
+branch_labels = None
+depends_on = None
+
+# Gives the unnamed UNIQUE(customer_id) of the initial schema a name batch mode can drop
+naming_convention = {
+    'uq': 'uq_%(table_name)s_%(column_0_name)s',
+}
+
+INDEXES = [
+    ('customer', 'ix_customer_user_id', ['user_id', 'id']),
+    ('customer', 'ix_customer_user_churn_score', ['user_id', 'churn_score']),
+    ('customer', 'ix_customer_user_location', ['user_id', 'location']),
+    ('customer', 'ix_customer_user_updated_at', ['user_id', 'updated_at']),
+    ('customer_activity', 'ix_customer_activity_timestamp', ['timestamp']),
+    ('customer_activity', 'ix_customer_activity_customer_timestamp', ['customer_id', 'timestamp']),
+    ('churn_trend', 'ix_churn_trend_user_date', ['user_id', 'date']),
+    ('churn_prediction', 'ix_churn_prediction_user_date', ['user_id', 'prediction_date']),
+    ('batch_job', 'ix_batch_job_user_created_at', ['user_id', 'created_at']),
+]
+
+
+def _global_customer_id_unique():
+    inspector = sa.inspect(op.get_bind())
+    for constraint in inspector.get_unique_constraints('customer'):
+        if constraint['column_names'] == ['customer_id']:
+            return constraint['name'] or 'uq_customer_customer_id'
+    return None
+
+
+def upgrade():
+    global_unique = _global_customer_id_unique()
+    with op.batch_alter_table('customer', naming_convention=naming_convention) as batch_op:
+        if global_unique:
+            batch_op.drop_constraint(global_unique, type_='unique')
+        batch_op.create_unique_constraint('uq_customer_user_customer_id', ['user_id', 'customer_id'])
+
+    for table, name, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+
+    # Fails if two users now share a customer_id
+    with op.batch_alter_table('customer', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('uq_customer_user_customer_id', type_='unique')
+        batch_op.create_unique_constraint('uq_customer_customer_id', ['customer_id'])
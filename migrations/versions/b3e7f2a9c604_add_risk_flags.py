@@ -0,0 +1,28 @@
+"""Add risk_flags bitmask to customer and customer_history
+
+Revision ID: b3e7f2a9c604
+Revises: 6a4d8e1f3b92
+Create Date: 2026-10-18 20:03:17.552918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e7f2a9c604'
+down_revision = '6a4d8e1f3b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('customer', 'customer_history'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('risk_flags', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    for table in ('customer_history', 'customer'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('risk_flags')
@@ -0,0 +1,36 @@
+"""Add batch job progress
+
+Revision ID: c5d27e9f0b13
+Revises: 8b1e4d0c6a57
+Create Date: 2026-10-18 10:41:52.306714
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d27e9f0b13'
+down_revision = '8b1e4d0c6a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('batch_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('started_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('rows_total', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('rows_processed', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('rows_failed', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('rows_per_sec', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('progress_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('batch_job', schema=None) as batch_op:
+        batch_op.drop_column('progress_updated_at')
+        batch_op.drop_column('rows_per_sec')
+        batch_op.drop_column('rows_failed')
+        batch_op.drop_column('rows_processed')
+        batch_op.drop_column('rows_total')
+        batch_op.drop_column('started_at')
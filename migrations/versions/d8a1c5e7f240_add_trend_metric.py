@@ -0,0 +1,37 @@
+"""Add trend_metric time-series table
+
+Revision ID: d8a1c5e7f240
+Revises: b3e7f2a9c604
+Create Date: 2026-10-18 20:48:36.119204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a1c5e7f240'
+down_revision = 'b3e7f2a9c604'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trend_metric',
+    sa.Column('resolution', sa.String(length=10), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=150), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('samples', sa.Integer(), nullable=False),
+    sa.Column('value_sum', sa.Float(), nullable=False),
+    sa.Column('value_min', sa.Float(), nullable=True),
+    sa.Column('value_max', sa.Float(), nullable=True),
+    sa.Column('value_last', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('resolution', 'user_id', 'metric', 'bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('trend_metric')
@@ -0,0 +1,54 @@
+"""Add customer aggregate
+
+Revision ID: e4a81f6b92d0
+Revises: c5d27e9f0b13
+Create Date: 2026-10-18 14:02:37.518240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a81f6b92d0'
+down_revision = 'c5d27e9f0b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('customer_aggregate',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('dimension', sa.String(length=20), nullable=False),
+    sa.Column('group_key', sa.String(length=100), nullable=False),
+    sa.Column('customers', sa.Integer(), nullable=False),
+    sa.Column('scored', sa.Integer(), nullable=False),
+    sa.Column('score_sum', sa.Float(), nullable=False),
+    sa.Column('high_risk', sa.Integer(), nullable=False),
+    sa.Column('medium_risk', sa.Integer(), nullable=False),
+    sa.Column('churned', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'dimension', 'group_key')
+    )
+
+    # Backfill from the existing customers
+    for dimension, group_column in (('total', "''"),
+                                    ('segment', "COALESCE(customer_segment, '')"),
+                                    ('location', "COALESCE(location, '')")):
+        op.execute(f"""
+            INSERT INTO customer_aggregate (user_id, dimension, group_key, customers, scored, score_sum,
+                                            high_risk, medium_risk, churned, updated_at)
+            SELECT user_id, '{dimension}', {group_column}, COUNT(id), COUNT(churn_score),
+                   COALESCE(SUM(churn_score), 0),
+                   SUM(CASE WHEN churn_score > 0.7 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN churn_score > 0.4 AND churn_score <= 0.7 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN churn_prediction THEN 1 ELSE 0 END),
+                   CURRENT_TIMESTAMP
+            FROM customer
+            GROUP BY user_id, {group_column}
+        """)
+
+
+def downgrade():
+    op.drop_table('customer_aggregate')